@@ -0,0 +1,145 @@
+"""
+Two-tier bytes cache: an in-process LRU bounded by total size in front of Redis.
+
+Redis is optional. If it is not reachable the cache keeps working with the local tier only
+and retries the connection after REDIS_RETRY_SECONDS. Every cache counts its lookups by the tier that
+answered them, stats() reports the hit rate.
+"""
+from __future__ import annotations
+
+import os
+import time
+import logging
+from collections import OrderedDict
+
+from redis.asyncio import Redis
+
+REDIS_RETRY_SECONDS = 30
+
+_redis: Redis | None = None
+_redis_down_until = 0.0
+
+
+def getRedis() -> Redis | None:
+    global _redis
+    if time.monotonic() < _redis_down_until:
+        return None
+
+    if _redis is None:
+        _redis = Redis.from_url(
+            os.getenv("REDIS_URL") or "redis://redis",
+            socket_connect_timeout=0.5,
+            socket_timeout=0.5
+        )
+
+    return _redis
+
+
+def _markRedisDown(e: Exception):
+    global _redis_down_until
+    logging.warning(f"Redis is unavailable, using the local cache only for {REDIS_RETRY_SECONDS}s: {e}")
+    _redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+
+class LRUBytesCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items: OrderedDict[str, bytes] = OrderedDict()
+
+    def get(self, key: str) -> bytes | None:
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+
+        self.delete(key)
+        self._items[key] = value
+        self.size += len(value)
+
+        while self.size > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self.size -= len(evicted)
+
+    def delete(self, key: str):
+        value = self._items.pop(key, None)
+        if value is not None:
+            self.size -= len(value)
+
+
+class TieredCache:
+    def __init__(self, namespace: str, max_bytes: int, ttl: int):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local = LRUBytesCache(max_bytes)
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _redisKey(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key: str) -> bytes | None:
+        value = self.local.get(key)
+        if value is not None:
+            self.local_hits += 1
+            return value
+
+        redis = getRedis()
+        if redis is None:
+            self.misses += 1
+            return None
+
+        try:
+            value = await redis.get(self._redisKey(key))
+        except Exception as e:
+            _markRedisDown(e)
+            self.misses += 1
+            return None
+
+        if value is not None:
+            self.redis_hits += 1
+            self.local.set(key, value)
+        else:
+            self.misses += 1
+        return value
+
+    async def set(self, key: str, value: bytes):
+        self.local.set(key, value)
+
+        redis = getRedis()
+        if redis is None:
+            return
+
+        try:
+            await redis.set(self._redisKey(key), value, ex=self.ttl)
+        except Exception as e:
+            _markRedisDown(e)
+
+    async def delete(self, key: str):
+        self.local.delete(key)
+
+        redis = getRedis()
+        if redis is None:
+            return
+
+        try:
+            await redis.delete(self._redisKey(key))
+        except Exception as e:
+            _markRedisDown(e)
+
+    def stats(self) -> dict:
+        lookups = self.local_hits + self.redis_hits + self.misses
+        return {
+            "lookups": lookups,
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.local_hits + self.redis_hits) / lookups, 4) if lookups else None,
+            "local_items": len(self.local._items),
+            "local_bytes": self.local.size,
+        }
@@ -0,0 +1,4 @@
+from .specs import LineChart, BarChart, Pie, PieGrid, ChartSpec, renderPng
+from .pool import render, start, stop
+
+__all__ = ["LineChart", "BarChart", "Pie", "PieGrid", "ChartSpec", "renderPng", "render", "start", "stop"]
@@ -0,0 +1,76 @@
+"""
+Chart responses cached by (user, chart, data version).
+
+The ETag is derived from the key alone, so a matching If-None-Match is answered with 304
+before the cache or the marks are even touched.
+"""
+from __future__ import annotations
+
+import os
+import hashlib
+from uuid import UUID
+from typing import Awaitable, Callable
+
+from fastapi import Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..cache import TieredCache
+from ..db import versions
+
+# bump when the look of the charts changes so clients do not keep stale images
+CHARTS_REVISION = 1
+
+chart_cache = TieredCache(
+    namespace="chart",
+    max_bytes=int(os.getenv("CHART_CACHE_MB") or 64) * 1024 * 1024,
+    ttl=int(os.getenv("CHART_CACHE_TTL") or 24 * 60 * 60)
+)
+
+
+def chartKey(user_uuid: UUID, chart: str, version: int) -> str:
+    return f"{CHARTS_REVISION}:{user_uuid}:{chart}:{version}"
+
+
+def etagFor(key: str) -> str:
+    return '"' + hashlib.sha1(key.encode()).hexdigest()[:20] + '"'
+
+
+def _etagMatches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
+async def cachedUserChart(
+    request: Request,
+    session: AsyncSession,
+    chart: str,
+    user_uuid: UUID | None,
+    chat_id: int | None,
+    render: Callable[[], Awaitable[Response]]
+) -> Response:
+    """serves a user's chart from the cache, calls render() on a miss. Only 200 responses are cached"""
+    resolved = await versions.getUserVersion(session, user_uuid=user_uuid, chat_id=chat_id)
+    if resolved is None:
+        return await render()
+
+    resolved_uuid, version = resolved
+    key = chartKey(resolved_uuid, chart, version)
+    etag = etagFor(key)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if _etagMatches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    png = await chart_cache.get(key)
+    if png is None:
+        response = await render()
+        if response.status_code != 200:
+            return response
+
+        png = response.body
+        await chart_cache.set(key, png)
+
+    return Response(content=png, media_type="image/png", headers=headers)
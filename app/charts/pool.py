@@ -0,0 +1,72 @@
+"""
+Process pool that turns chart specs into PNG bytes away from the event loop.
+
+Size is taken from CHART_WORKERS (default 2). At most CHART_WORKERS * CHART_QUEUE_FACTOR renders
+are in flight at once, the rest of the callers wait on a semaphore instead of piling up in the pool.
+
+The pool is only started by the api lifespan, never lazily from a request, and its workers come from a forkserver:
+forking this process once it runs threads (db, http or redis clients) could leave a worker with a copy of a lock
+nobody will release. Until it is started, and after it is stopped, charts are rendered in a thread of this process.
+"""
+from __future__ import annotations
+
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from .specs import ChartSpec, renderPng
+
+_executor: ProcessPoolExecutor | None = None
+_slots: asyncio.Semaphore | None = None
+
+
+def _initWorker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def workersCount() -> int:
+    return max(int(os.getenv("CHART_WORKERS") or 2), 1)
+
+
+def start():
+    global _executor, _slots
+    if _executor is not None:
+        return
+
+    workers = workersCount()
+    # the executor only creates its workers on the first renders, when the db, redis and http clients already
+    # run threads in this process, and forking it then could leave a worker with a copy of a lock nobody will
+    # release. Workers are forked from a forkserver instead, a fresh interpreter (fork + exec) that imports the
+    # main module and the chart code once, so they are not imported again by every worker the way spawn would
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["__main__", "app.charts.specs"])
+
+    _executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_initWorker
+    )
+    _slots = asyncio.Semaphore(workers * int(os.getenv("CHART_QUEUE_FACTOR") or 4))
+    logging.info(f"Chart rendering pool started with {workers} workers")
+
+
+def stop():
+    global _executor, _slots
+    if _executor is None:
+        return
+
+    _executor.shutdown(wait=True, cancel_futures=True)
+    _executor = None
+    _slots = None
+
+
+async def render(spec: ChartSpec) -> bytes:
+    """renders the spec in the pool and returns PNG bytes, in a thread when the pool is not started"""
+    if _executor is None:
+        return await asyncio.to_thread(renderPng, spec)
+
+    async with _slots:
+        return await asyncio.get_running_loop().run_in_executor(_executor, renderPng, spec)
@@ -0,0 +1,123 @@
+"""
+Chart specs: plain picklable descriptions of what to draw.
+
+Handlers build a spec and hand it to charts.render(), the actual drawing happens in a worker process.
+Only the object-oriented Figure API is used here, never pyplot, so renders do not share any global state.
+"""
+from __future__ import annotations
+
+import datetime
+import math
+from dataclasses import dataclass, field
+from io import BytesIO
+
+import numpy as np
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+
+
+@dataclass
+class LineChart:
+    title: str
+    xlabel: str
+    ylabel: str
+    # label -> (x, y), x are the first days of months
+    series: dict[str, tuple[list[datetime.datetime], list[float]]]
+
+    def draw(self) -> Figure:
+        fig = Figure(figsize=(10, 6))
+        ax = fig.subplots()
+
+        for label, (x, y) in self.series.items():
+            ax.plot(x, y, marker='o', label=label)
+
+        ax.set_xlabel(self.xlabel)
+        ax.set_ylabel(self.ylabel)
+        ax.set_title(self.title)
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m"))
+        ax.xaxis.set_major_locator(mdates.MonthLocator(interval=1))
+        ax.tick_params(axis='x', labelrotation=45)
+        ax.legend(loc='center left', bbox_to_anchor=(1, 0.5))
+        ax.grid(True)
+        fig.tight_layout()
+
+        return fig
+
+
+@dataclass
+class BarChart:
+    title: str
+    ylabel: str
+    labels: list[str]
+    values: list[float]
+    ylim: tuple[float, float] | None = None
+
+    def draw(self) -> Figure:
+        fig = Figure(figsize=(10, 6))
+        ax = fig.subplots()
+
+        bars = ax.bar(self.labels, self.values)
+        ax.set_ylabel(self.ylabel)
+        ax.set_title(self.title)
+        if self.ylim:
+            ax.set_ylim(*self.ylim)
+        ax.tick_params(axis='x', labelrotation=45)
+        ax.grid(axis='y')
+
+        for bar, value in zip(bars, self.values):
+            ax.text(bar.get_x() + bar.get_width() / 2, bar.get_height() + 0.1, f"{value:.1f}", ha='center', va='bottom')
+
+        fig.tight_layout()
+
+        return fig
+
+
+@dataclass
+class Pie:
+    title: str
+    # label -> value, empty means "no data"
+    slices: dict[str, int]
+    caption: str | None = None
+
+
+@dataclass
+class PieGrid:
+    pies: list[Pie] = field(default_factory=list)
+    columns: int = 2
+
+    def draw(self) -> Figure:
+        rows = max(math.ceil(len(self.pies) / self.columns), 1)
+        fig = Figure(figsize=(6 * self.columns, 6 * rows))
+        axs = np.atleast_1d(fig.subplots(nrows=rows, ncols=self.columns)).flatten()
+
+        for ax, pie in zip(axs, self.pies):
+            if pie.slices:
+                ax.pie(
+                    pie.slices.values(),
+                    labels=pie.slices.keys(),
+                    autopct="%1.1f%%",
+                    labeldistance=1.1
+                )
+                ax.set_title(pie.title)
+
+                if pie.caption:
+                    ax.text(0, -1.3, pie.caption, ha='center', va='center', fontsize=10)
+            else:
+                ax.axis('off')
+                ax.set_title(f"{pie.title} — нет данных")
+
+        for ax in axs[len(self.pies):]:
+            ax.axis('off')
+
+        fig.tight_layout()
+
+        return fig
+
+
+ChartSpec = LineChart | BarChart | PieGrid
+
+
+def renderPng(spec: ChartSpec) -> bytes:
+    buf = BytesIO()
+    spec.draw().savefig(buf, format="png")
+    return buf.getvalue()
@@ -1,4 +1,4 @@
-from sqlalchemy import Table, Column, ForeignKey
+from sqlalchemy import Table, Column, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import UUID
 
 from ..engine import Base, engine, getSession
@@ -6,7 +6,9 @@ user_class_table = Table(
     "user_class",
     Base.metadata,
     Column("user_uuid", UUID(as_uuid=True), ForeignKey("users.uuid"), primary_key=True),
-    Column("class_uuid", UUID(as_uuid=True), ForeignKey("classes.uuid"), primary_key=True)
+    Column("class_uuid", UUID(as_uuid=True), ForeignKey("classes.uuid"), primary_key=True),
+    # class and school predictions list the students of a class
+    Index("ix_user_class_class_uuid", "class_uuid"),
 )
 
 
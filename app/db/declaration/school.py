@@ -2,7 +2,7 @@ import os
 from uuid import uuid4
 from datetime import datetime
 
-from sqlalchemy import create_engine, Column, Integer, String, Uuid, ForeignKey, UUID, Float, DateTime, func
+from sqlalchemy import create_engine, Column, Integer, String, Uuid, ForeignKey, UUID, Float, DateTime, func, Index
 from sqlalchemy.orm import relationship
 
 from ..engine import Base
@@ -23,7 +23,7 @@ class Class(Base):
     start_year = Column(Integer)
     class_name = Column(String)
 
-    school_uuid = Column(UUID(as_uuid=True), ForeignKey('schools.uuid'))
+    school_uuid = Column(UUID(as_uuid=True), ForeignKey('schools.uuid'), index=True)
     school = relationship("School")
 
     users = relationship("User", secondary=user_class_table, back_populates="classes")
@@ -46,3 +46,61 @@ class UserClassMark(Base):
     user = relationship("User", back_populates="class_marks")
     user_class = relationship("Class", back_populates="user_marks")
 
+    __table_args__ = (
+        # every per-student read (marks, predictions, charts) filters by user and often orders by time
+        Index("ix_user_class_marks_user_uuid_created_at", "user_uuid", "created_at"),
+        # per-class aggregates filter by class and discipline
+        Index("ix_user_class_marks_class_uuid_discipline", "class_uuid", "discipline"),
+    )
+
+
+class ClassDisciplineStat(Base):
+    """class × discipline rollup of user_class_marks, kept up to date by db.rollup on every mark insert"""
+    __tablename__ = "class_discipline_stats"
+
+    class_uuid = Column(UUID(as_uuid=True), ForeignKey("classes.uuid"), primary_key=True)
+    discipline = Column(String, primary_key=True)
+    marks_count = Column(Integer, nullable=False, default=0)
+    marks_sum = Column(Float, nullable=False, default=0)
+    marks_sum_sq = Column(Float, nullable=False, default=0)
+
+
+class UserMonthlyStat(Base):
+    """user × discipline × month rollup of user_class_marks, kept up to date by db.rollup on every mark insert"""
+    __tablename__ = "user_monthly_stats"
+
+    user_uuid = Column(UUID(as_uuid=True), ForeignKey("users.uuid"), primary_key=True)
+    discipline = Column(String, primary_key=True)
+    year = Column(Integer, primary_key=True)
+    month = Column(Integer, primary_key=True)
+    marks_count = Column(Integer, nullable=False, default=0)
+    marks_sum = Column(Float, nullable=False, default=0)
+
+
+class StudentFeature(Base):
+    """
+    user × discipline running sums of user_class_marks the success model reads (prediction.features.MARK_FIELDS),
+    kept up to date by db.rollup on every mark insert
+    """
+    __tablename__ = "student_features"
+
+    user_uuid = Column(UUID(as_uuid=True), ForeignKey("users.uuid"), primary_key=True)
+    discipline = Column(String, primary_key=True)
+    marks_count = Column(Integer, nullable=False, default=0)
+    marks_sum = Column(Float, nullable=False, default=0)
+    marks_sum_sq = Column(Float, nullable=False, default=0)
+    bad_count = Column(Integer, nullable=False, default=0)
+    days_sum = Column(Float, nullable=False, default=0)
+    days_sum_sq = Column(Float, nullable=False, default=0)
+    days_marks_sum = Column(Float, nullable=False, default=0)
+    ewma_sum = Column(Float, nullable=False, default=0)
+    ewma_weight = Column(Float, nullable=False, default=0)
+
+
+class DataVersion(Base):
+    """monotonic counter per user/class that is bumped whenever their marks change. Used as a cache key"""
+    __tablename__ = "data_versions"
+
+    scope = Column(String, primary_key=True)  # "user" or "class"
+    uuid = Column(UUID(as_uuid=True), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -22,7 +22,7 @@ class User(Base):
     __tablename__ = 'users'
 
     uuid = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
-    chat_id = Column(Integer)
+    chat_id = Column(Integer, unique=True, index=True)  # NULLs (users without telegram) do not collide
     role = Column(Enum(Roles))
     name = Column(String)
 
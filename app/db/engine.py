@@ -1,8 +1,9 @@
 import os
+import logging
 from typing import Annotated
 
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker, AsyncAttrs
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, select, update, func
 from sqlalchemy.orm import declarative_base, sessionmaker, Session
 from fastapi import Depends, FastAPI, HTTPException, Query
 
@@ -30,4 +31,53 @@ async def init_models():
         # await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
 
+    async with engine.begin() as conn:
+        await dedupeChatIds(conn)
+
+    # create_all skips tables that already exist together with their indexes, so add the new ones by hand
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                async with engine.begin() as conn:
+                    await conn.run_sync(index.create, checkfirst=True)
+            except Exception as e:
+                # queries rely on unique indexes (ON CONFLICT), running without one only fails later on every call
+                if index.unique:
+                    raise RuntimeError(f"Could not create unique index {index.name}: {e}") from e
+                logging.error(f"Could not create index {index.name}: {e}")
+
+async def dedupeChatIds(conn):
+    """
+    databases created before users.chat_id became unique can hold several users per chat: the one with the most
+    marks keeps the chat_id, the others are detached from it (their data stays) so the unique index can be built
+    """
+    from .declaration.user import User
+    from .declaration.school import UserClassMark
+
+    duplicated = (
+        select(User.chat_id)
+        .where(User.chat_id.is_not(None))
+        .group_by(User.chat_id)
+        .having(func.count() > 1)
+    )
+    marks = (
+        select(UserClassMark.user_uuid, func.count().label("marks"))
+        .group_by(UserClassMark.user_uuid)
+        .subquery()
+    )
+    rows = (await conn.execute(
+        select(User.uuid, User.chat_id, func.coalesce(marks.c.marks, 0))
+        .outerjoin(marks, marks.c.user_uuid == User.uuid)
+        .where(User.chat_id.in_(duplicated))
+    )).all()
+
+    by_chat = {}
+    for user_uuid, chat_id, marks_count in rows:
+        by_chat.setdefault(chat_id, []).append((-marks_count, str(user_uuid), user_uuid))
+
+    for chat_id, users in by_chat.items():
+        detached = [user_uuid for _, _, user_uuid in sorted(users)[1:]]
+        await conn.execute(update(User).where(User.uuid.in_(detached)).values(chat_id=None))
+        logging.warning(f"chat_id {chat_id} belonged to {len(users)} users, detached {', '.join(map(str, detached))}")
+
 # SessionDep = Annotated[Session, Depends(getSession)]
\ No newline at end of file
@@ -0,0 +1,224 @@
+"""
+Statements on the hot paths, shared by the routers and scripts/check_query_plans.py.
+
+Keep the routers building these through the functions below: the plan check only guards
+what is listed in hotStatements().
+"""
+from __future__ import annotations
+
+from uuid import UUID, uuid4
+from typing import Iterable
+
+from sqlalchemy import select, or_, func, Select
+
+from .declaration import user_class_table
+from .declaration.user import User
+from .declaration.school import Class, UserClassMark, UserMonthlyStat, StudentFeature
+from .schemas.user import Roles
+
+ABSENCE_DISCIPLINES = (
+    "Пропуск по уважительной причине",
+    "Пропуск без уважительной причины",
+    "Пропуск по болезни",
+)
+
+# uuids accepted by one /batch lookup and the largest predictions page, keeps the IN list and the query string
+# reasonable
+MAX_BATCH_SIZE = 500
+
+
+def forUser(stmt: Select, user_uuid_column, user_uuid: UUID | None, chat_id: int | None) -> Select:
+    """
+    Restricts stmt to the student identified by user_uuid or chat_id (either matches, as everywhere in the api).
+    users is only joined when chat_id is given, otherwise the index on user_uuid_column is enough.
+    """
+    if chat_id:
+        filters = [User.chat_id == chat_id]
+        if user_uuid:
+            filters.append(User.uuid == user_uuid)
+        return stmt.join(User, User.uuid == user_uuid_column).where(or_(*filters))
+
+    return stmt.where(user_uuid_column == user_uuid)
+
+
+def userMarks(
+    *columns,
+    user_uuid: UUID | None = None,
+    chat_id: int | None = None,
+    disciplines: Iterable[str] | None = None,
+    excluded_disciplines: Iterable[str] | None = None
+) -> Select:
+    """raw marks of a student"""
+    stmt = forUser(select(*columns), UserClassMark.user_uuid, user_uuid, chat_id)
+
+    if disciplines is not None:
+        stmt = stmt.where(UserClassMark.discipline.in_(disciplines))
+    if excluded_disciplines is not None:
+        stmt = stmt.where(UserClassMark.discipline.notin_(excluded_disciplines))
+
+    return stmt
+
+
+def userMonthlyStats(
+    *columns,
+    user_uuid: UUID | None = None,
+    chat_id: int | None = None,
+    disciplines: Iterable[str] | None = None,
+    excluded_disciplines: Iterable[str] | None = None
+) -> Select:
+    """monthly rollup rows of a student, a few dozen rows instead of the whole history"""
+    stmt = forUser(select(*columns), UserMonthlyStat.user_uuid, user_uuid, chat_id)
+
+    if disciplines is not None:
+        stmt = stmt.where(UserMonthlyStat.discipline.in_(disciplines))
+    if excluded_disciplines is not None:
+        stmt = stmt.where(UserMonthlyStat.discipline.notin_(excluded_disciplines))
+
+    return stmt.order_by(UserMonthlyStat.discipline, UserMonthlyStat.year, UserMonthlyStat.month)
+
+
+def monthlyPoints(
+    *,
+    user_uuid: UUID | None = None,
+    chat_id: int | None = None,
+    disciplines: Iterable[str] | None = None,
+    excluded_disciplines: Iterable[str] | None = None
+) -> Select:
+    """
+    (discipline, year, month, marks_count, average, cumulative_average) rows of a student, ordered chronologically
+    per discipline, read from the user_monthly_stats rollup. The running average is done by the database (window
+    functions, supported by both sqlite >= 3.25 and postgresql), so only the plotted points are transferred.
+    """
+    months = userMonthlyStats(
+        UserMonthlyStat.discipline,
+        UserMonthlyStat.year,
+        UserMonthlyStat.month,
+        UserMonthlyStat.marks_count,
+        UserMonthlyStat.marks_sum,
+        user_uuid=user_uuid, chat_id=chat_id, disciplines=disciplines, excluded_disciplines=excluded_disciplines
+    ).order_by(None).subquery()
+
+    window = dict(partition_by=months.c.discipline, order_by=(months.c.year, months.c.month))
+    return (
+        select(
+            months.c.discipline,
+            months.c.year,
+            months.c.month,
+            months.c.marks_count,
+            (months.c.marks_sum / months.c.marks_count).label("average"),
+            (
+                func.sum(months.c.marks_sum).over(**window) / func.sum(months.c.marks_count).over(**window)
+            ).label("cumulative_average")
+        )
+        .where(months.c.marks_count > 0)
+        .order_by(months.c.discipline, months.c.year, months.c.month)
+    )
+
+
+def subjectAverages(*, user_uuid: UUID | None = None, chat_id: int | None = None, excluded_disciplines=None) -> Select:
+    """(discipline, average) of a student over all time, from the feature store"""
+    return (
+        userFeatures(
+            StudentFeature.discipline,
+            (StudentFeature.marks_sum / StudentFeature.marks_count).label("average"),
+            user_uuid=user_uuid, chat_id=chat_id, excluded_disciplines=excluded_disciplines
+        )
+        .where(StudentFeature.marks_count > 0)
+        .order_by(StudentFeature.discipline)
+    )
+
+
+def featureColumns() -> list:
+    """the student_features columns in prediction.features.MARK_FIELDS order"""
+    from ..prediction.features import MARK_FIELDS
+
+    return [StudentFeature.__table__.c[field] for field in MARK_FIELDS]
+
+
+def userFeatures(
+    *columns,
+    user_uuid: UUID | None = None,
+    chat_id: int | None = None,
+    excluded_disciplines: Iterable[str] | None = None
+) -> Select:
+    """
+    feature store rows of a student, a row per discipline instead of the whole history;
+    (discipline, *MARK_FIELDS) when no columns are given
+    """
+    columns = columns or (StudentFeature.discipline, *featureColumns())
+    stmt = forUser(select(*columns), StudentFeature.user_uuid, user_uuid, chat_id)
+
+    if excluded_disciplines is not None:
+        stmt = stmt.where(StudentFeature.discipline.notin_(excluded_disciplines))
+
+    return stmt.order_by(StudentFeature.discipline)
+
+
+def scopeStudents(*, class_uuid: UUID | None = None, school_uuid: UUID | None = None) -> Select:
+    """(class_uuid, class_name, user_uuid, name) of every student of a class or a school"""
+    stmt = (
+        select(Class.uuid, Class.class_name, User.uuid, User.name)
+        .select_from(user_class_table)
+        .join(Class, Class.uuid == user_class_table.c.class_uuid)
+        .join(User, User.uuid == user_class_table.c.user_uuid)
+        .where(User.role == Roles.student)
+    )
+    if class_uuid is not None:
+        return stmt.where(user_class_table.c.class_uuid == class_uuid)
+    return stmt.where(Class.school_uuid == school_uuid)
+
+
+def scopeFeatures(*, class_uuid: UUID | None = None, school_uuid: UUID | None = None) -> Select:
+    """(user_uuid, discipline, *MARK_FIELDS) feature store rows of all the students of a class or a school"""
+    students = scopeStudents(class_uuid=class_uuid, school_uuid=school_uuid).with_only_columns(User.uuid)
+    return select(
+        StudentFeature.user_uuid, StudentFeature.discipline, *featureColumns()
+    ).where(StudentFeature.user_uuid.in_(students))
+
+
+def hotStatements() -> dict[str, Select]:
+    """every statement that must be served by an index, with placeholder parameters"""
+    from .declaration.school import ClassDisciplineStat
+    from . import versions
+
+    user_uuid = uuid4()
+    chat_id = 1
+
+    statements = {}
+    for by, params in {"uuid": {"user_uuid": user_uuid}, "chat_id": {"chat_id": chat_id}}.items():
+        statements[f"marks by {by}"] = userMarks(UserClassMark, **params)
+        statements[f"mark values by {by}"] = userMarks(UserClassMark.mark, **params)
+        statements[f"absences by {by}"] = userMarks(
+            UserClassMark.discipline, UserClassMark.mark, UserClassMark.created_at,
+            disciplines=ABSENCE_DISCIPLINES, **params
+        )
+        statements[f"academic marks by {by}"] = userMarks(
+            UserClassMark.discipline, UserClassMark.mark, UserClassMark.created_at,
+            excluded_disciplines=ABSENCE_DISCIPLINES, **params
+        )
+        statements[f"user version by {by}"] = versions.userVersionStmt(**params)
+        statements[f"monthly stats by {by}"] = userMonthlyStats(
+            UserMonthlyStat, excluded_disciplines=ABSENCE_DISCIPLINES, **params
+        )
+        statements[f"monthly points from rollup by {by}"] = monthlyPoints(
+            excluded_disciplines=ABSENCE_DISCIPLINES, **params
+        )
+        statements[f"monthly absence points by {by}"] = monthlyPoints(
+            disciplines=ABSENCE_DISCIPLINES, **params
+        )
+        statements[f"subject averages by {by}"] = subjectAverages(excluded_disciplines=ABSENCE_DISCIPLINES, **params)
+        statements[f"features by {by}"] = userFeatures(**params)
+
+    statements["user by chat_id"] = select(User).where(User.chat_id == chat_id)
+    statements["user by chat_id or uuid"] = select(User).where(or_(User.chat_id == chat_id, User.uuid == user_uuid))
+    statements["class discipline marks"] = select(UserClassMark.mark).where(
+        UserClassMark.class_uuid == uuid4(),
+        UserClassMark.discipline == "Математика"
+    )
+    for scope in ("class", "school"):
+        params = {f"{scope}_uuid": uuid4()}
+        statements[f"{scope} students"] = scopeStudents(**params)
+        statements[f"{scope} features"] = scopeFeatures(**params)
+    statements["class discipline stats"] = select(ClassDisciplineStat).where(ClassDisciplineStat.class_uuid == uuid4())
+
+    return statements
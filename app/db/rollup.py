@@ -0,0 +1,296 @@
+"""
+Rollup tables maintained next to user_class_marks.
+
+Every code path that inserts marks has to call applyMarks() inside the same transaction,
+otherwise the rollups drift from the raw data. If that ever happens run
+
+    python -m app.db.rollup
+
+to regenerate them from the raw marks. python -m app.db.rollup --check only compares the student_features
+table (the success model's running sums) with a recompute from the raw marks and exits with 1 on a mismatch.
+"""
+from __future__ import annotations
+
+import sys
+import asyncio
+import logging
+import argparse
+from collections import defaultdict
+from typing import Iterable, Mapping
+
+import numpy as np
+from sqlalchemy import select, delete, func, insert, extract, Table
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .declaration.school import UserClassMark, ClassDisciplineStat, UserMonthlyStat, StudentFeature
+from . import versions
+from ..prediction.features import MARK_FIELDS, markSums, groupedSums, daysOf
+
+# marks read at once by the student_features recompute
+RECOMPUTE_CHUNK = 50_000
+
+
+def dialectInsert(session: AsyncSession, table: Table):
+    """INSERT construct with ON CONFLICT support for the dialect the session is bound to"""
+    if session.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as _insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as _insert
+
+    return _insert(table)
+
+
+async def upsertIncrement(
+    session: AsyncSession,
+    table: Table,
+    rows: list[dict],
+    key_columns: list[str],
+    sum_columns: list[str]
+):
+    """inserts rows or adds their sum_columns to the already existing ones (one executemany)"""
+    if not rows:
+        return
+
+    stmt = dialectInsert(session, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={column: table.c[column] + stmt.excluded[column] for column in sum_columns}
+    )
+    await session.execute(stmt, rows)
+
+
+def markRow(mark: UserClassMark) -> dict:
+    """the mapping applyMarks() expects, for marks inserted through the ORM (after flush, so defaults are set)"""
+    return {
+        "user_uuid": mark.user_uuid,
+        "class_uuid": mark.class_uuid,
+        "discipline": mark.discipline,
+        "mark": mark.mark,
+        "created_at": mark.created_at
+    }
+
+
+def featureSums(marks: list[Mapping]) -> dict[tuple, np.ndarray]:
+    """(user_uuid, discipline) -> MARK_FIELDS sums of the marks"""
+    index = {}
+    group = np.array(
+        [index.setdefault((mark["user_uuid"], mark["discipline"]), len(index)) for mark in marks], dtype=np.intp
+    )
+    sums = groupedSums(group, len(index), markSums(
+        np.array([mark["mark"] for mark in marks], dtype=float),
+        daysOf([mark["created_at"] for mark in marks])
+    ))
+    return dict(zip(index, sums))
+
+
+def featureRow(user_uuid, discipline: str, sums: np.ndarray) -> dict:
+    row = {"user_uuid": user_uuid, "discipline": discipline, **dict(zip(MARK_FIELDS, sums.tolist()))}
+    row["marks_count"] = round(row["marks_count"])
+    row["bad_count"] = round(row["bad_count"])
+    return row
+
+
+async def applyMarks(session: AsyncSession, marks: Iterable[Mapping]):
+    """adds freshly inserted marks to the rollups and bumps the data versions. Does not commit"""
+    marks = list(marks)
+
+    class_stats = defaultdict(lambda: [0, 0.0, 0.0])
+    monthly_stats = defaultdict(lambda: [0, 0.0])
+    for mark in marks:
+        stat = class_stats[(mark["class_uuid"], mark["discipline"])]
+        stat[0] += 1
+        stat[1] += mark["mark"]
+        stat[2] += mark["mark"] ** 2
+
+        created_at = mark["created_at"]
+        stat = monthly_stats[(mark["user_uuid"], mark["discipline"], created_at.year, created_at.month)]
+        stat[0] += 1
+        stat[1] += mark["mark"]
+
+    await upsertIncrement(
+        session,
+        ClassDisciplineStat.__table__,
+        [
+            {
+                "class_uuid": class_uuid,
+                "discipline": discipline,
+                "marks_count": count,
+                "marks_sum": total,
+                "marks_sum_sq": total_sq
+            }
+            for (class_uuid, discipline), (count, total, total_sq) in class_stats.items()
+        ],
+        key_columns=["class_uuid", "discipline"],
+        sum_columns=["marks_count", "marks_sum", "marks_sum_sq"]
+    )
+
+    await upsertIncrement(
+        session,
+        UserMonthlyStat.__table__,
+        [
+            {
+                "user_uuid": user_uuid,
+                "discipline": discipline,
+                "year": year,
+                "month": month,
+                "marks_count": count,
+                "marks_sum": total
+            }
+            for (user_uuid, discipline, year, month), (count, total) in monthly_stats.items()
+        ],
+        key_columns=["user_uuid", "discipline", "year", "month"],
+        sum_columns=["marks_count", "marks_sum"]
+    )
+
+    await upsertIncrement(
+        session,
+        StudentFeature.__table__,
+        [
+            featureRow(user_uuid, discipline, sums) for (user_uuid, discipline), sums in featureSums(marks).items()
+        ],
+        key_columns=["user_uuid", "discipline"],
+        sum_columns=list(MARK_FIELDS)
+    )
+
+    await versions.bump(
+        session,
+        user_uuids=(mark["user_uuid"] for mark in marks),
+        class_uuids=(mark["class_uuid"] for mark in marks)
+    )
+
+
+async def rebuild(session: AsyncSession):
+    """regenerates all rollups from the raw marks. Does not commit"""
+    await session.execute(delete(ClassDisciplineStat))
+    await session.execute(
+        insert(ClassDisciplineStat).from_select(
+            ["class_uuid", "discipline", "marks_count", "marks_sum", "marks_sum_sq"],
+            select(
+                UserClassMark.class_uuid,
+                UserClassMark.discipline,
+                func.count(UserClassMark.mark),
+                func.sum(UserClassMark.mark),
+                func.sum(UserClassMark.mark * UserClassMark.mark)
+            )
+            .where(UserClassMark.class_uuid.isnot(None), UserClassMark.mark.isnot(None))
+            .group_by(UserClassMark.class_uuid, UserClassMark.discipline)
+        )
+    )
+
+    year = extract("year", UserClassMark.created_at)
+    month = extract("month", UserClassMark.created_at)
+    await session.execute(delete(UserMonthlyStat))
+    await session.execute(
+        insert(UserMonthlyStat).from_select(
+            ["user_uuid", "discipline", "year", "month", "marks_count", "marks_sum"],
+            select(
+                UserClassMark.user_uuid,
+                UserClassMark.discipline,
+                year,
+                month,
+                func.count(UserClassMark.mark),
+                func.sum(UserClassMark.mark)
+            )
+            .where(UserClassMark.user_uuid.isnot(None), UserClassMark.mark.isnot(None))
+            .group_by(UserClassMark.user_uuid, UserClassMark.discipline, year, month)
+        )
+    )
+
+    await rebuildFeatures(session)
+
+
+async def recomputeFeatures(session: AsyncSession) -> dict[tuple, np.ndarray]:
+    """student_features as they should be, from a full pass over the raw marks"""
+    stmt = (
+        select(UserClassMark.user_uuid, UserClassMark.discipline, UserClassMark.mark, UserClassMark.created_at)
+        .where(UserClassMark.user_uuid.isnot(None), UserClassMark.mark.isnot(None))
+        .execution_options(yield_per=RECOMPUTE_CHUNK)
+    )
+    totals = {}
+    result = await session.stream(stmt)
+    async for chunk in result.partitions():
+        marks = [
+            {"user_uuid": user_uuid, "discipline": discipline, "mark": mark, "created_at": created_at}
+            for user_uuid, discipline, mark, created_at in chunk
+        ]
+        for key, sums in featureSums(marks).items():
+            totals[key] = totals[key] + sums if key in totals else sums
+    return totals
+
+
+async def rebuildFeatures(session: AsyncSession):
+    """regenerates student_features from the raw marks. Does not commit"""
+    totals = await recomputeFeatures(session)
+    await session.execute(delete(StudentFeature))
+    rows = [featureRow(user_uuid, discipline, sums) for (user_uuid, discipline), sums in totals.items()]
+    for start in range(0, len(rows), RECOMPUTE_CHUNK):
+        await session.execute(insert(StudentFeature), rows[start:start + RECOMPUTE_CHUNK])
+
+
+async def checkFeatures(session: AsyncSession, rtol: float = 1e-9) -> list[str]:
+    """differences between student_features and a recompute from the raw marks, empty when they agree"""
+    columns = [StudentFeature.__table__.c[field] for field in MARK_FIELDS]
+    stored = {
+        (user_uuid, discipline): np.array(sums, dtype=float)
+        for user_uuid, discipline, *sums in (
+            await session.execute(select(StudentFeature.user_uuid, StudentFeature.discipline, *columns))
+        ).all()
+    }
+    expected = await recomputeFeatures(session)
+
+    problems = []
+    for key in sorted(stored.keys() | expected.keys(), key=str):
+        if key not in expected:
+            problems.append(f"{key}: stored without any marks")
+        elif key not in stored:
+            problems.append(f"{key}: missing, {int(expected[key][0])} marks")
+        elif not np.allclose(stored[key], expected[key], rtol=rtol, atol=0):
+            differing = [
+                f"{field} {stored[key][i]!r} != {expected[key][i]!r}"
+                for i, field in enumerate(MARK_FIELDS)
+                if not np.isclose(stored[key][i], expected[key][i], rtol=rtol, atol=0)
+            ]
+            problems.append(f"{key}: {', '.join(differing)}")
+    return problems
+
+
+async def rebuildIfEmpty(session: AsyncSession):
+    """fills the rollups on the first start after they were introduced"""
+    has_marks = (await session.execute(select(UserClassMark.uuid).limit(1))).first()
+    if not has_marks:
+        return
+
+    for table in (ClassDisciplineStat, UserMonthlyStat, StudentFeature):
+        if (await session.execute(select(table).limit(1))).first() is None:
+            logging.info(f"{table.__tablename__} is empty while marks exist, rebuilding rollups")
+            await rebuild(session)
+            await session.commit()
+            return
+
+
+async def _main() -> int:
+    from .engine import async_session_maker, init_models
+
+    parser = argparse.ArgumentParser(description="Regenerate the rollups from the raw marks in DB_URL")
+    parser.add_argument("--check", action="store_true", help="only compare student_features with a recompute")
+    args = parser.parse_args()
+
+    await init_models()
+    async with async_session_maker() as session:
+        if args.check:
+            problems = await checkFeatures(session)
+            for problem in problems:
+                logging.error(problem)
+            logging.info(f"student_features: {len(problems)} mismatching rows")
+            return 1 if problems else 0
+
+        await rebuild(session)
+        await session.commit()
+
+    logging.info("Rollups rebuilt")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main()))
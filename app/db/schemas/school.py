@@ -49,4 +49,22 @@ class UserClassMarkCreate(BaseModel):
     class_uuid: UUID
     mark: float
     discipline: str
-    created_at: datetime.datetime | None = None
\ No newline at end of file
+    created_at: datetime.datetime | None = None
+
+class BulkChunkResult(BaseModel):
+    chunk: int
+    received: int
+    inserted: int
+    rejected: int
+
+
+class BulkRowError(BaseModel):
+    row: int  # 0-based position in the request body
+    error: str
+
+
+class BulkMarksResult(BaseModel):
+    inserted: int = 0
+    rejected: int = 0
+    chunks: list[BulkChunkResult] = []
+    errors: list[BulkRowError] = []
@@ -0,0 +1,64 @@
+"""Data versions: cheap to read, bumped in the same transaction as the writes they describe"""
+from __future__ import annotations
+
+from uuid import UUID
+from typing import Iterable
+
+from sqlalchemy import select, or_, Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .declaration.user import User
+from .declaration.school import DataVersion
+
+USER = "user"
+CLASS = "class"
+
+
+async def bump(session: AsyncSession, user_uuids: Iterable[UUID] = (), class_uuids: Iterable[UUID] = ()):
+    """increments the versions of the given users and classes. Does not commit"""
+    from .rollup import upsertIncrement
+
+    rows = [{"scope": USER, "uuid": uuid, "version": 1} for uuid in set(user_uuids)]
+    rows += [{"scope": CLASS, "uuid": uuid, "version": 1} for uuid in set(class_uuids) if uuid is not None]
+
+    await upsertIncrement(
+        session,
+        DataVersion.__table__,
+        rows,
+        key_columns=["scope", "uuid"],
+        sum_columns=["version"]
+    )
+
+
+def userVersionStmt(user_uuid: UUID | None = None, chat_id: int | None = None) -> Select | None:
+    filters = []
+    if user_uuid is not None:
+        filters.append(User.uuid == user_uuid)
+    if chat_id is not None:
+        filters.append(User.chat_id == chat_id)
+    if not filters:
+        return None
+
+    return (
+        select(User.uuid, DataVersion.version)
+        .outerjoin(DataVersion, (DataVersion.scope == USER) & (DataVersion.uuid == User.uuid))
+        .where(or_(*filters))
+        .limit(1)
+    )
+
+
+async def getUserVersion(
+    session: AsyncSession,
+    user_uuid: UUID | None = None,
+    chat_id: int | None = None
+) -> tuple[UUID, int] | None:
+    """resolves the user by uuid or chat_id and returns (user_uuid, version); None if there is no such user"""
+    stmt = userVersionStmt(user_uuid=user_uuid, chat_id=chat_id)
+    if stmt is None:
+        return None
+
+    row = (await session.execute(stmt)).first()
+    if row is None:
+        return None
+
+    return row.uuid, row.version or 0
@@ -10,8 +10,21 @@ from fastapi import Request, HTTPException, status, Depends
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # the chart workers come from a forkserver, never from this process; see app/charts/pool.py
+    from app import charts
+    charts.start()
+
     from db.engine import init_models
     await init_models()
+
+    from app.db import engine, rollup
+    async with engine.async_session_maker() as session:
+        await rollup.rebuildIfEmpty(session)
+
+    # the success model is read once here, requests only score with it; switches come from the model registry
+    from app import prediction
+    prediction.load()
+    prediction.start()
     # from db import utilities
     # import db
     # from scheduler.init import async_scheduler
@@ -34,8 +47,20 @@ async def lifespan(app: FastAPI):
 
     # async_scheduler.start()
 
+    # updates from Telegram come to /webhook/telegram instead of being polled by tg_bot/main.py
+    webhook_mode = os.getenv("BOT_UPDATES") == "webhook"
+    if webhook_mode:
+        from tg_bot import dispatcher
+        await dispatcher.startWebhook()
+
     yield
 
+    if webhook_mode:
+        await dispatcher.stopWebhook()
+
+    prediction.stop()
+    charts.stop()
+
 app = FastAPI(
     lifespan=lifespan,
     # dependencies=[SessionDep]
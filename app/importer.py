@@ -0,0 +1,425 @@
+"""
+Streaming importer for electronic journal exports.
+
+The CSV must have a header with the student name, class, discipline, mark and date columns
+(english or russian names, see COLUMN_ALIASES), any of "," ";" or tab as the delimiter.
+
+The file is read by csv.reader as a text stream, so quoted fields may span lines, in blocks of
+IMPORT_BATCH_SIZE records. Blocks are validated in an executor (a process pool for the CLI) while
+the previous block is written, students and classes are resolved through in-memory lookup tables
+and missing ones are created in batches. A block that fails to be written is rolled back and
+reported, the following ones are still imported.
+
+Marks get a deterministic uuid derived from their content, so importing the same file twice
+inserts nothing the second time. The flip side is that two identical rows (same student, class,
+discipline, mark and timestamp) are treated as one mark.
+
+CLI:
+    python -m app.importer journal.csv --school "Школа №1" --start-year 2023
+"""
+from __future__ import annotations
+
+import io
+import os
+import csv
+import time
+import asyncio
+import itertools
+import logging
+import argparse
+import datetime
+from collections import deque
+from dataclasses import dataclass, field
+from uuid import UUID, uuid4, uuid5
+from typing import AsyncIterator, Iterable, Iterator
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+from sqlalchemy import select, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .db import rollup
+from .db.declaration import user_class_table
+from .db.declaration.user import User
+from .db.declaration.school import School, Class, UserClassMark
+from .db.schemas.user import Roles
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE") or 5000)
+MAX_REPORTED_ERRORS = 100
+
+# namespace for the content-derived mark uuids, must never change
+MARKS_NAMESPACE = UUID("8b0bb4a6-3f0e-4c47-9a55-3f5e2b1c7d10")
+
+COLUMN_ALIASES = {
+    "name": ("name", "student", "фио", "ученик"),
+    "class": ("class", "class_name", "класс"),
+    "discipline": ("discipline", "subject", "предмет", "дисциплина"),
+    "mark": ("mark", "grade", "оценка"),
+    "date": ("date", "created_at", "дата"),
+}
+
+DATE_FORMATS = ("%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%d.%m.%Y", "%d.%m.%Y %H:%M")
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    inserted: int = 0
+    already_imported: int = 0
+    rejected: int = 0
+    users_created: int = 0
+    classes_created: int = 0
+    seconds: float = 0.0
+    errors: list[str] = field(default_factory=list)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def asDict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "already_imported": self.already_imported,
+            "rejected": self.rejected,
+            "users_created": self.users_created,
+            "classes_created": self.classes_created,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+            "errors": self.errors,
+        }
+
+
+def parseHeader(record: list[str]) -> dict[str, int]:
+    """returns the column -> index mapping"""
+    header = [column.strip().lower() for column in record]
+
+    columns = {}
+    for column, aliases in COLUMN_ALIASES.items():
+        for idx, name in enumerate(header):
+            if name in aliases:
+                columns[column] = idx
+                break
+        else:
+            raise ValueError(f"Column '{column}' not found in the header {header}")
+
+    return columns
+
+
+def csvRecords(text: io.TextIOBase) -> Iterator[list[str]]:
+    """parses a text stream opened with newline="", the delimiter is sniffed from the header line"""
+    line = text.readline()
+    if not line:
+        return
+    try:
+        delimiter = csv.Sniffer().sniff(line, delimiters=",;\t").delimiter
+    except csv.Error as e:
+        raise ValueError(f"Could not read the header {line.strip()!r}: {e}") from e
+
+    yield from csv.reader(itertools.chain([line], text), delimiter=delimiter)
+
+
+def _parseDate(value: str) -> datetime.datetime:
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return datetime.datetime.fromisoformat(value)
+
+
+def validateBatch(
+    columns: dict[str, int],
+    first_row: int,
+    records: list[list[str]]
+) -> tuple[list[tuple[str, str, str, float, datetime.datetime]], list[str]]:
+    """validates csv records. Runs in a worker, so it must stay a picklable top-level function"""
+    valid = []
+    errors = []
+    for row, values in enumerate(records, start=first_row):
+        if not any(value.strip() for value in values):
+            continue
+        try:
+            name = values[columns["name"]].strip()
+            class_name = values[columns["class"]].strip()
+            discipline = values[columns["discipline"]].strip()
+            mark = float(values[columns["mark"]].replace(",", "."))
+            created_at = _parseDate(values[columns["date"]])
+        except (IndexError, ValueError) as e:
+            errors.append(f"row {row}: {e}")
+            continue
+
+        if not name or not class_name or not discipline:
+            errors.append(f"row {row}: empty name, class or discipline")
+            continue
+
+        valid.append((name, class_name, discipline, mark, created_at))
+
+    return valid, errors
+
+
+def markUuid(user_uuid: UUID, class_uuid: UUID, discipline: str, mark: float, created_at: datetime.datetime) -> UUID:
+    return uuid5(MARKS_NAMESPACE, f"{user_uuid}|{class_uuid}|{discipline}|{mark}|{created_at.isoformat()}")
+
+
+class JournalImporter:
+    """resolves names to uuids through in-memory lookup tables and writes marks in batches"""
+
+    def __init__(self, session: AsyncSession, school_uuid: UUID, start_year: int):
+        self.session = session
+        self.school_uuid = school_uuid
+        self.start_year = start_year
+
+        self.classes: dict[str, UUID] = {}
+        self.students: dict[tuple[UUID, str], UUID] = {}
+
+    async def load(self):
+        """fills the lookup tables with the classes of the school and their students"""
+        result = await self.session.execute(
+            select(Class.uuid, Class.class_name)
+            .where(Class.school_uuid == self.school_uuid, Class.start_year == self.start_year)
+        )
+        self.classes = {class_name: class_uuid for class_uuid, class_name in result.all()}
+
+        if not self.classes:
+            return
+
+        result = await self.session.execute(
+            select(user_class_table.c.class_uuid, User.name, User.uuid)
+            .join(User, User.uuid == user_class_table.c.user_uuid)
+            .where(user_class_table.c.class_uuid.in_(self.classes.values()))
+        )
+        self.students = {(class_uuid, name): user_uuid for class_uuid, name, user_uuid in result.all()}
+
+    async def _resolveClasses(self, class_names: Iterable[str], report: ImportReport):
+        missing = list({name for name in class_names if name not in self.classes})
+        if not missing:
+            return
+
+        rows = [
+            {"uuid": uuid4(), "class_name": name, "start_year": self.start_year, "school_uuid": self.school_uuid}
+            for name in missing
+        ]
+        await self.session.execute(insert(Class), rows)
+        self.classes.update({row["class_name"]: row["uuid"] for row in rows})
+        report.classes_created += len(rows)
+
+    async def _resolveStudents(self, students: Iterable[tuple[UUID, str]], report: ImportReport):
+        missing = list({student for student in students if student not in self.students})
+        if not missing:
+            return
+
+        rows = [{"uuid": uuid4(), "name": name, "role": Roles.student} for _, name in missing]
+        await self.session.execute(insert(User), rows)
+        await self.session.execute(insert(user_class_table), [
+            {"user_uuid": row["uuid"], "class_uuid": class_uuid}
+            for row, (class_uuid, _) in zip(rows, missing)
+        ])
+        self.students.update({student: row["uuid"] for row, student in zip(rows, missing)})
+        report.users_created += len(rows)
+
+    async def write(self, valid: list[tuple[str, str, str, float, datetime.datetime]], report: ImportReport):
+        """writes one validated batch in its own transaction, rolled back as a whole if it fails"""
+        classes = dict(self.classes)
+        students = dict(self.students)
+        try:
+            inserted = await self._write(valid, report)
+        except Exception:
+            await self.session.rollback()
+            # the classes and students created by the failed batch are gone with it
+            report.classes_created -= len(self.classes) - len(classes)
+            report.users_created -= len(self.students) - len(students)
+            self.classes = classes
+            self.students = students
+            raise
+
+        report.inserted += len(inserted)
+        report.already_imported += len(valid) - len(inserted)
+
+    async def _write(self, valid: list[tuple[str, str, str, float, datetime.datetime]], report: ImportReport) -> list:
+        await self._resolveClasses((class_name for _, class_name, *_ in valid), report)
+        await self._resolveStudents(
+            ((self.classes[class_name], name) for name, class_name, *_ in valid),
+            report
+        )
+
+        marks = {}
+        for name, class_name, discipline, mark, created_at in valid:
+            class_uuid = self.classes[class_name]
+            user_uuid = self.students[(class_uuid, name)]
+            uuid = markUuid(user_uuid, class_uuid, discipline, mark, created_at)
+            marks[uuid] = {
+                "uuid": uuid,
+                "user_uuid": user_uuid,
+                "class_uuid": class_uuid,
+                "discipline": discipline,
+                "mark": mark,
+                "created_at": created_at,
+            }
+
+        inserted = []
+        if marks:
+            stmt = (
+                rollup.dialectInsert(self.session, UserClassMark.__table__)
+                .on_conflict_do_nothing(index_elements=["uuid"])
+                .returning(UserClassMark.__table__.c.uuid)
+            )
+            inserted_uuids = (await self.session.execute(stmt, list(marks.values()))).scalars().all()
+            inserted = [marks[uuid] for uuid in inserted_uuids]
+            await rollup.applyMarks(self.session, inserted)
+
+        await self.session.commit()
+        return inserted
+
+
+async def importJournal(
+    session: AsyncSession,
+    blocks: AsyncIterator[list[list[str]]],
+    school_uuid: UUID,
+    start_year: int,
+    executor: Executor | None = None,
+    prefetch: int = 2
+) -> ImportReport:
+    """
+    Imports csv records coming in blocks, the first record of the first block is the header.
+    Up to `prefetch` blocks are validated in the executor while the current one is written.
+    """
+    report = ImportReport()
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+
+    importer = JournalImporter(session, school_uuid, start_year)
+    await importer.load()
+
+    async def handle(first_row, validation):
+        valid, errors = await validation
+        report.rejected += len(errors)
+        if valid:
+            try:
+                await importer.write(valid, report)
+            except Exception as e:
+                logging.exception(f"Journal block starting at row {first_row} was not written")
+                errors.append(f"rows from {first_row}: block of {len(valid)} valid rows was not written: {e}")
+                report.rejected += len(valid)
+        report.errors.extend(errors[:MAX_REPORTED_ERRORS - len(report.errors)])
+
+        logging.info(f"Imported {report.rows} rows, {report.rows / (time.perf_counter() - started):.0f} rows/s")
+
+    columns = None
+    row = 1  # the header is row 0
+    pending = deque()
+    async for block in blocks:
+        if columns is None:
+            if not block:
+                continue
+            columns = parseHeader(block[0])
+            block = block[1:]
+
+        pending.append((row, loop.run_in_executor(executor, validateBatch, columns, row, block)))
+        row += len(block)
+        report.rows += len(block)
+
+        if len(pending) >= prefetch:
+            await handle(*pending.popleft())
+
+    while pending:
+        await handle(*pending.popleft())
+
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+class _BlockingStream(io.RawIOBase):
+    """
+    binary file over an async byte stream, for a reader running in a thread: every read waits for the
+    next chunk on the event loop, so the stream is never held in memory as a whole
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes], loop: asyncio.AbstractEventLoop):
+        self.chunks = chunks.__aiter__()
+        self.loop = loop
+        self.pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self.pending:
+            try:
+                self.pending = asyncio.run_coroutine_threadsafe(self.chunks.__anext__(), self.loop).result()
+            except StopAsyncIteration:
+                return 0
+
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+async def _recordBlocks(text: io.TextIOBase, batch_size: int) -> AsyncIterator[list[list[str]]]:
+    """reads the csv records in a thread, one block at a time"""
+    records = csvRecords(text)
+    while True:
+        block = await asyncio.to_thread(list, itertools.islice(records, batch_size))
+        if not block:
+            return
+        yield block
+
+
+async def fileBlocks(path: str, batch_size: int = IMPORT_BATCH_SIZE) -> AsyncIterator[list[list[str]]]:
+    with open(path, "r", encoding="utf-8-sig", newline="") as file:
+        async for block in _recordBlocks(file, batch_size):
+            yield block
+
+
+async def streamBlocks(
+    chunks: AsyncIterator[bytes],
+    batch_size: int = IMPORT_BATCH_SIZE
+) -> AsyncIterator[list[list[str]]]:
+    """reads a byte stream as csv records without holding more than one block in memory"""
+    stream = _BlockingStream(chunks, asyncio.get_running_loop())
+    with io.TextIOWrapper(io.BufferedReader(stream), encoding="utf-8-sig", newline="") as text:
+        async for block in _recordBlocks(text, batch_size):
+            yield block
+
+
+async def _main():
+    from .db.engine import async_session_maker, init_models
+
+    parser = argparse.ArgumentParser(description="Import marks from an electronic journal CSV export")
+    parser.add_argument("path")
+    parser.add_argument("--school", required=True, help="facility name, created if missing")
+    parser.add_argument("--start-year", type=int, required=True, help="start year of the classes in the file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="validation processes")
+    args = parser.parse_args()
+
+    await init_models()
+    async with async_session_maker() as session:
+        school = (await session.execute(select(School).where(School.facility_name == args.school))).scalars().first()
+        if school is None:
+            school = School(facility_name=args.school)
+            session.add(school)
+            await session.commit()
+
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            report = await importJournal(
+                session,
+                fileBlocks(args.path),
+                school.uuid,
+                args.start_year,
+                executor=executor,
+                prefetch=args.workers
+            )
+
+    for error in report.errors:
+        logging.warning(error)
+    logging.info(
+        f"Done: {report.rows} rows in {report.seconds:.1f}s ({report.rows_per_second:.0f} rows/s), "
+        f"inserted {report.inserted}, already imported {report.already_imported}, rejected {report.rejected}, "
+        f"created {report.users_created} students and {report.classes_created} classes"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -16,7 +16,7 @@ import nest_asyncio
 
 nest_asyncio.apply()
 
-from fastapi_app import app  # necessary for uvicorn
+from app.fastapi_app import app  # necessary for uvicorn; the same module tg_bot.config binds to with API_TRANSPORT=asgi
 
 
 def run():
@@ -0,0 +1,239 @@
+"""
+Success prediction: P(the average mark of the next months >= SUCCESS_AVERAGE) from a logistic regression over
+features of the student's marks so far (features.py, model.py).
+
+The model is trained offline (python -m app.prediction.train) into a .npz artifact of the model registry
+(registry.py). The api starts with the registry's active version and follows it when it is switched, through
+activate() (POST /admin/models/{version}/activate) here or in another api process, without a restart.
+PREDICTION_MODEL pins an artifact instead. Without a usable model the old heuristic answers.
+
+Requests score from the student_features running sums (queries.userFeatures / scopeFeatures), not from the
+raw marks: predictStored() for one student, predictStudents() for a whole class or school.
+"""
+from __future__ import annotations
+
+import os
+import asyncio
+import logging
+from uuid import UUID
+from typing import Iterable
+
+import numpy as np
+
+from .features import (
+    FEATURE_NAMES, SUM_FIELDS, MARK_FIELDS,
+    sumsFromRows, sumsFromArrays, sumsFromStore, sumsByStudent, studentSums, isAbsence, addMark,
+    featureMatrix, disciplineFeatures,
+)
+from .model import Model, ArtifactError, fitLogistic
+from .heuristic import predictFromMarks, predictFromStats, classify
+from .registry import Registry, registry
+from .shadow import Shadow, shadow
+from ..db.queries import ABSENCE_DISCIPLINES
+
+_MARKS_COUNT, _MARKS_SUM, _BAD_COUNT = (SUM_FIELDS.index(name) for name in ("marks_count", "marks_sum", "bad_count"))
+
+MODEL_PATH = os.getenv("PREDICTION_MODEL")
+# how often every api process checks the registry for a switched active model
+RELOAD_SECONDS = float(os.getenv("PREDICTION_RELOAD_SECONDS") or 10)
+# students per page of the class and school predictions, unless the request asks for another limit
+PREDICTIONS_PAGE_SIZE = 50
+
+# requests read it once, so the ones in flight during a switch finish with the model they started with
+_model: Model | None = None
+_tasks: list[asyncio.Task] = []
+
+
+def _swap(model: Model | None):
+    global _model
+    _model = model
+    logging.info(f"Prediction model is now {model.version if model is not None else 'the heuristic'}")
+
+
+def load(path: str | None = MODEL_PATH) -> Model | None:
+    """the model at startup: the artifact at path if given, the registry's active version otherwise"""
+    version = None if path else registry.activeVersion()
+    source = path or os.path.join(registry.directory, f"{version}.npz" if version else "ACTIVE")
+    try:
+        model = Model.load(path) if path else registry.get(version) if version else None
+        if model is None:
+            raise FileNotFoundError(source)
+        logging.info(f"Prediction model {model.version} loaded from {source}")
+    except FileNotFoundError:
+        logging.warning(f"No prediction model at {source}, predictions come from the heuristic")
+        model = None
+    except (ArtifactError, KeyError, ValueError, OSError) as e:
+        logging.error(f"Prediction model {source} is unusable, predictions come from the heuristic: {e}")
+        model = None
+    _swap(model)
+    return model
+
+
+def currentModel() -> Model | None:
+    return _model
+
+
+def activate(version: str) -> Model:
+    """makes a registry version the active model of every api process; raises if it can not be loaded"""
+    model = registry.get(version)
+    registry.setActive(version)
+    _swap(model)
+    return model
+
+
+async def watch():
+    """follows switches of the registry's active version made by other processes"""
+    while True:
+        await asyncio.sleep(RELOAD_SECONDS)
+        version = registry.activeVersion()
+        if MODEL_PATH or version is None or (_model is not None and _model.version == version):
+            continue
+        try:
+            _swap(registry.get(version))
+        except (FileNotFoundError, ArtifactError, KeyError, ValueError, OSError) as e:
+            logging.error(f"Active prediction model {version} is unusable, keeping the current one: {e}")
+
+
+def start():
+    _tasks.extend([asyncio.create_task(watch()), asyncio.create_task(shadow.run())])
+
+
+def stop():
+    shadow.stop()
+    for task in _tasks:
+        task.cancel()
+    _tasks.clear()
+
+
+def describe(probability: float, total: int, bad_count: int, average: float, model: Model) -> dict:
+    status = "успешный" if probability >= model.threshold else "неуспешный"
+
+    message = (
+        f"Средний балл: {average:.2f}, оценок всего: {total}, "
+        f"из них троек и ниже: {bad_count} ({bad_count / total:.0%})\n"
+        f"Вероятность успешной учёбы: {probability:.0%}"
+    )
+    if status == "успешный":
+        message += "\n\n🎯 У тебя отличная успеваемость, попробуй свои силы в олимпиадах!"
+
+    return {
+        "status": status,
+        "confidence": round(max(probability, 1 - probability), 2),
+        "probability": round(probability, 3),
+        "model": model.version,
+        "total_marks": total,
+        "bad_marks": bad_count,
+        "message": message,
+    }
+
+
+def predictSums(sums: np.ndarray, sampled: bool | None = None) -> dict:
+    """
+    prediction for one student from their SUM_FIELDS; sampled is the shadow scoring coin flip if the caller
+    already made it (see shadow.sample())
+    """
+    total, bad_count = round(sums[_MARKS_COUNT]), round(sums[_BAD_COUNT])
+    average = sums[_MARKS_SUM] / total if total else 0.0
+
+    model = _model
+    if model is None or not total:
+        return {**predictFromStats(total, bad_count, average), "model": "heuristic"}
+
+    features = featureMatrix(sums)
+    probabilities = model.probabilities(features)
+    shadow.offer(features, probabilities, model, sampled)
+    return describe(float(probabilities[0]), total, bad_count, average, model)
+
+
+def predict(rows: Iterable[tuple]) -> dict:
+    """prediction for one student from their raw (discipline, mark, created_at) rows"""
+    return predictSums(sumsFromRows(rows))
+
+
+def predictStored(rows: Iterable[tuple], sampled: bool | None = None) -> dict:
+    """prediction for one student from their queries.userFeatures() rows"""
+    return predictSums(sumsFromStore(rows), sampled)
+
+
+def predictStudents(students: Iterable[tuple], features: Iterable[tuple]) -> tuple[list[dict], str]:
+    """
+    predictions for all the students of a class or a school from the queries.scopeStudents() and
+    queries.scopeFeatures() rows, scored at once, riskiest first;
+    risk is 1 - P(success), students without marks have none and come last
+    """
+    index, roster = {}, []
+    for class_uuid, class_name, user_uuid, name in students:
+        if user_uuid in index:
+            # a student of two classes of the school is listed once, with the first of them
+            continue
+        index[user_uuid] = len(roster)
+        roster.append({"user_uuid": user_uuid, "name": name, "class_uuid": class_uuid, "class_name": class_name})
+
+    features = [row for row in features if row[0] in index]
+    sums = studentSums(
+        np.array([index[row[0]] for row in features], dtype=np.intp),
+        len(roster),
+        isAbsence(row[1] for row in features),
+        np.array([row[2:] for row in features], dtype=float).reshape(len(features), len(MARK_FIELDS)),
+    )
+    totals, bad_counts, marks_sums = sums[:, _MARKS_COUNT], sums[:, _BAD_COUNT], sums[:, _MARKS_SUM]
+
+    model = _model
+    probabilities = None
+    if model is not None and len(roster):
+        features = featureMatrix(sums)
+        probabilities = model.probabilities(features)
+        shadow.offer(features, probabilities, model)
+    for i, student in enumerate(roster):
+        total, bad_count = round(totals[i]), round(bad_counts[i])
+        if not total:
+            student.update(status="unknown", probability=None, risk=None, average=None, total_marks=0, bad_marks=0)
+            continue
+
+        average = marks_sums[i] / total
+        if probabilities is not None:
+            probability = float(probabilities[i])
+            status = "успешный" if probability >= model.threshold else "неуспешный"
+        else:
+            status, probability = classify(average, bad_count, total)
+        student.update(
+            status=status,
+            probability=round(probability, 3),
+            risk=round(1 - probability, 3),
+            average=round(average, 2),
+            total_marks=total,
+            bad_marks=bad_count,
+        )
+
+    roster.sort(key=lambda student: (student["risk"] is None, -(student["risk"] or 0), student["name"] or ""))
+    return roster, model.version if model is not None else "heuristic"
+
+
+def predictionsPage(
+    scope: str,
+    uuid: UUID,
+    students: Iterable[tuple],
+    features: Iterable[tuple],
+    offset: int,
+    limit: int
+) -> dict:
+    """one page of predictStudents() over a whole class or school"""
+    students, model = predictStudents(students, features)
+    return {
+        "scope": scope,
+        "uuid": uuid,
+        "model": model,
+        "total": len(students),
+        "offset": offset,
+        "limit": limit,
+        "students": students[offset:offset + limit],
+    }
+
+
+__all__ = [
+    "FEATURE_NAMES", "SUM_FIELDS", "MARK_FIELDS", "sumsFromRows", "sumsFromArrays", "sumsFromStore", "sumsByStudent",
+    "studentSums", "addMark", "featureMatrix", "disciplineFeatures",
+    "Model", "ArtifactError", "fitLogistic", "predictFromMarks", "load", "currentModel", "describe",
+    "predictSums", "predict", "predictStored", "predictStudents", "predictionsPage", "PREDICTIONS_PAGE_SIZE",
+    "Registry", "registry", "Shadow", "shadow", "activate", "watch", "start", "stop",
+]
@@ -0,0 +1,59 @@
+"""
+Prediction results cached by (student, data version, model version).
+
+The data version is bumped with every mark written for the student and switching the model changes the model
+version, so a stale entry is never read again; it ages out of the local LRU and Redis on its own. The requests
+shadow scoring samples skip the cache, the candidate needs their features.
+"""
+from __future__ import annotations
+
+import os
+import json
+from uuid import UUID
+from typing import Iterable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import currentModel, predictStored, shadow
+from ..cache import TieredCache
+from ..db import queries
+
+# bump when the shape of the predictions changes so old entries are not served
+PREDICTIONS_REVISION = 1
+
+prediction_cache = TieredCache(
+    namespace="prediction",
+    max_bytes=int(os.getenv("PREDICTION_CACHE_MB") or 8) * 1024 * 1024,
+    ttl=int(os.getenv("PREDICTION_CACHE_TTL") or 24 * 60 * 60)
+)
+
+
+def predictionKey(user_uuid: UUID, version: int) -> str:
+    model = currentModel()
+    return f"{PREDICTIONS_REVISION}:{user_uuid}:{version}:{model.version if model is not None else 'heuristic'}"
+
+
+async def cachedPrediction(
+    session: AsyncSession,
+    user_uuid: UUID,
+    version: int,
+    features: Iterable[tuple] | None = None
+) -> dict:
+    """
+    a student's prediction at the given data version (versions.getUserVersion()); on a miss it is computed
+    from their queries.userFeatures() rows, queried unless the caller already has them
+    """
+    sampled = shadow.sample()
+    if not sampled:
+        cached = await prediction_cache.get(predictionKey(user_uuid, version))
+        if cached is not None:
+            return json.loads(cached)
+
+    if features is None:
+        features = (await session.execute(queries.userFeatures(user_uuid=user_uuid))).all()
+
+    # the key is taken again right before scoring: the model may have been switched meanwhile
+    key = predictionKey(user_uuid, version)
+    result = predictStored(features, sampled)
+    await prediction_cache.set(key, json.dumps(result, ensure_ascii=False).encode())
+    return result
@@ -0,0 +1,159 @@
+"""
+Features of a student for the success model, computed from running sums over the marks.
+
+Everything the model sees is derived from SUM_FIELDS, sums that a new mark only adds to: MARK_FIELDS per mark
+(the EWMA weights are taken relative to a fixed day, so they add up too) plus the absence counters. Summed per
+discipline they are the student_features table (db.rollup keeps it up to date on every insert), summed per
+student they are what featureMatrix() turns into model inputs for many students at once with column arithmetic.
+
+Absences (queries.ABSENCE_DISCIPLINES) are not marks: their "mark" is the number of days missed, so in a
+discipline row of an absence type marks_count counts the entries and marks_sum the days.
+"""
+from __future__ import annotations
+
+import datetime
+from typing import Iterable
+
+import numpy as np
+
+from ..db.queries import ABSENCE_DISCIPLINES
+
+# marks at or below this count as bad, the way the old heuristic counted them
+BAD_MARK = 3
+# half-life of the recency-weighted average, days
+EWMA_HALF_LIFE_DAYS = 30.0
+# slope of the marks over time is reported per this many days
+SLOPE_PERIOD_DAYS = 30.0
+
+MARK_FIELDS = (
+    "marks_count", "marks_sum", "marks_sum_sq", "bad_count",
+    "days_sum", "days_sum_sq", "days_marks_sum",
+    "ewma_sum", "ewma_weight",
+)
+SUM_FIELDS = MARK_FIELDS + ("absences_count", "absence_days")
+FEATURE_NAMES = (
+    "mean", "std", "bad_ratio", "ewma", "slope", "log_count", "absence_ratio", "absence_days_per_entry",
+)
+
+_F = {name: i for i, name in enumerate(SUM_FIELDS)}
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_NAIVE_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def toDays(moment: datetime.datetime) -> float:
+    """days since the epoch, naive datetimes are UTC as stored by the api"""
+    return (moment - (_NAIVE_EPOCH if moment.tzinfo is None else _EPOCH)).total_seconds() / 86400
+
+
+def daysOf(moments) -> np.ndarray:
+    """toDays() of a column of datetimes"""
+    return np.array([toDays(moment) for moment in moments], dtype=float)
+
+
+# the EWMA weight of a mark is 2^((day - EWMA_REFERENCE_DAY) / half-life), the average does not depend on the
+# reference; float64 holds the weights of marks within ~80 years of it
+EWMA_REFERENCE_DAY = toDays(datetime.datetime(2024, 1, 1))
+
+
+def markSums(marks: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """(marks, MARK_FIELDS), what every mark adds to the sums"""
+    weights = np.exp2((days - EWMA_REFERENCE_DAY) / EWMA_HALF_LIFE_DAYS)
+    return np.column_stack([
+        np.ones(len(marks)), marks, marks * marks, marks <= BAD_MARK,
+        days, days * days, days * marks,
+        marks * weights, weights,
+    ])
+
+
+def groupedSums(group: np.ndarray, groups: int, rows: np.ndarray) -> np.ndarray:
+    """(groups, columns) sums of the rows, group[i] is the group row i adds to"""
+    return np.column_stack([
+        np.bincount(group, weights=rows[:, column], minlength=groups) for column in range(rows.shape[1])
+    ]).reshape(groups, rows.shape[1])
+
+
+def studentSums(student: np.ndarray, students: int, is_absence: np.ndarray, discipline_sums: np.ndarray) -> np.ndarray:
+    """(students, SUM_FIELDS) from MARK_FIELDS rows of single marks or whole disciplines, student[i] owns row i"""
+    sums = np.zeros((students, len(SUM_FIELDS)))
+    sums[:, :len(MARK_FIELDS)] = groupedSums(student[~is_absence], students, discipline_sums[~is_absence])
+    absences = discipline_sums[is_absence]
+    sums[:, _F["absences_count"]] = np.bincount(
+        student[is_absence], weights=absences[:, _F["marks_count"]], minlength=students
+    )
+    sums[:, _F["absence_days"]] = np.bincount(
+        student[is_absence], weights=absences[:, _F["marks_sum"]], minlength=students
+    )
+    return sums
+
+
+def isAbsence(disciplines: Iterable[str]) -> np.ndarray:
+    absence_disciplines = set(ABSENCE_DISCIPLINES)
+    return np.array([discipline in absence_disciplines for discipline in disciplines], dtype=bool)
+
+
+def sumsByStudent(student: np.ndarray, students: int, is_absence: np.ndarray, marks: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """(students, SUM_FIELDS) of many students at once from the columns of their marks, student[i] owns mark i"""
+    return studentSums(student, students, is_absence, markSums(marks, days))
+
+
+def sumsFromArrays(is_absence: np.ndarray, marks: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """SUM_FIELDS of one student from the columns of their marks"""
+    return sumsByStudent(np.zeros(len(marks), dtype=np.intp), 1, is_absence, marks, days)[0]
+
+
+def sumsFromRows(rows: Iterable[tuple[str, float, datetime.datetime]]) -> np.ndarray:
+    """SUM_FIELDS of one student from (discipline, mark, created_at) rows"""
+    rows = list(rows)
+    disciplines, marks, moments = zip(*rows) if rows else ((), (), ())
+    return sumsFromArrays(isAbsence(disciplines), np.array(marks, dtype=float), daysOf(moments))
+
+
+def sumsFromStore(rows: Iterable[tuple]) -> np.ndarray:
+    """SUM_FIELDS of one student from their (discipline, *MARK_FIELDS) student_features rows"""
+    rows = list(rows)
+    disciplines = [row[0] for row in rows]
+    discipline_sums = np.array([row[1:] for row in rows], dtype=float).reshape(len(rows), len(MARK_FIELDS))
+    return studentSums(np.zeros(len(rows), dtype=np.intp), 1, isAbsence(disciplines), discipline_sums)[0]
+
+
+def addMark(sums: np.ndarray, discipline: str, mark: float, created_at: datetime.datetime) -> np.ndarray:
+    """sums with one more mark, the same as recomputing them from all the marks"""
+    return sums + sumsFromRows([(discipline, mark, created_at)])
+
+
+def featureMatrix(sums: np.ndarray) -> np.ndarray:
+    """(students, FEATURE_NAMES) from (students, SUM_FIELDS); students without marks get zeros"""
+    sums = np.atleast_2d(sums)
+    column = lambda name: sums[:, _F[name]]
+
+    n = column("marks_count")
+    safe_n = np.maximum(n, 1)
+    mean = column("marks_sum") / safe_n
+    variance = np.maximum(column("marks_sum_sq") / safe_n - mean * mean, 0)
+
+    # least squares slope of mark over time
+    days_mean = column("days_sum") / safe_n
+    days_variance = column("days_sum_sq") / safe_n - days_mean * days_mean
+    covariance = column("days_marks_sum") / safe_n - days_mean * mean
+    slope = np.where(days_variance > 1e-6, covariance / np.where(days_variance > 1e-6, days_variance, 1), 0)
+
+    entries = np.maximum(n + column("absences_count"), 1)
+    weighted = column("ewma_weight") > 0
+    features = np.column_stack([
+        mean,
+        np.sqrt(variance),
+        column("bad_count") / safe_n,
+        np.where(weighted, column("ewma_sum") / np.where(weighted, column("ewma_weight"), 1), mean),
+        slope * SLOPE_PERIOD_DAYS,
+        np.log1p(n),
+        column("absences_count") / entries,
+        column("absence_days") / entries,
+    ])
+    features[n == 0] = 0
+    return features
+
+
+def disciplineFeatures(discipline_sums: np.ndarray) -> np.ndarray:
+    """(disciplines, FEATURE_NAMES) of MARK_FIELDS rows, the absence features are zeros"""
+    discipline_sums = np.atleast_2d(discipline_sums)
+    return featureMatrix(np.column_stack([discipline_sums, np.zeros((len(discipline_sums), 2))]))
@@ -0,0 +1,58 @@
+"""
+The rule-based prediction the model replaced: thresholds on the average mark and the share of bad marks.
+Still answers when no model artifact is loaded.
+
+The thresholds are the original /predict_success ones, but it is given marks only: the original also counted
+absence entries, whose "mark" is the number of days missed, in the average, the total and the bad marks.
+train.py reports both variants on the holdout next to the model (scripts/bench_prediction.py prints them).
+"""
+from __future__ import annotations
+
+
+def classify(avg: float, bad_count: int, total: int) -> tuple[str, float]:
+    """status and confidence from the average mark and the number of marks at or below 3"""
+    bad_ratio = bad_count / total
+
+    if avg >= 4.5 and bad_count == 0:
+        return "успешный", 0.95
+    elif avg >= 4.0 and bad_ratio <= 0.1:
+        return "успешный", 0.9
+    elif avg >= 3.5 and bad_ratio <= 0.25:
+        return "успешный", 0.85
+    elif avg >= 3.0:
+        return "неуспешный", 0.4
+    else:
+        return "неуспешный", 0.2
+
+
+def predictFromMarks(marks: list[float]) -> dict:
+    total = len(marks)
+    return predictFromStats(total, sum(1 for m in marks if m <= 3), sum(marks) / total if total else 0.0)
+
+
+def predictFromStats(total: int, bad_count: int, avg: float) -> dict:
+    if not total:
+        return {
+            "status": "unknown",
+            "confidence": 0.0,
+            "message": "У ученика нет оценок, невозможно сделать прогноз."
+        }
+
+    bad_ratio = bad_count / total
+    status, confidence = classify(avg, bad_count, total)
+
+    message = (
+        f"Средний балл: {avg:.2f}, оценок всего: {total}, "
+        f"из них троек и ниже: {bad_count} ({bad_ratio:.0%})"
+    )
+
+    if status == "успешный":
+        message += "\n\n🎯 У тебя отличная успеваемость, попробуй свои силы в олимпиадах!"
+
+    return {
+        "status": status,
+        "confidence": round(confidence, 2),
+        "total_marks": total,
+        "bad_marks": bad_count,
+        "message": message
+    }
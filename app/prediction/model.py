@@ -0,0 +1,111 @@
+"""
+L2-regularized logistic regression in NumPy and its artifact.
+
+Fitting standardizes the features and runs Newton steps, a handful is enough for this few features. The
+standardization is folded into the weights afterwards, so scoring is one matrix-vector product and a sigmoid.
+
+The artifact is a .npz (no pickles) with the weights, the feature names they belong to and a JSON header:
+artifact format, model version, training parameters and holdout metrics. load() refuses an artifact of
+another format or feature set, the caller then falls back to the heuristic.
+"""
+from __future__ import annotations
+
+import io
+import json
+import hashlib
+import datetime
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from .features import FEATURE_NAMES
+
+ARTIFACT_FORMAT = 1
+
+
+class ArtifactError(ValueError):
+    pass
+
+
+def sigmoid(z: np.ndarray) -> np.ndarray:
+    return 0.5 * (1 + np.tanh(0.5 * z))
+
+
+@dataclass
+class Model:
+    weights: np.ndarray
+    bias: float
+    threshold: float = 0.5
+    feature_names: tuple[str, ...] = FEATURE_NAMES
+    version: str = ""
+    meta: dict = field(default_factory=dict)
+
+    def probabilities(self, features: np.ndarray) -> np.ndarray:
+        """P(success) for every row of a (students, features) matrix"""
+        return sigmoid(np.atleast_2d(features) @ self.weights + self.bias)
+
+    def save(self, path: str):
+        header = {
+            "format": ARTIFACT_FORMAT,
+            "version": self.version,
+            "threshold": self.threshold,
+            "feature_names": list(self.feature_names),
+            **self.meta,
+        }
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            weights=self.weights.astype(np.float64),
+            bias=np.float64(self.bias),
+            header=np.array(json.dumps(header, ensure_ascii=False)),
+        )
+        with open(path, "wb") as f:
+            f.write(buffer.getvalue())
+
+    @classmethod
+    def load(cls, path: str) -> Model:
+        with np.load(path, allow_pickle=False) as artifact:
+            header = json.loads(str(artifact["header"]))
+            if header.get("format") != ARTIFACT_FORMAT:
+                raise ArtifactError(f"{path}: artifact format {header.get('format')}, expected {ARTIFACT_FORMAT}")
+            if tuple(header["feature_names"]) != FEATURE_NAMES:
+                raise ArtifactError(f"{path}: trained on features {header['feature_names']}, not {list(FEATURE_NAMES)}")
+
+            meta = {key: value for key, value in header.items()
+                    if key not in ("format", "version", "threshold", "feature_names")}
+            return cls(
+                weights=artifact["weights"],
+                bias=float(artifact["bias"]),
+                threshold=header["threshold"],
+                version=header["version"],
+                meta=meta,
+            )
+
+
+def fitLogistic(features: np.ndarray, labels: np.ndarray, l2: float = 1.0, iterations: int = 25) -> Model:
+    """Newton's method on the penalized log-likelihood of standardized features, the bias is not penalized"""
+    center = features.mean(axis=0)
+    scale = features.std(axis=0)
+    scale[scale < 1e-9] = 1
+    x = np.column_stack([(features - center) / scale, np.ones(len(features))])
+    y = labels.astype(np.float64)
+
+    penalty = np.full(x.shape[1], l2)
+    penalty[-1] = 0
+    beta = np.zeros(x.shape[1])
+    for _ in range(iterations):
+        p = sigmoid(x @ beta)
+        gradient = x.T @ (p - y) + penalty * beta
+        hessian = (x.T * (p * (1 - p))) @ x + np.diag(penalty) + 1e-9 * np.eye(x.shape[1])
+        step = np.linalg.solve(hessian, gradient)
+        beta -= step
+        if np.abs(step).max() < 1e-8:
+            break
+
+    # back to the raw features: w·(x - c)/s + b == (w/s)·x + (b - w·c/s)
+    weights = beta[:-1] / scale
+    bias = float(beta[-1] - weights @ center)
+
+    digest = hashlib.sha256(np.append(weights, bias).tobytes()).hexdigest()[:8]
+    version = f"logreg-{datetime.date.today():%Y%m%d}-{digest}"
+    return Model(weights=weights, bias=bias, version=version)
@@ -0,0 +1,80 @@
+"""
+Directory of versioned model artifacts, <version>.npz each, and an ACTIVE file naming the one in use.
+
+Artifacts are read lazily, the first time a version is activated or shadowed, and kept loaded afterwards (they
+are a few KB). Switching writes ACTIVE atomically; every api process polls it (watch()), so a switch made
+through one of them reaches the others within PREDICTION_RELOAD_SECONDS. An empty or missing registry is fine,
+predictions come from the heuristic until a model is published and activated.
+"""
+from __future__ import annotations
+
+import os
+import re
+import glob
+import logging
+import tempfile
+
+from .model import Model, ArtifactError
+
+# models are trained on the deployment's own marks, so they live with its data, not in the source tree
+DATA_DIR = os.getenv("DATA_DIR") or "data"
+REGISTRY_DIR = os.getenv("PREDICTION_REGISTRY") or os.path.join(DATA_DIR, "models")
+ACTIVE_FILE = "ACTIVE"
+
+_VERSION = re.compile(r"^[\w.-]+$")
+
+
+class Registry:
+    def __init__(self, directory: str = REGISTRY_DIR):
+        self.directory = directory
+        self._loaded: dict[str, Model] = {}
+
+    def path(self, version: str) -> str:
+        if not _VERSION.match(version):
+            raise ArtifactError(f"Bad model version {version!r}")
+        return os.path.join(self.directory, f"{version}.npz")
+
+    def versions(self) -> list[str]:
+        return sorted(os.path.basename(path)[:-len(".npz")] for path in glob.glob(os.path.join(self.directory, "*.npz")))
+
+    def get(self, version: str) -> Model:
+        """the model of a version, read on first use; FileNotFoundError for an unknown one"""
+        model = self._loaded.get(version)
+        if model is None:
+            model = Model.load(self.path(version))
+            if model.version != version:
+                raise ArtifactError(f"{self.path(version)} holds model {model.version}, not {version}")
+            self._loaded[version] = model
+        return model
+
+    def loaded(self) -> list[str]:
+        return sorted(self._loaded)
+
+    def activeVersion(self) -> str | None:
+        try:
+            with open(os.path.join(self.directory, ACTIVE_FILE)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def setActive(self, version: str):
+        """points ACTIVE at a version, readers never see a half written file"""
+        self.path(version)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".active-")
+        with os.fdopen(fd, "w") as f:
+            f.write(version + "\n")
+        os.replace(tmp, os.path.join(self.directory, ACTIVE_FILE))
+
+    def publish(self, model: Model) -> str:
+        """stores an artifact under its version, the active model does not change"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(model.version)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".publish-", suffix=".npz")
+        os.close(fd)
+        model.save(tmp)
+        os.replace(tmp, path)
+        logging.info(f"Model {model.version} published to {path}")
+        return path
+
+
+registry = Registry()
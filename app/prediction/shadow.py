@@ -0,0 +1,109 @@
+"""
+Shadow scoring: a candidate model scores a sampled fraction of the prediction requests next to the active one,
+without affecting the answers.
+
+The request path only flips a coin and queues the features it already computed; run() scores the queue with
+the candidate in one batch every SHADOW_INTERVAL seconds and counts how often the two models disagree on the
+status (successful or not) and how far apart their probabilities are.
+"""
+from __future__ import annotations
+
+import random
+import asyncio
+import logging
+from collections import deque
+
+import numpy as np
+
+from .model import Model
+
+SHADOW_INTERVAL = 1.0
+# requests waiting to be scored, the oldest are dropped beyond it
+SHADOW_QUEUE_LIMIT = 10_000
+
+
+class Shadow:
+    def __init__(self):
+        self.candidate: Model | None = None
+        self.fraction = 0.0
+        self._pending: deque[tuple[np.ndarray, np.ndarray, float]] = deque()
+        self._reset()
+
+    def _reset(self):
+        self._pending.clear()
+        self.sampled = 0
+        self.dropped = 0
+        self.scored = 0
+        self.disagreements = 0
+        self.difference_sum = 0.0
+
+    def start(self, candidate: Model, fraction: float):
+        self._reset()
+        self.candidate = candidate
+        self.fraction = fraction
+        logging.info(f"Shadow scoring {fraction:.0%} of the requests with {candidate.version}")
+
+    def stop(self) -> dict:
+        self.score()
+        snapshot = self.snapshot()
+        if self.candidate is not None:
+            logging.info(f"Shadow scoring with {self.candidate.version} stopped: {snapshot}")
+        self.candidate = None
+        self.fraction = 0.0
+        return snapshot
+
+    def sample(self) -> bool:
+        """the per-request coin flip: whether the candidate scores this request too"""
+        return self.candidate is not None and random.random() < self.fraction
+
+    def offer(self, features: np.ndarray, probabilities: np.ndarray, model: Model, sampled: bool | None = None):
+        """
+        called by every prediction request with what the active model saw and answered; sampled is the coin flip
+        if the request made it already, for instance to skip a cache
+        """
+        if self.candidate is None or not (self.sample() if sampled is None else sampled):
+            return
+
+        self.sampled += 1
+        self._pending.append((features, probabilities, model.threshold))
+        if len(self._pending) > SHADOW_QUEUE_LIMIT:
+            self._pending.popleft()
+            self.dropped += 1
+
+    def score(self):
+        candidate = self.candidate
+        if candidate is None or not self._pending:
+            return
+
+        batch = [self._pending.popleft() for _ in range(len(self._pending))]
+        features = np.concatenate([features for features, _, _ in batch])
+        active = np.concatenate([probabilities for _, probabilities, _ in batch])
+        active_successful = np.concatenate([probabilities >= threshold for _, probabilities, threshold in batch])
+
+        shadow = candidate.probabilities(features)
+        self.scored += len(features)
+        self.disagreements += int(((shadow >= candidate.threshold) != active_successful).sum())
+        self.difference_sum += float(np.abs(shadow - active).sum())
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(SHADOW_INTERVAL)
+            try:
+                self.score()
+            except Exception:
+                logging.exception("Shadow scoring failed")
+
+    def snapshot(self) -> dict:
+        return {
+            "candidate": self.candidate.version if self.candidate is not None else None,
+            "fraction": self.fraction,
+            "sampled_requests": self.sampled,
+            "dropped_requests": self.dropped,
+            "scored_students": self.scored,
+            "disagreements": self.disagreements,
+            "disagreement_rate": round(self.disagreements / self.scored, 4) if self.scored else None,
+            "mean_probability_difference": round(self.difference_sum / self.scored, 4) if self.scored else None,
+        }
+
+
+shadow = Shadow()
@@ -0,0 +1,183 @@
+"""
+Offline training of the success model:
+
+    python -m app.prediction.train [--activate] [--out model.npz] [--horizon-days 90]
+
+Every student gives a sample per month of their history: the features of their marks before the cutoff and,
+as the label, whether the average of their marks over the next --horizon-days reaches SUCCESS_AVERAGE.
+Students are split 80/20 by uuid, so the holdout metrics (printed next to the heuristic's and stored in the
+artifact) are on students the model has not seen. The saved model is then refit on every student and
+published to the model registry, --activate also makes it the active model of the running api processes;
+--out writes the artifact elsewhere instead.
+"""
+from __future__ import annotations
+
+import zlib
+import json
+import asyncio
+import logging
+import argparse
+import datetime
+from uuid import UUID
+from collections import defaultdict
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.queries import ABSENCE_DISCIPLINES
+from ..db.declaration.school import UserClassMark
+from .registry import registry
+from .features import sumsFromArrays, featureMatrix, toDays
+from .heuristic import predictFromMarks
+from .model import Model, fitLogistic
+
+SUCCESS_AVERAGE = 3.5
+HORIZON_DAYS = 90
+# a cutoff is used when the student has this many marks before it and after it, within the horizon
+MIN_HISTORY_MARKS = 10
+MIN_FUTURE_MARKS = 3
+
+
+async def loadMarks(session: AsyncSession) -> dict[UUID, tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """user_uuid -> (is_absence, mark, days) columns of all their marks"""
+    stmt = select(UserClassMark.user_uuid, UserClassMark.discipline, UserClassMark.mark, UserClassMark.created_at)
+    absence_disciplines = set(ABSENCE_DISCIPLINES)
+
+    columns = defaultdict(lambda: ([], [], []))
+    for user_uuid, discipline, mark, created_at in (await session.execute(stmt)).all():
+        is_absence, marks, days = columns[user_uuid]
+        is_absence.append(discipline in absence_disciplines)
+        marks.append(mark)
+        days.append(toDays(created_at))
+
+    return {
+        user_uuid: (np.array(is_absence, dtype=bool), np.array(marks, dtype=float), np.array(days, dtype=float))
+        for user_uuid, (is_absence, marks, days) in columns.items()
+    }
+
+
+def monthStarts(first_day: float, last_day: float) -> list[float]:
+    """first days of the months after first_day up to last_day, as toDays() values"""
+    moment = datetime.datetime.fromtimestamp(first_day * 86400, datetime.timezone.utc)
+    year, month = moment.year, moment.month
+    cutoffs = []
+    while True:
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        day = toDays(datetime.datetime(year, month, 1, tzinfo=datetime.timezone.utc))
+        if day > last_day:
+            return cutoffs
+        cutoffs.append(day)
+
+
+def buildDataset(students: dict, horizon_days: float = HORIZON_DAYS):
+    """
+    features, labels, the student of every sample and the heuristic's answers for it: on the marks, the way
+    the api falls back to it, and on every row absences included, the way the original /predict_success did
+    """
+    sums, labels, groups, heuristic, baseline = [], [], [], [], []
+    for user_uuid, (is_absence, marks, days) in students.items():
+        if not len(days):
+            continue
+
+        for cutoff in monthStarts(days.min(), days.max() - horizon_days):
+            past = days < cutoff
+            past_marks = marks[past & ~is_absence]
+            future_marks = marks[(days >= cutoff) & (days < cutoff + horizon_days) & ~is_absence]
+            if len(past_marks) < MIN_HISTORY_MARKS or len(future_marks) < MIN_FUTURE_MARKS:
+                continue
+
+            sums.append(sumsFromArrays(is_absence[past], marks[past], days[past]))
+            labels.append(future_marks.mean() >= SUCCESS_AVERAGE)
+            groups.append(user_uuid)
+            heuristic.append(predictFromMarks(list(past_marks))["status"] == "успешный")
+            baseline.append(predictFromMarks(list(marks[past]))["status"] == "успешный")
+
+    features = featureMatrix(np.array(sums)) if sums else np.zeros((0, 0))
+    return (
+        features, np.array(labels, dtype=bool), groups, np.array(heuristic, dtype=bool), np.array(baseline, dtype=bool)
+    )
+
+
+def isHoldout(user_uuid: UUID) -> bool:
+    return zlib.crc32(user_uuid.bytes) % 5 == 0
+
+
+def auc(scores: np.ndarray, labels: np.ndarray) -> float:
+    positives, negatives = labels.sum(), (~labels).sum()
+    if not positives or not negatives:
+        return float("nan")
+
+    # rank of every score, tied scores share their average rank
+    _, inverse, counts = np.unique(scores, return_inverse=True, return_counts=True)
+    ranks = (np.cumsum(counts) - (counts - 1) / 2)[inverse]
+    return float((ranks[labels].sum() - positives * (positives + 1) / 2) / (positives * negatives))
+
+
+def evaluate(probabilities: np.ndarray, labels: np.ndarray, threshold: float = 0.5) -> dict:
+    clipped = np.clip(probabilities, 1e-9, 1 - 1e-9)
+    return {
+        "samples": int(len(labels)),
+        "accuracy": float(((probabilities >= threshold) == labels).mean()) if len(labels) else float("nan"),
+        "log_loss": float(-(labels * np.log(clipped) + ~labels * np.log(1 - clipped)).mean()) if len(labels) else float("nan"),
+        "auc": auc(probabilities, labels),
+        "positive_share": float(labels.mean()) if len(labels) else float("nan"),
+    }
+
+
+def train(students: dict, horizon_days: float = HORIZON_DAYS, l2: float = 1.0) -> Model:
+    features, labels, groups, heuristic, baseline = buildDataset(students, horizon_days)
+    if len(labels) == 0 or labels.all() or not labels.any():
+        raise ValueError(f"Not enough data to train: {len(labels)} samples, {int(labels.sum())} successful")
+
+    holdout = np.array([isHoldout(user_uuid) for user_uuid in groups])
+    metrics = {}
+    if holdout.any() and (~holdout).any():
+        model = fitLogistic(features[~holdout], labels[~holdout], l2=l2)
+        metrics["holdout"] = evaluate(model.probabilities(features[holdout]), labels[holdout], model.threshold)
+        metrics["heuristic_holdout"] = evaluate(heuristic[holdout].astype(float), labels[holdout])
+        metrics["baseline_holdout"] = evaluate(baseline[holdout].astype(float), labels[holdout])
+
+    model = fitLogistic(features, labels, l2=l2)
+    model.meta = {
+        "trained_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "students": len(set(groups)),
+        "horizon_days": horizon_days,
+        "success_average": SUCCESS_AVERAGE,
+        "l2": l2,
+        "train": evaluate(model.probabilities(features), labels, model.threshold),
+        **metrics,
+    }
+    return model
+
+
+async def _main():
+    from ..db.engine import async_session_maker
+
+    parser = argparse.ArgumentParser(description="Train the success prediction model on the marks in DB_URL")
+    parser.add_argument("--out", help="artifact to write instead of publishing to the registry")
+    parser.add_argument("--activate", action="store_true", help="make it the active model of the registry")
+    parser.add_argument("--horizon-days", type=float, default=HORIZON_DAYS, help="days after a cutoff the label averages")
+    parser.add_argument("--l2", type=float, default=1.0, help="regularization strength")
+    args = parser.parse_args()
+    if args.out and args.activate:
+        parser.error("--activate makes a registry version active, an artifact written with --out is not in the registry")
+
+    async with async_session_maker() as session:
+        students = await loadMarks(session)
+
+    model = train(students, args.horizon_days, args.l2)
+    if args.out:
+        model.save(args.out)
+        logging.info(f"Model {model.version} saved to {args.out}")
+    else:
+        registry.publish(model)
+        if args.activate:
+            registry.setActive(model.version)
+            logging.info(f"Model {model.version} is active")
+    print(json.dumps({"version": model.version, **model.meta}, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends
 
-from app.routers import user, webhook, school, class_router, mark, teacher
+from app.routers import user, webhook, school, class_router, mark, teacher, journal, admin
 
 api_router = APIRouter()
 
@@ -10,7 +10,9 @@ routers = [
     school.router,
     class_router.router,
     mark.router,
-    teacher.router
+    teacher.router,
+    journal.router,
+    admin.router
 ]
 
 for router in routers:
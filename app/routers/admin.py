@@ -0,0 +1,119 @@
+from __future__ import annotations
+import os
+import hmac
+
+from fastapi import APIRouter
+from fastapi import Response, Request
+
+from .. import prediction
+from ..prediction import ArtifactError
+from ..prediction.cache import prediction_cache
+from ..charts.cache import chart_cache
+
+router = APIRouter(tags=["Admin"], prefix="/admin")
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def _denied(request: Request) -> Response | None:
+    """the admin endpoints answer only with ADMIN_TOKEN set and sent in X-Admin-Token"""
+    if not ADMIN_TOKEN:
+        return Response(status_code=404, content="Admin endpoints are off")
+
+    token = request.headers.get("X-Admin-Token") or ""
+    if not hmac.compare_digest(token, ADMIN_TOKEN):
+        return Response(status_code=403, content="Wrong admin token")
+    return None
+
+
+def _models() -> dict:
+    model = prediction.currentModel()
+    loaded = set(prediction.registry.loaded())
+    return {
+        "active": model.version if model is not None else "heuristic",
+        "pinned": prediction.MODEL_PATH,
+        "registry": prediction.registry.directory,
+        "versions": [
+            {"version": version, "loaded": version in loaded} for version in prediction.registry.versions()
+        ],
+        "shadow": prediction.shadow.snapshot(),
+    }
+
+
+@router.get("/models", responses={403: {}, 404: {}})
+async def getModels(request: Request):
+    """the registry's versions, the active model and the shadow scoring stats"""
+    denied = _denied(request)
+    if denied:
+        return denied
+    return _models()
+
+
+@router.post("/models/{version}/activate", responses={400: {}, 403: {}, 404: {}, 409: {}})
+async def activateModel(version: str, request: Request):
+    """
+    Switches the model every api process predicts with. Requests already scoring finish with the previous one,
+    the other processes follow within PREDICTION_RELOAD_SECONDS
+    """
+    denied = _denied(request)
+    if denied:
+        return denied
+    if prediction.MODEL_PATH:
+        return Response(status_code=409, content=f"PREDICTION_MODEL pins {prediction.MODEL_PATH}")
+
+    try:
+        prediction.activate(version)
+    except FileNotFoundError:
+        return Response(status_code=404, content=f"No model {version} in the registry")
+    except (ArtifactError, KeyError, ValueError, OSError) as e:
+        return Response(status_code=400, content=f"Model {version} is unusable: {e}")
+
+    return _models()
+
+
+@router.post("/models/{version}/shadow", responses={400: {}, 403: {}, 404: {}})
+async def shadowModel(version: str, request: Request, fraction: float = 0.1):
+    """scores the given fraction of the prediction requests with a candidate model too, replacing the previous one"""
+    denied = _denied(request)
+    if denied:
+        return denied
+    if not 0 < fraction <= 1:
+        return Response(status_code=400, content="fraction must be in (0, 1]")
+
+    try:
+        candidate = prediction.registry.get(version)
+    except FileNotFoundError:
+        return Response(status_code=404, content=f"No model {version} in the registry")
+    except (ArtifactError, KeyError, ValueError, OSError) as e:
+        return Response(status_code=400, content=f"Model {version} is unusable: {e}")
+
+    prediction.shadow.stop()
+    prediction.shadow.start(candidate, fraction)
+    return prediction.shadow.snapshot()
+
+
+@router.get("/models/shadow", responses={403: {}, 404: {}})
+async def getShadow(request: Request):
+    denied = _denied(request)
+    if denied:
+        return denied
+    prediction.shadow.score()
+    return prediction.shadow.snapshot()
+
+
+@router.delete("/models/shadow", responses={403: {}, 404: {}})
+async def stopShadow(request: Request):
+    """stops shadow scoring, the answer holds its final stats"""
+    denied = _denied(request)
+    if denied:
+        return denied
+    return prediction.shadow.stop()
+
+
+@router.get("/cache", responses={403: {}, 404: {}})
+async def getCacheStats(request: Request):
+    """lookups and hit rates of the prediction and chart caches since this process started"""
+    denied = _denied(request)
+    if denied:
+        return denied
+    return {"prediction": prediction_cache.stats(), "chart": chart_cache.stats()}
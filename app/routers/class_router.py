@@ -6,7 +6,7 @@ from uuid import UUID
 from typing import Annotated
 import os
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Query
 from fastapi import Response, HTTPException
 from pydantic import BaseModel
 from fastapi import Depends
@@ -14,7 +14,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, text, or_
 from sqlalchemy.orm import selectinload
 
-from ..db import schemas, engine
+from .. import prediction
+from ..db import schemas, engine, queries
 from ..db import declaration
 from ..db.declaration.user import User
 from ..db.declaration.school import School, Class
@@ -40,6 +41,40 @@ async def getClass(
     return Response(status_code=404, content="Class not found")
 
 
+@router.get("/batch", response_model=list[schemas.school.ClassRead], responses={400: {}})
+async def getClassesBatch(
+    uuid: list[UUID] = Query(),
+    session: AsyncSession = Depends(engine.getSession)
+):
+    """classes for many uuids in one request, unknown uuids are left out of the answer"""
+    if len(uuid) > queries.MAX_BATCH_SIZE:
+        return Response(status_code=400, content=f"At most {queries.MAX_BATCH_SIZE} uuids per request")
+
+    result = await session.execute(select(Class).where(Class.uuid.in_(set(uuid))))
+    return result.scalars().all()
+
+
+@router.get("/{uuid}/predictions", responses={400: {}, 404: {}})
+async def getClassPredictions(
+    uuid: UUID,
+    offset: int = 0,
+    limit: int = prediction.PREDICTIONS_PAGE_SIZE,
+    session: AsyncSession = Depends(engine.getSession)
+):
+    """success predictions of every student of the class, riskiest first"""
+    if offset < 0 or not 0 < limit <= queries.MAX_BATCH_SIZE:
+        return Response(
+            status_code=400, content=f"offset must be >= 0 and limit between 1 and {queries.MAX_BATCH_SIZE}"
+        )
+
+    students = (await session.execute(queries.scopeStudents(class_uuid=uuid))).all()
+    if not students and await session.get(Class, uuid) is None:
+        return Response(status_code=404, content="Class not found")
+
+    features = (await session.execute(queries.scopeFeatures(class_uuid=uuid))).all() if students else []
+    return prediction.predictionsPage("class", uuid, students, features, offset, limit)
+
+
 @router.post("", response_model=schemas.school.ClassRead, responses={404: {}})
 async def createClass(
     class_: Annotated[schemas.school.ClassCreate, Depends()],
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import logging
+from uuid import UUID
+
+from fastapi import APIRouter
+from fastapi import Response, Request
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+
+from ..db import engine
+from ..db.declaration.school import School
+from .. import importer
+
+router = APIRouter(tags=["Import"], prefix="/import")
+
+
+@router.post("/journal", responses={404: {}, 400: {}})
+async def importJournal(
+    request: Request,
+    school_uuid: UUID,
+    start_year: int,
+    session: AsyncSession = Depends(engine.getSession)
+):
+    """
+    Imports an electronic journal CSV export sent as the raw request body (Content-Type: text/csv).
+    The body is consumed as a stream, re-sending the same file does not duplicate marks.
+    """
+    school = (await session.execute(select(School).where(School.uuid == school_uuid))).scalars().first()
+    if school is None:
+        return Response(status_code=404, content="School not found")
+    # a block that fails is rolled back, which expires the school loaded in this session
+    facility_name = school.facility_name
+
+    try:
+        report = await importer.importJournal(
+            session,
+            importer.streamBlocks(request.stream()),
+            school_uuid,
+            start_year
+        )
+    except ValueError as e:
+        return Response(status_code=400, content=f"Malformed file: {e}")
+
+    logging.info(f"Journal imported into {facility_name}: {report.asDict() | {'errors': len(report.errors)}}")
+    return report.asDict()
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import json
 import datetime
 import logging
 from uuid import UUID
@@ -7,15 +8,16 @@ from typing import Annotated
 import os
 
 from fastapi import APIRouter
-from fastapi import Response, HTTPException
+from fastapi import Response, HTTPException, Request
 from pydantic import BaseModel
 from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, text, or_
+from sqlalchemy import select, text, or_, insert
 from sqlalchemy.orm import selectinload
 from fastapi import status
+from pydantic import ValidationError
 
-from ..db import schemas, engine
+from ..db import schemas, engine, rollup, queries
 from ..db import declaration
 from ..db.declaration.user import User
 from ..db.declaration.school import School, Class, UserClassMark
@@ -23,6 +25,9 @@ from .user import getUser
 
 router = APIRouter(tags=["Mark"], prefix="/mark")
 
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE") or 1000)
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
 
 @router.get("", response_model=list[schemas.school.UserClassMarkRead], responses={404: {}})
 async def getMarks(
@@ -33,12 +38,7 @@ async def getMarks(
     chat_id = os.getenv("UNIFORM_CHAT_ID")
     if not user_uuid and not chat_id:
         raise ValueError("Provide either user_uuid or chat_id")
-    stmt = select(UserClassMark).join(UserClassMark.user).where(
-        or_(
-            User.uuid == user_uuid if user_uuid else False,
-            User.chat_id == chat_id if chat_id else False
-        )
-    )
+    stmt = queries.userMarks(UserClassMark, user_uuid=user_uuid, chat_id=chat_id)
 
     result = await session.execute(stmt)
     return result.scalars().all()
@@ -51,6 +51,135 @@ async def createMark(
 ):
     new_mark = UserClassMark(**mark_data.model_dump())
     session.add(new_mark)
+    await session.flush()  # fills created_at default
+    await rollup.applyMarks(session, [rollup.markRow(new_mark)])
     await session.commit()
     await session.refresh(new_mark)
-    return new_mark
\ No newline at end of file
+    return new_mark
+
+
+async def _ndjsonLines(request: Request):
+    """yields the lines of the body as they arrive, without buffering the whole stream"""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    yield buffer
+
+
+async def _ndjsonRows(request: Request):
+    """yields (row number, parsed json or the parsing error) from an NDJSON stream, a malformed line never stops it"""
+    row = 0
+    async for line in _ndjsonLines(request):
+        if not line.strip():
+            continue
+        try:
+            yield row, json.loads(line)
+        except ValueError as e:
+            yield row, e
+        row += 1
+
+
+async def _arrayRows(rows: list):
+    """yields (row number, object) from an already parsed JSON array"""
+    for row, obj in enumerate(rows):
+        yield row, obj
+
+
+async def _insertChunk(
+    session: AsyncSession,
+    number: int,
+    chunk: list[tuple[int, object]],
+    result: schemas.school.BulkMarksResult
+):
+    """validates and inserts one chunk in its own transaction"""
+    errors = []
+    valid: list[tuple[int, schemas.school.UserClassMarkCreate]] = []
+    for row, obj in chunk:
+        if isinstance(obj, Exception):
+            errors.append(schemas.school.BulkRowError(row=row, error=f"Invalid JSON: {obj}"))
+            continue
+        try:
+            valid.append((row, schemas.school.UserClassMarkCreate.model_validate(obj)))
+        except ValidationError as e:
+            error = "; ".join(
+                f"{'.'.join(map(str, detail['loc'])) or 'row'}: {detail['msg']}" for detail in e.errors()
+            )
+            errors.append(schemas.school.BulkRowError(row=row, error=error))
+
+    # one lookup per chunk instead of relying on the FK violation that would abort the whole transaction
+    user_uuids = {mark.user_uuid for _, mark in valid}
+    class_uuids = {mark.class_uuid for _, mark in valid}
+    known_users = set((await session.execute(select(User.uuid).where(User.uuid.in_(user_uuids)))).scalars())
+    known_classes = set((await session.execute(select(Class.uuid).where(Class.uuid.in_(class_uuids)))).scalars())
+
+    now = datetime.datetime.utcnow()
+    rows = []
+    for row, mark in valid:
+        if mark.user_uuid not in known_users:
+            errors.append(schemas.school.BulkRowError(row=row, error="User not found"))
+        elif mark.class_uuid not in known_classes:
+            errors.append(schemas.school.BulkRowError(row=row, error="Class not found"))
+        else:
+            rows.append(mark.model_dump() | {"created_at": mark.created_at or now})
+
+    if rows:
+        try:
+            await session.execute(insert(UserClassMark), rows)
+            await rollup.applyMarks(session, rows)
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            logging.exception(f"Bulk marks chunk {number} failed")
+            errors.append(schemas.school.BulkRowError(row=chunk[0][0], error=f"Chunk {number} was not inserted: {e}"))
+            rows = []
+
+    result.chunks.append(schemas.school.BulkChunkResult(
+        chunk=number,
+        received=len(chunk),
+        inserted=len(rows),
+        rejected=len(chunk) - len(rows)
+    ))
+    result.inserted += len(rows)
+    result.rejected += len(chunk) - len(rows)
+    result.errors.extend(sorted(errors, key=lambda error: error.row))
+
+
+@router.post("/bulk", response_model=schemas.school.BulkMarksResult)
+async def createMarksBulk(
+    request: Request,
+    session: AsyncSession = Depends(engine.getSession)
+):
+    """
+    Accepts a JSON array of marks or an NDJSON stream (Content-Type: application/x-ndjson).
+    Rows are validated and inserted in chunks of BULK_CHUNK_SIZE, each chunk is its own transaction,
+    so a bad chunk does not roll back the ones before it.
+    A malformed NDJSON line is reported in errors like an invalid row. A JSON array is parsed whole before
+    the first chunk, so a body that does not parse is rejected with 400 and nothing is inserted.
+    """
+    if request.headers.get("content-type", "").split(";")[0].strip() in NDJSON_CONTENT_TYPES:
+        rows = _ndjsonRows(request)
+    else:
+        try:
+            body = json.loads(await request.body())
+        except ValueError as e:
+            return Response(status_code=400, content=f"Malformed body: {e}")
+        if not isinstance(body, list):
+            return Response(status_code=400, content="Malformed body: expected a JSON array of marks")
+        rows = _arrayRows(body)
+
+    result = schemas.school.BulkMarksResult()
+
+    chunk = []
+    async for row in rows:
+        chunk.append(row)
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            await _insertChunk(session, len(result.chunks), chunk, result)
+            chunk = []
+
+    if chunk:
+        await _insertChunk(session, len(result.chunks), chunk, result)
+
+    return result
@@ -6,7 +6,7 @@ from uuid import UUID
 from typing import Annotated
 import os
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Query
 from fastapi import Response, HTTPException
 from pydantic import BaseModel
 from fastapi import Depends
@@ -14,7 +14,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, text, or_
 from sqlalchemy.orm import selectinload
 
-from ..db import schemas, engine
+from .. import prediction
+from ..db import schemas, engine, queries
 from ..db import declaration
 from ..db.declaration.user import User
 from ..db.declaration.school import School, Class
@@ -48,6 +49,40 @@ async def getSchool(
     return Response(status_code=404, content="School not found")
 
 
+@router.get("/batch", response_model=list[schemas.school.SchoolRead], responses={400: {}})
+async def getSchoolsBatch(
+    uuid: list[UUID] = Query(),
+    session: AsyncSession = Depends(engine.getSession)
+):
+    """schools for many uuids in one request, unknown uuids are left out of the answer"""
+    if len(uuid) > queries.MAX_BATCH_SIZE:
+        return Response(status_code=400, content=f"At most {queries.MAX_BATCH_SIZE} uuids per request")
+
+    result = await session.execute(select(School).where(School.uuid.in_(set(uuid))))
+    return result.scalars().all()
+
+
+@router.get("/{uuid}/predictions", responses={400: {}, 404: {}})
+async def getSchoolPredictions(
+    uuid: UUID,
+    offset: int = 0,
+    limit: int = prediction.PREDICTIONS_PAGE_SIZE,
+    session: AsyncSession = Depends(engine.getSession)
+):
+    """success predictions of every student of the school, riskiest first"""
+    if offset < 0 or not 0 < limit <= queries.MAX_BATCH_SIZE:
+        return Response(
+            status_code=400, content=f"offset must be >= 0 and limit between 1 and {queries.MAX_BATCH_SIZE}"
+        )
+
+    students = (await session.execute(queries.scopeStudents(school_uuid=uuid))).all()
+    if not students and await session.get(School, uuid) is None:
+        return Response(status_code=404, content="School not found")
+
+    features = (await session.execute(queries.scopeFeatures(school_uuid=uuid))).all() if students else []
+    return prediction.predictionsPage("school", uuid, students, features, offset, limit)
+
+
 @router.post("", response_model=schemas.school.SchoolRead, responses={404: {}})
 async def createSchool(
     school: Annotated[schemas.school.SchoolCreate, Depends()],
@@ -1,24 +1,30 @@
 from __future__ import annotations
 
+import base64
+import asyncio
 import datetime
 import logging
-from uuid import UUID
+from uuid import UUID, uuid4
 from typing import Annotated
 import os
 from collections import defaultdict
 from io import BytesIO
 
-import matplotlib.dates as mdates
-import matplotlib.pyplot as plt
+import numpy as np
+
 from fastapi import APIRouter, Query
-from fastapi import Response, HTTPException
+from fastapi import Response, HTTPException, Request
 from pydantic import BaseModel
 from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, text, or_, not_, and_
 
-from ..db.declaration.school import UserClassMark
-from ..db import schemas, engine
+from .. import charts
+from ..charts.cache import cachedUserChart, chart_cache, chartKey, etagFor
+from ..db.declaration.school import UserMonthlyStat
+from ..db import schemas, engine, queries, versions, rollup
+from .. import prediction
+from ..prediction.cache import cachedPrediction
 from ..db import declaration
 from ..db.declaration.school import Class
 from ..db.declaration.user import User
@@ -72,6 +78,36 @@ async def createUser(
     return new_user
 
 
+@router.post("/ensure", response_model=schemas.user.UserRead, responses={400: {}})
+async def ensureUser(
+    user: Annotated[schemas.user.UserCreate, Depends()],
+    session: AsyncSession = Depends(engine.getSession)
+):
+    """
+    get-or-create by chat_id in one round trip, used by the bot when the user is not in its identity cache.
+    Safe to call concurrently: the unique index on chat_id settles the race, the loser reads the winner's row
+    """
+    uniform_chat_id = os.getenv("UNIFORM_CHAT_ID")
+    chat_id = int(uniform_chat_id) if uniform_chat_id else user.chat_id
+    if chat_id is None:
+        return Response(status_code=400, content="Missing chat_id")
+
+    query = select(User).where(User.chat_id == chat_id)
+    existing = (await session.execute(query)).scalars().first()
+    if existing is not None:
+        return existing
+
+    values = user.model_dump(exclude_unset=False) | {"uuid": uuid4(), "chat_id": chat_id}
+    await session.execute(
+        rollup.dialectInsert(session, User.__table__).values(values).on_conflict_do_nothing(
+            index_elements=[User.chat_id]
+        )
+    )
+    await session.commit()
+
+    return (await session.execute(query)).scalars().one()
+
+
 @router.get("/class", response_model=schemas.school.ClassRead, responses={404: {}})
 async def getUserClass(
     user_uuid: UUID = None,
@@ -112,63 +148,54 @@ async def predict_success(
     if not user_uuid and not chat_id:
         return {"error": "user_uuid or chat_id is required"}
 
-    stmt = select(UserClassMark.mark).join(User).where(
-        or_(
-            User.uuid == user_uuid if user_uuid else False,
-            User.chat_id == chat_id if chat_id else False
-        )
+    resolved = await versions.getUserVersion(session, user_uuid=user_uuid, chat_id=chat_id)
+    if resolved is None:
+        return prediction.predictStored(())
+
+    resolved_uuid, version = resolved
+    return await cachedPrediction(session, resolved_uuid, version)
+
+
+def progressionChart(series: dict) -> charts.LineChart:
+    return charts.LineChart(
+        title="Средняя Оценка за Месяц для Каждого Предмета",
+        xlabel="Месяц",
+        ylabel="Средняя Оценка",
+        series=series
     )
 
-    result = await session.execute(stmt)
-    marks = result.scalars().all()
 
-    if not marks:
-        return {
-            "status": "unknown",
-            "confidence": 0.0,
-            "message": "У ученика нет оценок, невозможно сделать прогноз."
-        }
+def accumulatedChart(series: dict) -> charts.LineChart:
+    return charts.LineChart(
+        title="Кумулятивные Средние Оценки для Каждого Предмета",
+        xlabel="Month",
+        ylabel="Кумулятивная Средняя Оценка",
+        series=series
+    )
+
 
-    total = len(marks)
-    bad_count = sum(1 for m in marks if m <= 3)
-    avg = sum(marks) / total
-    bad_ratio = bad_count / total
-
-    if avg >= 4.5 and bad_count == 0:
-        status = "успешный"
-        confidence = 0.95
-    elif avg >= 4.0 and bad_ratio <= 0.1:
-        status = "успешный"
-        confidence = 0.9
-    elif avg >= 3.5 and bad_ratio <= 0.25:
-        status = "успешный"
-        confidence = 0.85
-    elif avg >= 3.0:
-        status = "неуспешный"
-        confidence = 0.4
-    else:
-        status = "неуспешный"
-        confidence = 0.2
-
-    message = (
-        f"Средний балл: {avg:.2f}, оценок всего: {total}, "
-        f"из них троек и ниже: {bad_count} ({bad_ratio:.0%})"
+def subjectAveragesChart(subjects: list[str], averages: list[float]) -> charts.BarChart:
+    return charts.BarChart(
+        title="Средняя оценка по каждому предмету",
+        ylabel="Средняя оценка",
+        labels=subjects,
+        values=averages,
+        ylim=(1, 5.5)
     )
 
-    if status == "успешный":
-        message += "\n\n🎯 У тебя отличная успеваемость, попробуй свои силы в олимпиадах!"
 
-    return {
-        "status": status,
-        "confidence": round(confidence, 2),
-        "total_marks": total,
-        "bad_marks": bad_count,
-        "message": message
-    }
+def absencesChart(series: dict) -> charts.LineChart:
+    return charts.LineChart(
+        title="Пропуски по месяцам",
+        xlabel="Month",
+        ylabel="Average Absence Value",
+        series=series
+    )
 
 
 @router.get("/plot_progression", response_class=Response)
 async def plot_user_progression(
+    request: Request,
     user_uuid: UUID = Query(default=None),
     chat_id: int = Query(default=None),
     session: AsyncSession = Depends(engine.getSession)
@@ -178,175 +205,125 @@ async def plot_user_progression(
     if not user_uuid and not chat_id:
         return Response(status_code=400, content="Provide user_uuid or chat_id")
 
-    stmt = (
-        select(UserClassMark.discipline, UserClassMark.mark, UserClassMark.created_at)
-        .join(UserClassMark.user)
-        .where(
-            or_(
-                User.uuid == user_uuid if user_uuid else False,
-                User.chat_id == chat_id if chat_id else False
-            )
-        )
+    return await cachedUserChart(
+        request, session, "progression", user_uuid, chat_id,
+        lambda: _plotProgression(session, user_uuid, chat_id)
+    )
+
+
+def _monthlySeries(rows) -> tuple[dict, dict]:
+    """
+    queries.monthlyPoints() rows as monthly and cumulative chart series: subject -> ([first day of month], [average])
+    """
+    monthly = defaultdict(lambda: ([], []))
+    cumulative = defaultdict(lambda: ([], []))
+    for row in rows:
+        month = datetime.datetime(row.year, row.month, 1)
+        monthly[row.discipline][0].append(month)
+        monthly[row.discipline][1].append(float(row.average))
+        cumulative[row.discipline][0].append(month)
+        cumulative[row.discipline][1].append(float(row.cumulative_average))
+
+    return dict(monthly), dict(cumulative)
+
+
+async def _progressionPoints(
+    session: AsyncSession,
+    user_uuid: UUID | None,
+    chat_id: int | None
+) -> tuple[dict, dict]:
+    """
+    monthly and cumulative averages per subject as chart series: subject -> ([first day of month], [average]).
+    Read from the monthly rollup, averaging is done in sql.
+    """
+    stmt = queries.monthlyPoints(
+        user_uuid=user_uuid, chat_id=chat_id, excluded_disciplines=queries.ABSENCE_DISCIPLINES
     )
     result = await session.execute(stmt)
-    data = result.all()
 
-    if not data:
-        return Response(status_code=404, content="No marks found for this user")
+    return _monthlySeries(result.all())
 
-    from collections import defaultdict
-    import matplotlib.pyplot as plt
-    import matplotlib.dates as mdates
-    from io import BytesIO
-    import datetime
 
-    # Step 1: Filter and group by subject and (year, month)
-    excluded_subjects = {
-        "Пропуск по уважительной причине",
-        "Пропуск без уважительной причины",
-        "Пропуск по болезни"
+async def _absencePoints(session: AsyncSession, user_uuid: UUID | None, chat_id: int | None) -> dict:
+    """monthly average of every absence type as chart series, from the same rollup as the progression"""
+    stmt = queries.monthlyPoints(
+        user_uuid=user_uuid, chat_id=chat_id, disciplines=queries.ABSENCE_DISCIPLINES
+    )
+    result = await session.execute(stmt)
+
+    monthly, _ = _monthlySeries(result.all())
+    return monthly
+
+
+@router.get("/progression")
+async def get_user_progression(
+    user_uuid: UUID = Query(default=None),
+    chat_id: int = Query(default=None),
+    session: AsyncSession = Depends(engine.getSession)
+):
+    """the data behind /plot_progression and /plot_accumulated"""
+    chat_id = os.getenv("UNIFORM_CHAT_ID")
+
+    if not user_uuid and not chat_id:
+        return Response(status_code=400, content="Provide user_uuid or chat_id")
+
+    monthly, cumulative = await _progressionPoints(session, user_uuid, chat_id)
+
+    def asJson(points: dict) -> dict:
+        return {
+            subject: [{"month": month.strftime("%Y-%m"), "average": round(avg, 4)} for month, avg in zip(x, y)]
+            for subject, (x, y) in points.items()
+        }
+
+    return {
+        "monthly": asJson(monthly),
+        "accumulated": asJson(cumulative)
     }
 
-    subject_monthly_avg = defaultdict(lambda: defaultdict(list))
-    for discipline, mark, created_at in data:
-        if not created_at or discipline in excluded_subjects:
-            continue
-        year = created_at.year
-        month = created_at.month
-        subject_monthly_avg[discipline][(year, month)].append(mark)
-
-    subject_points = {}
-    for subject, month_dict in subject_monthly_avg.items():
-        month_avg_list = []
-        for (year, month), marks in month_dict.items():
-            avg = sum(marks) / len(marks)
-            month_avg_list.append((year, month, avg))
-        subject_points[subject] = sorted(month_avg_list, key=lambda x: (x[0], x[1]))
-
-    if not subject_points:
-        return Response(status_code=404, content="No valid subjects to plot")
-
-    all_months = sorted({(y, m) for pts in subject_points.values() for (y, m, _) in pts})
-
-    plt.figure(figsize=(10, 6))
-    for subject, records in subject_points.items():
-        x = [datetime.datetime(y, m, 1) for (y, m, _) in records]
-        y = [mark for (_, _, mark) in records]
-        plt.plot(x, y, marker='o', label=subject)
-
-    plt.xlabel("Месяц")
-    plt.ylabel("Средняя Оценка")
-    plt.title("Средняя Оценка за Месяц для Каждого Предмета")
-    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m"))
-    plt.gca().xaxis.set_major_locator(mdates.MonthLocator(interval=1))
-    plt.xticks(rotation=45)
-    plt.legend(loc='center left', bbox_to_anchor=(1, 0.5))
-    plt.grid(True)
-    plt.tight_layout()
-
-    buf = BytesIO()
-    plt.savefig(buf, format="png")
-    plt.close()
-    buf.seek(0)
-    return Response(content=buf.read(), media_type="image/png")
+
+async def _plotProgression(session: AsyncSession, user_uuid: UUID | None, chat_id: int | None) -> Response:
+    monthly, _ = await _progressionPoints(session, user_uuid, chat_id)
+
+    if not monthly:
+        return Response(status_code=404, content="No marks found for this user")
+
+    png = await charts.render(progressionChart(monthly))
+    return Response(content=png, media_type="image/png")
 
 
 
 @router.get("/plot_accumulated", response_class=Response)
 async def plot_user_progression_accumulated(
+    request: Request,
     user_uuid: UUID = Query(default=None),
     chat_id: int = Query(default=None),
     session: AsyncSession = Depends(engine.getSession)
 ):
-    import os
-    from collections import defaultdict
-    import matplotlib.pyplot as plt
-    import matplotlib.dates as mdates
-    from io import BytesIO
-    import datetime
-
     chat_id = os.getenv("UNIFORM_CHAT_ID")
 
     if not user_uuid and not chat_id:
         return Response(status_code=400, content="Provide user_uuid or chat_id")
 
-    excluded_disciplines = {
-        "Пропуск по уважительной причине",
-        "Пропуск без уважительной причины",
-        "Пропуск по болезни"
-    }
-
-    stmt = (
-        select(UserClassMark.discipline, UserClassMark.mark, UserClassMark.created_at)
-        .join(UserClassMark.user)
-        .where(
-            and_(
-                UserClassMark.discipline.notin_(excluded_disciplines),
-                or_(
-                    User.uuid == user_uuid if user_uuid else False,
-                    User.chat_id == chat_id if chat_id else False
-                )
-            )
-        )
+    return await cachedUserChart(
+        request, session, "accumulated", user_uuid, chat_id,
+        lambda: _plotAccumulated(session, user_uuid, chat_id)
     )
-    result = await session.execute(stmt)
-    data = result.all()
 
-    if not data:
+
+async def _plotAccumulated(session: AsyncSession, user_uuid: UUID | None, chat_id: int | None) -> Response:
+    _, cumulative = await _progressionPoints(session, user_uuid, chat_id)
+
+    if not cumulative:
         return Response(status_code=404, content="No marks found for this user")
 
-    # Step 1: group marks by subject and (year, month)
-    subject_monthly_marks = defaultdict(lambda: defaultdict(list))
-    for discipline, mark, created_at in data:
-        if not created_at:
-            continue
-        key = (created_at.year, created_at.month)
-        subject_monthly_marks[discipline][key].append(mark)
-
-    # Step 2: Compute cumulative average for each subject
-    subject_cumulative_points = {}
-    for subject, month_dict in subject_monthly_marks.items():
-        all_keys = sorted(month_dict.keys())
-        cumulative_marks = []
-        x_labels = []
-        total_sum = 0
-        total_count = 0
-
-        for (year, month) in all_keys:
-            marks = month_dict[(year, month)]
-            total_sum += sum(marks)
-            total_count += len(marks)
-            avg = total_sum / total_count
-            cumulative_marks.append(avg)
-            x_labels.append(datetime.datetime(year, month, 1))
-
-        subject_cumulative_points[subject] = (x_labels, cumulative_marks)
-
-    # Step 3: Plot
-    plt.figure(figsize=(10, 6))
-    for subject, (x, y) in subject_cumulative_points.items():
-        plt.plot(x, y, marker='o', label=subject)
-
-    plt.xlabel("Month")
-    plt.ylabel("Кумулятивная Средняя Оценка")
-    plt.title("Кумулятивные Средние Оценки для Каждого Предмета")
-    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m"))
-    plt.gca().xaxis.set_major_locator(mdates.MonthLocator(interval=1))
-    plt.xticks(rotation=45)
-    plt.legend(loc='center left', bbox_to_anchor=(1, 0.5))
-    plt.grid(True)
-    plt.tight_layout()
-
-    buf = BytesIO()
-    plt.savefig(buf, format="png")
-    plt.close()
-    buf.seek(0)
-    return Response(content=buf.read(), media_type="image/png")
+    png = await charts.render(accumulatedChart(cumulative))
+    return Response(content=png, media_type="image/png")
 
 
 
 @router.get("/plot_subject_averages", response_class=Response)
 async def plot_subject_averages(
+    request: Request,
     user_uuid: UUID = Query(default=None),
     chat_id: int = Query(default=None),
     session: AsyncSession = Depends(engine.getSession)
@@ -356,64 +333,37 @@ async def plot_subject_averages(
     if not user_uuid and not chat_id:
         return Response(status_code=400, content="Provide user_uuid or chat_id")
 
+    return await cachedUserChart(
+        request, session, "subject_averages", user_uuid, chat_id,
+        lambda: _plotSubjectAverages(session, user_uuid, chat_id)
+    )
+
+
+async def _plotSubjectAverages(session: AsyncSession, user_uuid: UUID | None, chat_id: int | None) -> Response:
     excluded_disciplines = {
         "Пропуск по уважительной причине",
         "Пропуск без уважительной причины",
         "Пропуск по болезни"
     }
 
-    stmt = (
-        select(UserClassMark.discipline, UserClassMark.mark)
-        .join(UserClassMark.user)
-        .where(
-            and_(
-                UserClassMark.discipline.notin_(excluded_disciplines),
-                or_(
-                    User.uuid == user_uuid if user_uuid else False,
-                    User.chat_id == chat_id if chat_id else False
-                )
-            )
-        )
-    )
+    stmt = queries.subjectAverages(user_uuid=user_uuid, chat_id=chat_id, excluded_disciplines=excluded_disciplines)
     result = await session.execute(stmt)
     data = result.all()
 
     if not data:
         return Response(status_code=404, content="No marks found for this user")
 
-    from collections import defaultdict
-    import matplotlib.pyplot as plt
-    from io import BytesIO
+    subjects = [discipline for discipline, _ in data]
+    averages = [float(average) for _, average in data]
 
-    subject_marks = defaultdict(list)
-    for discipline, mark in data:
-        subject_marks[discipline].append(mark)
-
-    subjects = list(subject_marks.keys())
-    averages = [sum(marks) / len(marks) for marks in subject_marks.values()]
-
-    plt.figure(figsize=(10, 6))
-    bars = plt.bar(subjects, averages)
-    plt.ylabel("Средняя оценка")
-    plt.title("Средняя оценка по каждому предмету")
-    plt.ylim(1, 5.5)
-    plt.xticks(rotation=45)
-    plt.grid(axis='y')
-
-    for bar, avg in zip(bars, averages):
-        plt.text(bar.get_x() + bar.get_width() / 2, bar.get_height() + 0.1, f"{avg:.1f}", ha='center', va='bottom')
-
-    plt.tight_layout()
-    buf = BytesIO()
-    plt.savefig(buf, format="png")
-    plt.close()
-    buf.seek(0)
-    return Response(content=buf.read(), media_type="image/png")
+    png = await charts.render(subjectAveragesChart(subjects, averages))
+    return Response(content=png, media_type="image/png")
 
 
 
 @router.get("/plot_absences", response_class=Response)
 async def plot_user_absences(
+    request: Request,
     user_uuid: UUID = Query(default=None),
     chat_id: int = Query(default=None),
     session: AsyncSession = Depends(engine.getSession)
@@ -423,73 +373,120 @@ async def plot_user_absences(
     if not user_uuid and not chat_id:
         return Response(status_code=400, content="Provide user_uuid or chat_id")
 
-    # Только пропуски
-    ABSENCE_DISCIPLINES = {
-        "Пропуск по уважительной причине",
-        "Пропуск без уважительной причины",
-        "Пропуск по болезни"
-    }
-
-    stmt = (
-        select(UserClassMark.discipline, UserClassMark.mark, UserClassMark.created_at)
-        .join(UserClassMark.user)
-        .where(
-            and_(
-                UserClassMark.discipline.in_(ABSENCE_DISCIPLINES),
-                or_(
-                    User.uuid == user_uuid if user_uuid else False,
-                    User.chat_id == chat_id if chat_id else False
-                )
-            )
-        )
+    return await cachedUserChart(
+        request, session, "absences", user_uuid, chat_id,
+        lambda: _plotAbsences(session, user_uuid, chat_id)
     )
-    result = await session.execute(stmt)
-    data = result.all()
 
-    if not data:
+
+async def _plotAbsences(session: AsyncSession, user_uuid: UUID | None, chat_id: int | None) -> Response:
+    absences = await _absencePoints(session, user_uuid, chat_id)
+
+    if not absences:
         return Response(status_code=404, content="No absences found for this user")
 
-    from collections import defaultdict
-    import matplotlib.pyplot as plt
-    import matplotlib.dates as mdates
-    from io import BytesIO
-    import datetime
-
-    # Step 1: Group by subject → (year, month) → list of marks
-    subject_monthly = defaultdict(lambda: defaultdict(list))
-    for discipline, mark, created_at in data:
-        if not created_at:
-            continue
-        year, month = created_at.year, created_at.month
-        subject_monthly[discipline][(year, month)].append(mark)
-
-    subject_points = {}
-    for subject, month_dict in subject_monthly.items():
-        points = []
-        for (y, m), marks in month_dict.items():
-            avg = sum(marks) / len(marks)
-            points.append((y, m, avg))
-        subject_points[subject] = sorted(points)
-
-    # Step 2: Plot
-    plt.figure(figsize=(10, 6))
-    for subject, records in subject_points.items():
-        x = [datetime.datetime(y, m, 1) for (y, m, _) in records]
-        y = [val for (_, _, val) in records]
-        plt.plot(x, y, marker='o', label=subject)
-
-    plt.xlabel("Month")
-    plt.ylabel("Average Absence Value")
-    plt.title("Пропуски по месяцам")
-    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m"))
-    plt.gca().xaxis.set_major_locator(mdates.MonthLocator(interval=1))
-    plt.xticks(rotation=45)
-    plt.legend(loc='center left', bbox_to_anchor=(1, 0.5))
-    plt.grid(True)
-    plt.tight_layout()
-
-    buf = BytesIO()
-    plt.savefig(buf, format="png")
-    plt.close()
-    buf.seek(0)
-    return Response(content=buf.read(), media_type="image/png")
+    png = await charts.render(absencesChart(absences))
+    return Response(content=png, media_type="image/png")
+
+
+
+DASHBOARD_CHARTS = ("subject_averages", "absences", "progression", "accumulated")
+
+
+def _dashboardData(features: list, monthly: dict, cumulative: dict, absences: dict) -> tuple[dict, dict]:
+    """summary and chart specs from the student's feature store rows and the series the /plot_* endpoints draw"""
+    absence_disciplines = set(queries.ABSENCE_DISCIPLINES)
+    column = {name: i for i, name in enumerate(prediction.FEATURE_NAMES)}
+
+    summary = {"subjects": [], "absences": []}
+    subjects = [row for row in features if row.discipline not in absence_disciplines and row.marks_count]
+    derived = prediction.disciplineFeatures(np.array([row[1:] for row in subjects], dtype=float)) if subjects else []
+    for row, discipline_features in zip(subjects, derived):
+        summary["subjects"].append({
+            "discipline": row.discipline,
+            "average_mark": row.marks_sum / row.marks_count,
+            "recent_average": float(discipline_features[column["ewma"]]),
+            "trend": float(discipline_features[column["slope"]]),
+            "marks_count": row.marks_count,
+        })
+    for row in features:
+        if row.discipline in absence_disciplines and row.marks_count:
+            summary["absences"].append({"discipline": row.discipline, "absences_count": row.marks_count})
+
+    specs = {
+        "subject_averages": subjectAveragesChart(
+            [subject["discipline"] for subject in summary["subjects"]],
+            [subject["average_mark"] for subject in summary["subjects"]]
+        ) if summary["subjects"] else None,
+        "absences": absencesChart(absences) if absences else None,
+        "progression": progressionChart(monthly) if monthly else None,
+        "accumulated": accumulatedChart(cumulative) if cumulative else None,
+    }
+
+    return summary, specs
+
+
+@router.get("/dashboard", responses={404: {}})
+async def get_dashboard(
+    user_uuid: UUID = Query(default=None),
+    chat_id: int = Query(default=None),
+    requested_charts: list[str] = Query(default=list(DASHBOARD_CHARTS), alias="charts"),
+    session: AsyncSession = Depends(engine.getSession)
+):
+    """
+    The marks summary, the prediction and the requested charts of a student, computed from their feature store
+    rows and the same monthly rollup queries the /plot_* endpoints use. The bot makes one call for the text
+    (charts= empty) and one call per chart, all at once, so the text does not wait for the rendering and a slow
+    or failed chart does not hold back the others. Charts come base64 encoded together with their ETags and are
+    shared with the /plot_* endpoints through the chart cache. A chart without data is null.
+    """
+    chat_id = os.getenv("UNIFORM_CHAT_ID")
+
+    if not user_uuid and not chat_id:
+        return Response(status_code=400, content="Provide user_uuid or chat_id")
+
+    unknown = set(requested_charts) - set(DASHBOARD_CHARTS) - {""}
+    if unknown:
+        return Response(status_code=400, content=f"Unknown charts: {', '.join(sorted(unknown))}")
+
+    resolved = await versions.getUserVersion(session, user_uuid=user_uuid, chat_id=chat_id)
+    if resolved is None:
+        return Response(status_code=404, content="User not found")
+    resolved_uuid, version = resolved
+
+    features = (await session.execute(queries.userFeatures(user_uuid=resolved_uuid))).all()
+    monthly, cumulative = await _progressionPoints(session, resolved_uuid, None)
+    absences = await _absencePoints(session, resolved_uuid, None)
+    summary, specs = _dashboardData(features, monthly, cumulative, absences)
+
+    images = {}
+    to_render = {}
+    for chart in dict.fromkeys(chart for chart in requested_charts if chart):
+        key = chartKey(resolved_uuid, chart, version)
+        png = await chart_cache.get(key)
+        if png is not None:
+            images[chart] = (key, png)
+        elif specs[chart] is not None:
+            to_render[chart] = key
+        else:
+            images[chart] = None
+
+    rendered = await asyncio.gather(*(charts.render(specs[chart]) for chart in to_render))
+    for (chart, key), png in zip(to_render.items(), rendered):
+        await chart_cache.set(key, png)
+        images[chart] = (key, png)
+
+    return {
+        "user_uuid": str(resolved_uuid),
+        "version": version,
+        "summary": summary,
+        "prediction": await cachedPrediction(session, resolved_uuid, version, features),
+        "charts": {
+            chart: {
+                "etag": etagFor(image[0]),
+                "media_type": "image/png",
+                "data": base64.b64encode(image[1]).decode()
+            } if image else None
+            for chart, image in images.items()
+        }
+    }
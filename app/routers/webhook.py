@@ -1,5 +1,6 @@
 from __future__ import annotations
 import os
+import hmac
 import logging
 import datetime
 
@@ -15,3 +16,28 @@ logging.info(f"Initializing hidden router for webhooks: {router.prefix}. ({__fil
 async def dockerHealthCheck():
     return Response(status_code=200)
 
+
+
+@router.post("/telegram", responses={403: {}, 404: {}})
+async def telegramUpdate(request: Request):
+    """
+    Telegram updates in BOT_UPDATES=webhook mode. The update is handed to the bot's dispatcher (or queued
+    for the bot workers with UPDATE_QUEUE=redis) and acknowledged right away, so a slow handler never makes
+    Telegram wait or retry
+    """
+    if os.getenv("BOT_UPDATES") != "webhook":
+        return Response(status_code=404, content="Webhook mode is off")
+
+    from tg_bot import dispatcher
+
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token") or ""
+    if dispatcher.WEBHOOK_SECRET and not hmac.compare_digest(secret, dispatcher.WEBHOOK_SECRET):
+        return Response(status_code=403, content="Wrong secret token")
+
+    try:
+        await dispatcher.acceptUpdate(await request.json())
+    except ValueError as e:
+        # pydantic's ValidationError is a ValueError too; answering 200 would make Telegram drop it anyway
+        return Response(status_code=400, content=f"Malformed update: {e}")
+
+    return Response(status_code=200)
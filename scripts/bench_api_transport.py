@@ -0,0 +1,169 @@
+"""
+Per-command latency of the bot handlers with the api behind HTTP and with API_TRANSPORT=asgi.
+
+A copy of example.db is served by uvicorn on a free local port for the http mode. Each mode runs in its
+own process that imports tg_bot.config the way the bot does, so the asgi run goes through the in-process
+transport and the api lifespan from config.apiLifespan(). /my_grades, /analysis and /statistics are
+called directly (no Telegram, replies are only recorded) for a student of the example data.
+The first ROUNDS_WARMUP rounds fill the chart cache and are not counted.
+
+Needs the api requirements (app/requirements.txt) and uvicorn. Run from the repository root:
+    python scripts/bench_api_transport.py [--rounds 30]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+from types import SimpleNamespace
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SCRIPT_DIR)
+sys.path.append(REPO_DIR)
+
+ROUNDS_WARMUP = 3
+# a student with marks in example.db, every user lookup of the api resolves to it
+CHAT_ID = "10000"
+
+
+class RecordingMessage:
+    def __init__(self):
+        self.chat = SimpleNamespace(id=int(CHAT_ID))
+        self.bot = SimpleNamespace(id=1)
+        self.sent = 0
+
+    async def answer(self, text: str, **kwargs):
+        self.sent += 1
+
+    async def answer_photo(self, photo, **kwargs):
+        self.sent += 1
+        return SimpleNamespace(photo=[])
+
+    async def answer_media_group(self, media: list, **kwargs):
+        self.sent += 1
+        return [SimpleNamespace(photo=[]) for _ in media]
+
+
+async def measureMode(rounds: int) -> dict:
+    from tg_bot.config import apiLifespan
+    from tg_bot.routers.user import welcome
+
+    commands = {
+        "/my_grades": welcome.showMyGrades,
+        "/analysis": welcome.show_prediction,
+        "/statistics": welcome.showStatistics,
+    }
+    timings = {command: [] for command in commands}
+
+    async with apiLifespan():
+        for round_ in range(ROUNDS_WARMUP + rounds):
+            for command, handler in commands.items():
+                msg = RecordingMessage()
+                started = time.perf_counter()
+                # __wrapped__ skips updateUserDecorator, the identity cache is not what is measured here
+                await handler.__wrapped__(msg, None)
+                if round_ >= ROUNDS_WARMUP:
+                    timings[command].append(time.perf_counter() - started)
+
+    return timings
+
+
+def p90(values: list[float]) -> float:
+    return sorted(values)[int(len(values) * 0.9) - 1]
+
+
+def freePort() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def startApi(env: dict) -> subprocess.Popen:
+    api = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "fastapi_app:app",
+            "--app-dir", os.path.join(REPO_DIR, "app"),
+            "--port", env["API_PORT"],
+            "--log-level", "warning",
+        ],
+        cwd=REPO_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    import httpx
+    for _ in range(300):
+        try:
+            if httpx.get(f"http://127.0.0.1:{env['API_PORT']}/webhook/healthcheck").status_code == 200:
+                return api
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+
+    api.kill()
+    raise RuntimeError("api did not start")
+
+
+def runMode(mode: str, env: dict, rounds: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, "--mode", mode, "--rounds", str(rounds)],
+        cwd=REPO_DIR,
+        env=env | {"API_TRANSPORT": mode},
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--mode", choices=["http", "asgi"])
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(asyncio.run(measureMode(args.rounds))))
+        return 0
+
+    workdir = tempfile.mkdtemp()
+    shutil.copy(os.path.join(REPO_DIR, "example.db"), os.path.join(workdir, "bench.db"))
+    env = os.environ | {
+        "DB_URL": f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}",
+        "UNIFORM_CHAT_ID": CHAT_ID,
+        "API_PORT": str(freePort()),
+        "BOT_TOKEN": os.getenv("BOT_TOKEN") or "123456:bench",
+        "REDIS_URL": os.getenv("REDIS_URL") or "redis://127.0.0.1:1",
+        "PYTHONPATH": REPO_DIR,
+    }
+
+    api = startApi(env)
+    try:
+        results = {
+            "http": runMode("http", env | {"API_HOST": "127.0.0.1"}, args.rounds),
+            "asgi": runMode("asgi", env, args.rounds),
+        }
+    finally:
+        api.terminate()
+        api.wait()
+
+    print(f"{'command':<12} {'http p50':>9} {'asgi p50':>9} {'http p90':>9} {'asgi p90':>9}")
+    for command in results["http"]:
+        http, asgi = results["http"][command], results["asgi"][command]
+        print(
+            f"{command:<12} {statistics.median(http) * 1000:>7.1f}ms {statistics.median(asgi) * 1000:>7.1f}ms "
+            f"{p90(http) * 1000:>7.1f}ms {p90(asgi) * 1000:>7.1f}ms"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Shows that /teacher/plot_avg_distribution issues a constant number of queries no matter how many classes exist.
+
+Run from the repository root:
+    python scripts/bench_avg_distribution.py
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import tempfile
+from datetime import datetime, timedelta
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["DB_URL"] = f"sqlite+aiosqlite:///{DB_PATH}"
+
+from sqlalchemy import event, insert
+
+from app.db import engine
+from app.db.declaration.user import User
+from app.db.declaration.school import School, Class, UserClassMark
+from app.db.schemas.user import Roles
+from app.routers.teacher import plot_avg_distribution
+
+STUDENTS_PER_CLASS = 30
+MARKS_PER_STUDENT = 20
+CLASS_STEPS = [1, 5, 10, 30]
+
+
+async def addClasses(school_uuid, count: int):
+    async with engine.async_session_maker() as session:
+        for _ in range(count):
+            class_ = Class(class_name=f"{random.randint(1, 11)}А", start_year=2023, school_uuid=school_uuid)
+            session.add(class_)
+            await session.flush()
+
+            students = [User(role=Roles.student, name="bench") for _ in range(STUDENTS_PER_CLASS)]
+            session.add_all(students)
+            await session.flush()
+
+            await session.execute(insert(UserClassMark), [
+                {
+                    "user_uuid": student.uuid,
+                    "class_uuid": class_.uuid,
+                    "mark": random.randint(1, 5),
+                    "discipline": "Математика",
+                    "created_at": datetime.utcnow() - timedelta(days=random.randint(0, 365))
+                }
+                for student in students
+                for _ in range(MARKS_PER_STUDENT)
+            ])
+        await session.commit()
+
+
+async def main():
+    engine.engine.echo = False
+    await engine.init_models()
+
+    queries = 0
+
+    def countQuery(*_):
+        nonlocal queries
+        queries += 1
+
+    event.listen(engine.engine.sync_engine, "before_cursor_execute", countQuery)
+
+    async with engine.async_session_maker() as session:
+        school = School(facility_name="bench")
+        session.add(school)
+        await session.commit()
+
+    print(f"{'classes':>8} {'queries':>8} {'ms':>8}")
+    total_classes = 0
+    for step in CLASS_STEPS:
+        await addClasses(school.uuid, step - total_classes)
+        total_classes = step
+
+        async with engine.async_session_maker() as session:
+            queries = 0
+            started = time.perf_counter()
+            response = await plot_avg_distribution(session=session)
+            elapsed = (time.perf_counter() - started) * 1000
+
+        assert response.status_code == 200
+        print(f"{total_classes:>8} {queries:>8} {elapsed:>8.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,173 @@
+"""
+Latency check for the bot handlers that fan out api calls (/my_grades, /analysis, /statistics).
+
+The api is replaced by an httpx.MockTransport that answers every endpoint after a fixed delay, Telegram by a
+message object that records when each answer was sent. With the calls running concurrently the wall time of
+a handler should be close to its slowest call, not to the sum of all of them, and the text should go out
+as soon as the json part is ready. Exits with 1 if a handler is noticeably slower than its slowest call.
+
+The last scenarios hang or break one chart: the text and the other chart must still go out and the missing chart
+be reported within CHART_TIMEOUT. Exits with 1 if the healthy chart is lost with it.
+
+Run from the repository root:
+    python scripts/bench_bot_fanout.py
+"""
+import os
+import sys
+import time
+import base64
+import asyncio
+from types import SimpleNamespace
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+# the bot is never started, tg_bot.config only needs a well-formed token and a port to be importable
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("API_PORT", "8443")
+os.environ["CHART_TIMEOUT"] = "1"
+
+import httpx
+
+from tg_bot.utilities import CustomAsyncClient
+from tg_bot.routers.user import welcome
+
+SCHOOL_UUID = "00000000-0000-0000-0000-000000000001"
+
+# seconds per endpoint, and per chart: /user/dashboard renders the requested charts concurrently on top of its own
+DELAYS = {
+    "/user/dashboard": 0.05,
+    "subject_averages": 0.30,
+    "absences": 0.40,
+    "progression": 0.35,
+    "accumulated": 0.45,
+    "/teacher/statistics": 0.10,
+    "/teacher/plot_avg_distribution": 0.50,
+}
+
+PAYLOADS = {
+    "/user/dashboard": {
+        "summary": {
+            "subjects": [{"discipline": "Математика", "average_mark": 4.25, "marks_count": 12}],
+            "absences": [{"discipline": "Пропуск по болезни", "absences_count": 2}],
+        },
+        "prediction": {
+            "status": "успешный", "confidence": 0.9, "total_marks": 12, "bad_marks": 1, "message": "..."
+        },
+    },
+    "/teacher/statistics": [
+        {
+            "school_uuid": SCHOOL_UUID, "school_name": "Школа №1", "class_name": "9А", "start_year": 2023,
+            "disciplines": [{"discipline": "Математика", "average_mark": 4.1, "marks_count": 300}],
+            "absences": [],
+        }
+    ],
+}
+
+
+def mockClient(delays: dict, failing: set = frozenset()) -> CustomAsyncClient:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        charts = [chart for chart in request.url.params.get_list("charts") if chart]
+        await asyncio.sleep(delays[path] + max((delays[chart] for chart in charts), default=0))
+        if path in failing or failing.intersection(charts):
+            return httpx.Response(500, text="boom")
+        if path == "/user/dashboard":
+            image = {"etag": '"fake"', "media_type": "image/png", "data": base64.b64encode(b"\x89PNG fake").decode()}
+            return httpx.Response(200, json=PAYLOADS[path] | {"charts": {chart: image for chart in charts}})
+        if path in PAYLOADS:
+            return httpx.Response(200, json=PAYLOADS[path])
+        return httpx.Response(200, content=b"\x89PNG fake", headers={"content-type": "image/png"})
+
+    return CustomAsyncClient(base_url="http://api/", transport=httpx.MockTransport(handler))
+
+
+class RecordingMessage:
+    def __init__(self):
+        self.chat = SimpleNamespace(id=1)
+        self.bot = SimpleNamespace(id=1)
+        self.started = time.perf_counter()
+        self.sent: list[tuple[float, str]] = []
+
+    async def answer(self, text: str, **kwargs):
+        self.sent.append((time.perf_counter() - self.started, "text: " + text.splitlines()[0][:40]))
+
+    async def answer_photo(self, photo, caption: str = "", **kwargs):
+        self.sent.append((time.perf_counter() - self.started, "photo: " + caption))
+        return SimpleNamespace(photo=[])
+
+    async def answer_media_group(self, media: list, **kwargs):
+        at = time.perf_counter() - self.started
+        self.sent.extend((at, "album photo: " + item.caption) for item in media)
+        return [SimpleNamespace(photo=[]) for _ in media]
+
+
+# the calls of every handler, a list of what each one waits for
+HANDLERS = {
+    "/my_grades": (
+        welcome.showMyGrades,
+        [["/user/dashboard"], ["/user/dashboard", "subject_averages"], ["/user/dashboard", "absences"]]
+    ),
+    "/analysis": (
+        welcome.show_prediction,
+        [["/user/dashboard"], ["/user/dashboard", "progression"], ["/user/dashboard", "accumulated"]]
+    ),
+    "/statistics": (welcome.showStatistics, [["/teacher/statistics"], ["/teacher/plot_avg_distribution"]]),
+}
+
+
+def callDelay(call: list[str]) -> float:
+    return DELAYS[call[0]] + max((DELAYS[chart] for chart in call[1:]), default=0)
+
+
+async def measure(command: str, delays: dict, failing: set = frozenset()) -> tuple[float, RecordingMessage]:
+    handler, _ = HANDLERS[command]
+    welcome.httpx_client = mockClient(delays, failing)
+
+    msg = RecordingMessage()
+    # __wrapped__ skips updateUserDecorator, the identity cache is not what is measured here
+    await handler.__wrapped__(msg, None)
+    return time.perf_counter() - msg.started, msg
+
+
+async def main() -> int:
+    slow = 0
+
+    for command, (_, calls) in HANDLERS.items():
+        wall, msg = await measure(command, DELAYS)
+
+        sequential = sum(callDelay(call) for call in calls)
+        slowest = max(callDelay(call) for call in calls)
+        ok = wall < slowest * 1.2 + 0.05
+        slow += not ok
+
+        print(f"{'ok  ' if ok else 'SLOW'} {command}: {wall:.2f}s wall, slowest call {slowest:.2f}s, "
+              f"one after another {sequential:.2f}s")
+        for at, what in msg.sent:
+            print(f"        {at:.2f}s  {what}")
+
+    print("\npartial failures (CHART_TIMEOUT=1s):")
+    # command, delays, failing charts and the caption of the healthy chart that has to arrive anyway
+    scenarios = {
+        "absences chart hangs": ("/my_grades", DELAYS | {"absences": 5.0}, set(), "📊 Средние оценки по предметам"),
+        "absences chart fails": ("/my_grades", DELAYS, {"absences"}, "📊 Средние оценки по предметам"),
+        "progression chart hangs": (
+            "/analysis", DELAYS | {"progression": 5.0}, set(), "📈 Накопленный средний балл по предметам"
+        ),
+        "progression chart fails": ("/analysis", DELAYS, {"progression"}, "📈 Накопленный средний балл по предметам"),
+    }
+    for name, (command, delays, failing, healthy) in scenarios.items():
+        wall, msg = await measure(command, delays, failing)
+        kept = any(what.endswith(healthy) for _, what in msg.sent)
+        ok = wall < 1.5 and len(msg.sent) == 3 and kept
+        slow += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {command}, {name}: {wall:.2f}s wall"
+              f"{'' if kept else ', the healthy chart was lost'}")
+        for at, what in msg.sent:
+            print(f"        {at:.2f}s  {what}")
+
+    return 1 if slow else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,155 @@
+"""
+Accuracy and scoring latency of the success model against the heuristic it replaced.
+
+The model is trained on a copy of example.db the way python -m app.prediction.train does it, and the holdout
+metrics (students the model has not seen) are printed for it, for the heuristic the api falls back to (marks
+only) and for the original /predict_success logic (the same thresholds over every row, absences included).
+How many of today's students each of them answers differently from the original logic is printed as well. Latency is measured for one /predict_success
+request worth of work (featurizing a student's raw marks or reading their feature store rows and scoring them,
+the heuristic on the same marks), for a /school/{uuid}/predictions worth (the roster and the feature store rows
+of the whole school, every student scored at once, against a /predict_success worth of queries and scoring per
+student) and for scoring a large batch of students at once.
+
+Run from the repository root:
+    python scripts/bench_prediction.py [--batch 100000]
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import datetime
+import tempfile
+import statistics
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SCRIPT_DIR)
+sys.path.append(REPO_DIR)
+
+WORKDIR = tempfile.mkdtemp()
+shutil.copy(os.path.join(REPO_DIR, "example.db"), os.path.join(WORKDIR, "bench.db"))
+os.environ["DB_URL"] = f"sqlite+aiosqlite:///{os.path.join(WORKDIR, 'bench.db')}"
+
+import numpy as np
+from sqlalchemy import select
+
+from app import prediction
+from app.prediction import train
+from app.db import queries, rollup
+from app.db.engine import engine, async_session_maker, init_models
+from app.db.declaration.school import School, UserClassMark
+
+
+def timeCall(fn, rounds: int) -> list[float]:
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def describe(timings: list[float]) -> str:
+    timings = sorted(timings)
+    return (f"p50 {statistics.median(timings) * 1e6:.0f}us, "
+            f"p99 {timings[int(len(timings) * 0.99) - 1] * 1e6:.0f}us")
+
+
+async def timeAsync(fn, rounds: int) -> list[float]:
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+async def scoreSchool(school_uuid):
+    """what /school/{uuid}/predictions does"""
+    async with async_session_maker() as session:
+        students = (await session.execute(queries.scopeStudents(school_uuid=school_uuid))).all()
+        features = (await session.execute(queries.scopeFeatures(school_uuid=school_uuid))).all()
+    return prediction.predictStudents(students, features)
+
+
+async def scorePerStudent(students):
+    """the same through one /user/predict_success worth of work per student of the school"""
+    async with async_session_maker() as session:
+        results = []
+        for user_uuid in students:
+            stmt = queries.userFeatures(user_uuid=user_uuid)
+            results.append(prediction.predictStored((await session.execute(stmt)).all()))
+    return results
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=100_000, help="students scored at once in the batch test")
+    args = parser.parse_args()
+    engine.echo = False
+
+    await init_models()
+    async with async_session_maker() as session:
+        await rollup.rebuildIfEmpty(session)
+        students = await train.loadMarks(session)
+        user_uuid = max(students, key=lambda uuid: len(students[uuid][1]))
+        stmt = select(UserClassMark.discipline, UserClassMark.mark, UserClassMark.created_at).where(
+            UserClassMark.user_uuid == user_uuid
+        )
+        rows = (await session.execute(stmt)).all()
+        stored = (await session.execute(queries.userFeatures(user_uuid=user_uuid))).all()
+        school_uuid = (await session.execute(select(School.uuid).limit(1))).scalar_one()
+        roster = (await session.execute(queries.scopeStudents(school_uuid=school_uuid))).all()
+        school_students = {user_uuid for _, _, user_uuid, _ in roster}
+
+    started = time.perf_counter()
+    model = train.train(students)
+    training = time.perf_counter() - started
+
+    print(f"trained {model.version} on {model.meta['train']['samples']} samples of {model.meta['students']} "
+          f"students in {training * 1000:.0f}ms")
+    print(f"{'holdout':<10} {'samples':>8} {'accuracy':>9} {'log loss':>9} {'auc':>6}")
+    for name, key in (("model", "holdout"), ("heuristic", "heuristic_holdout"), ("baseline", "baseline_holdout")):
+        metrics = model.meta.get(key)
+        if metrics:
+            print(f"{name:<10} {metrics['samples']:>8} {metrics['accuracy']:>9.3f} "
+                  f"{metrics['log_loss']:>9.3f} {metrics['auc']:>6.3f}")
+
+    prediction._model = model
+    changed = {"model": 0, "heuristic": 0}
+    for is_absence, all_marks, days in students.values():
+        # what the original /predict_success answered for the student today
+        baseline = prediction.predictFromMarks(list(all_marks))["status"]
+        changed["heuristic"] += prediction.predictFromMarks(list(all_marks[~is_absence]))["status"] != baseline
+        sums = prediction.sumsFromArrays(is_absence, all_marks, days)
+        changed["model"] += prediction.predictSums(sums)["status"] != baseline
+    print(f"answers that differ from the original logic for the {len(students)} students today: "
+          f"model {changed['model']}, heuristic {changed['heuristic']}")
+
+    absence_disciplines = set(prediction.ABSENCE_DISCIPLINES)
+    marks = [mark for discipline, mark, _ in rows if discipline not in absence_disciplines]
+    features = prediction.featureMatrix(prediction.sumsFromRows(rows))
+
+    print(f"\none request, a student with {len(rows)} marks:")
+    print(f"  model, featurize + score  {describe(timeCall(lambda: prediction.predict(rows), args.rounds))}")
+    print(f"  model, feature store rows {describe(timeCall(lambda: prediction.predictStored(stored), args.rounds))}")
+    print(f"  model, score only         {describe(timeCall(lambda: model.probabilities(features), args.rounds))}")
+    print(f"  heuristic                 {describe(timeCall(lambda: prediction.predictFromMarks(marks), args.rounds))}")
+
+    print(f"\na school of {len(school_students)} students, queries included:")
+    print(f"  scope queries + predictStudents    {describe(await timeAsync(lambda: scoreSchool(school_uuid), 20))}")
+    print(f"  predict_success per student        {describe(await timeAsync(lambda: scorePerStudent(school_students), 20))}")
+
+    batch = np.repeat(features, args.batch, axis=0) + np.random.default_rng(0).normal(0, 0.1, (args.batch, features.shape[1]))
+    timings = timeCall(lambda: model.probabilities(batch), 20)
+    print(f"\n{args.batch} students at once: {statistics.median(timings) * 1000:.1f}ms, "
+          f"{args.batch / statistics.median(timings) / 1e6:.1f}M students/s")
+
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,202 @@
+"""
+Throughput of the bot workers (tg_bot/update_stream.py) on a replayed update stream.
+
+The updates - generated, or Telegram updates read from a JSON lines file with --replay - are queued into the
+partitioned streams first, then 1, 2, 4... workers drain them. The handler stands in for the real one: it
+only sleeps --handler-ms, like a handler waiting for the api. Each run checks that every update was handled
+and that the updates of every chat were handled in update_id order. One run kills a worker halfway
+(no stop(), its leases have to expire) and reports how long the takeover took and what was handled twice. The
+last one stalls a worker halfway instead: it keeps handling but stops renewing its leases, like a process
+frozen by GC or cut off from redis for a while, so it has to notice the lost leases by itself and nothing may
+be handled twice.
+
+Needs a Redis server; the keys live under a unique prefix and are removed afterwards. Run from the
+repository root:
+    REDIS_URL=redis://127.0.0.1:6379 python scripts/bench_update_workers.py [--updates 5000 --chats 500]
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from uuid import uuid4
+from collections import Counter, defaultdict
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+from redis.asyncio import Redis
+
+from tg_bot.update_stream import UpdateWorker, publishUpdate, chatIdOf
+
+
+def generateUpdates(count: int, chats: int) -> list[dict]:
+    updates = []
+    for update_id in range(1, count + 1):
+        chat_id = random.randint(1, chats)
+        updates.append({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": f"Student {chat_id}"},
+                "text": "/my_grades",
+            },
+        })
+    return updates
+
+
+class Recorder:
+    def __init__(self, handler_ms: float):
+        self.delay = handler_ms / 1000
+        self.handled: list[tuple[int, int]] = []  # (chat_id, update_id) in the order handled
+        self.in_flight = Counter()
+        self.overlaps = 0  # two updates of one chat handled at the same time
+
+    async def handle(self, update: dict):
+        chat_id = chatIdOf(update)
+        self.in_flight[chat_id] += 1
+        if self.in_flight[chat_id] > 1:
+            self.overlaps += 1
+        try:
+            await asyncio.sleep(self.delay)
+            self.handled.append((chat_id, update["update_id"]))
+        finally:
+            self.in_flight[chat_id] -= 1
+
+    def check(self, updates: list[dict]) -> dict:
+        seen = Counter(update_id for _, update_id in self.handled)
+        last = defaultdict(int)
+        out_of_order = 0
+        for chat_id, update_id in self.handled:
+            if seen[update_id] > 1 and update_id <= last[chat_id]:
+                continue  # the second delivery of an update the crashed worker had not acknowledged
+            if update_id < last[chat_id]:
+                out_of_order += 1
+            last[chat_id] = max(last[chat_id], update_id)
+
+        return {
+            "missing": len({update["update_id"] for update in updates} - set(seen)),
+            "duplicates": sum(count - 1 for count in seen.values()),
+            "out_of_order": out_of_order,
+            "overlaps": self.overlaps,
+        }
+
+
+async def runWorkers(
+    args,
+    updates: list[dict],
+    workers: int,
+    kill_at: float | None = None,
+    stall_at: float | None = None
+) -> dict:
+    prefix = f"bench:{uuid4().hex[:8]}:"
+    redis = Redis.from_url(args.redis_url)
+    for update in updates:
+        await publishUpdate(redis, update, prefix=prefix, partitions=args.partitions)
+
+    recorder = Recorder(args.handler_ms)
+    clients = [Redis.from_url(args.redis_url) for _ in range(workers)]
+    pool = [
+        UpdateWorker(
+            client, recorder.handle, worker_id=f"bench-{i}", partitions=args.partitions,
+            concurrency=args.concurrency, lease_ms=args.lease_ms, prefix=prefix
+        )
+        for i, client in enumerate(clients)
+    ]
+
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(worker.run()) for worker in pool]
+    killed_at = None
+    total = len(updates)
+    while len({update_id for _, update_id in recorder.handled}) < total:
+        if kill_at is not None and killed_at is None and len(recorder.handled) >= total * kill_at:
+            # a crash of the busiest worker: no stop(), nothing acknowledged or released
+            victim = max(range(workers), key=lambda i: len(pool[i].owned))
+            tasks[victim].cancel()
+            killed_at = time.perf_counter()
+        if stall_at is not None and killed_at is None and len(recorder.handled) >= total * stall_at:
+            # the busiest worker goes on handling what it has but its leases are no longer renewed
+            victim = max(range(workers), key=lambda i: len(pool[i].owned))
+
+            async def frozen():
+                pass
+
+            pool[victim]._rebalance = frozen
+            killed_at = time.perf_counter()
+        if time.perf_counter() - started > args.timeout:
+            break
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    for worker in pool:
+        worker.stop()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    keys = [key async for key in redis.scan_iter(match=f"{prefix}*")]
+    if keys:
+        await redis.delete(*keys)
+    for client in [redis, *clients]:
+        await client.aclose()
+
+    return {
+        "workers": workers,
+        "seconds": elapsed,
+        "rate": total / elapsed,
+        "reclaimed": sum(worker.stats["reclaimed"] for worker in pool),
+        "fenced": sum(worker.stats["fenced"] for worker in pool),
+        "stalled": stall_at is not None,
+        "takeover": elapsed - (killed_at - started) if killed_at else None,
+        **recorder.check(updates),
+    }
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL") or "redis://127.0.0.1:6379")
+    parser.add_argument("--replay", help="JSON lines file with Telegram updates instead of generated ones")
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--chats", type=int, default=500)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=16, help="handlers at a time per worker")
+    parser.add_argument("--handler-ms", type=float, default=20)
+    parser.add_argument("--lease-ms", type=int, default=2000)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    if args.replay:
+        with open(args.replay) as f:
+            updates = [json.loads(line) for line in f if line.strip()]
+    else:
+        updates = generateUpdates(args.updates, args.chats)
+
+    print(f"{len(updates)} updates of {len({chatIdOf(update) for update in updates})} chats, "
+          f"{args.partitions} partitions, {args.concurrency} handlers per worker, {args.handler_ms:g}ms each")
+
+    runs = [await runWorkers(args, updates, workers) for workers in args.workers]
+    runs.append(await runWorkers(args, updates, max(2, args.workers[-1]), kill_at=0.5))
+    runs.append(await runWorkers(args, updates, max(2, args.workers[-1]), stall_at=0.5))
+
+    failed = False
+    for run in runs:
+        crash = ""
+        if run["takeover"]:
+            crash = f", one {'stalled' if run['stalled'] else 'killed'} halfway: done {run['takeover']:.1f}s after it"
+        print(
+            f"{run['workers']} workers{crash}: {run['rate']:.0f} updates/s ({run['seconds']:.2f}s), "
+            f"missing {run['missing']}, out of order {run['out_of_order']}, "
+            f"same chat in parallel {run['overlaps']}, handled twice {run['duplicates']}, reclaimed {run['reclaimed']}, "
+            f"left to the new owner {run['fenced']}"
+        )
+        # a killed worker may have handled an update without acknowledging it, a stalled one must not race
+        failed |= bool(run["missing"] or run["out_of_order"] or run["overlaps"] or (run["stalled"] and run["duplicates"]))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
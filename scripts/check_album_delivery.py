@@ -0,0 +1,119 @@
+"""
+Checks that /analysis and /my_grades deliver their charts as one media group straight from memory.
+
+The api is an httpx.MockTransport whose /user/dashboard serves fixed PNG bytes, Telegram the counting session
+from check_file_id_cache.py. For every command the check expects a single sendMediaGroup carrying the captions in
+order, no sendPhoto, no FSInputFile, no temporary file created and nothing left in the temp directory.
+The second round of each command must reuse every photo by file_id.
+
+Run from the repository root:
+    python scripts/check_album_delivery.py
+"""
+import os
+import sys
+import base64
+import asyncio
+import datetime
+import tempfile
+from unittest import mock
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+# the bot is never started, tg_bot.config only needs a well-formed token and a port to be importable
+os.environ.setdefault("BOT_TOKEN", "123456:check")
+os.environ.setdefault("API_PORT", "8443")
+
+import httpx
+from aiogram import Bot
+from aiogram.types import Chat, Message, FSInputFile
+
+from check_file_id_cache import FakeTelegramSession
+from tg_bot.utilities import CustomAsyncClient
+from tg_bot.routers.user import welcome
+
+DASHBOARD = {
+    "summary": {
+        "subjects": [{"discipline": "Математика", "average_mark": 4.25, "marks_count": 12}],
+        "absences": [],
+    },
+    "prediction": {"status": "успешный", "confidence": 0.9, "total_marks": 12, "bad_marks": 1, "message": "..."},
+}
+
+COMMANDS = {
+    "/analysis": (
+        welcome.show_prediction,
+        ["📊 График твоего прогресса по предметам", "📈 Накопленный средний балл по предметам"]
+    ),
+    "/my_grades": (welcome.showMyGrades, ["📊 Средние оценки по предметам", "📉 Пропуски по месяцам"]),
+}
+
+
+def api(request: httpx.Request) -> httpx.Response:
+    charts = {
+        chart: {
+            "etag": f'"{chart}"',
+            "media_type": "image/png",
+            "data": base64.b64encode(b"\x89PNG " + chart.encode() * 100).decode()
+        }
+        for chart in request.url.params.get_list("charts") if chart
+    }
+    return httpx.Response(200, json=DASHBOARD | {"charts": charts})
+
+
+async def main() -> int:
+    welcome.httpx_client = CustomAsyncClient(base_url="http://api/", transport=httpx.MockTransport(api))
+    session = FakeTelegramSession()
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=session)
+
+    temp_dir = tempfile.gettempdir()
+    failed = 0
+
+    for round_ in (1, 2):
+        for command, (handler, captions) in COMMANDS.items():
+            session.methods.clear()
+            session.sends.clear()
+            session.input_files.clear()
+            albums = []
+
+            msg = Message(message_id=0, date=datetime.datetime.now(), chat=Chat(id=1, type="private")).as_(bot)
+            original_answer_media_group = Message.answer_media_group
+
+            async def recordAlbum(self, media, **kwargs):
+                albums.append([item.caption for item in media])
+                return await original_answer_media_group(self, media, **kwargs)
+
+            before = set(os.listdir(temp_dir))
+            with (
+                mock.patch.object(Message, "answer_media_group", recordAlbum),
+                mock.patch("tempfile.NamedTemporaryFile", side_effect=AssertionError("temp file created")),
+                mock.patch("tempfile.mkstemp", side_effect=AssertionError("temp file created")),
+            ):
+                # __wrapped__ skips updateUserDecorator, the identity cache is not what is checked here
+                await handler.__wrapped__(msg, None)
+            leftovers = set(os.listdir(temp_dir)) - before
+
+            problems = []
+            if albums != [captions]:
+                problems.append(f"albums {albums}, expected one with {captions}")
+            if session.methods["SendMediaGroup"] != 1 or session.methods["SendPhoto"]:
+                problems.append(f"requests {dict(session.methods)}")
+            if any(isinstance(file, FSInputFile) for file in session.input_files):
+                problems.append("a chart was sent from disk")
+            if leftovers:
+                problems.append(f"left in {temp_dir}: {sorted(leftovers)}")
+            if round_ == 2 and session.sends["upload"]:
+                problems.append(f"photos uploaded again: {dict(session.sends)}")
+
+            failed += bool(problems)
+            print(f"{'FAIL' if problems else 'ok  '} {command}, round {round_}: "
+                  f"{dict(session.methods)}, photos {dict(session.sends)}")
+            for problem in problems:
+                print(f"        {problem}")
+
+    await bot.session.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,156 @@
+"""
+Checks that the student_features table (the success model's running sums) follows the raw marks.
+
+On a copy of example.db the api is started in process, marks are written through POST /mark and POST /mark/bulk,
+and after every step python -m app.db.rollup --check's comparison with a full recompute must come out clean.
+Then every student's /predict_success (read from the feature store) must match the prediction from their raw
+marks, and a row broken on purpose must be reported and fixed by a rebuild. The read latency of both ways is
+printed at the end.
+
+Run from the repository root:
+    python scripts/check_feature_store.py [--marks 2000]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import datetime
+import tempfile
+import statistics
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SCRIPT_DIR)
+sys.path.append(REPO_DIR)
+sys.path.append(os.path.join(REPO_DIR, "app"))
+
+WORKDIR = tempfile.mkdtemp()
+shutil.copy(os.path.join(REPO_DIR, "example.db"), os.path.join(WORKDIR, "check.db"))
+os.environ["DB_URL"] = f"sqlite+aiosqlite:///{os.path.join(WORKDIR, 'check.db')}"
+
+import httpx
+from sqlalchemy import select, update
+
+from app import prediction
+from app.db import queries, rollup
+from app.db.engine import engine, async_session_maker
+from app.db.declaration import user_class_table
+from app.db.declaration.school import UserClassMark, StudentFeature
+from app.fastapi_app import app
+
+failures = []
+
+
+def check(condition: bool, message: str):
+    print(f"{'ok  ' if condition else 'FAIL'}  {message}")
+    if not condition:
+        failures.append(message)
+
+
+async def consistent(step: str):
+    async with async_session_maker() as session:
+        problems = await rollup.checkFeatures(session)
+    for problem in problems[:5]:
+        print(f"        {problem}")
+    check(not problems, f"{step}: student_features matches a recompute ({len(problems)} mismatching rows)")
+
+
+def randomMark(memberships: list, disciplines: list, rng: random.Random) -> dict:
+    user_uuid, class_uuid = rng.choice(memberships)
+    discipline = rng.choice(disciplines)
+    mark = rng.randint(1, 8) if discipline in queries.ABSENCE_DISCIPLINES else rng.randint(2, 5)
+    # out of order on purpose: the running sums must not depend on the order the marks arrive in
+    created_at = datetime.datetime(2025, 6, 30) - datetime.timedelta(days=rng.uniform(-30, 400))
+    return {
+        "user_uuid": str(user_uuid),
+        "class_uuid": str(class_uuid),
+        "discipline": discipline,
+        "mark": mark,
+        "created_at": created_at.isoformat(),
+    }
+
+
+def describe(timings: list[float]) -> str:
+    return f"p50 {statistics.median(timings) * 1000:.2f}ms"
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--marks", type=int, default=2000, help="marks written through POST /mark/bulk")
+    parser.add_argument("--single", type=int, default=50, help="marks written one by one through POST /mark")
+    args = parser.parse_args()
+    rng = random.Random(0)
+    engine.echo = False
+
+    async with app.router.lifespan_context(app):
+        await consistent("after startup")
+
+        async with async_session_maker() as session:
+            memberships = (await session.execute(select(user_class_table))).all()
+            disciplines = sorted(set((await session.execute(select(UserClassMark.discipline))).scalars()))
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+            for _ in range(args.single):
+                response = await client.post("/mark", json=randomMark(memberships, disciplines, rng))
+                assert response.status_code == 201, response.text
+            await consistent(f"{args.single} marks through POST /mark")
+
+            marks = [randomMark(memberships, disciplines, rng) for _ in range(args.marks)]
+            response = await client.post("/mark/bulk", json=marks)
+            check(response.json()["inserted"] == args.marks, f"{args.marks} marks through POST /mark/bulk")
+            await consistent(f"{args.marks} marks through POST /mark/bulk")
+
+            store_timings, raw_timings = [], []
+            mismatches = 0
+            students = sorted({user_uuid for user_uuid, _ in memberships})
+            async with async_session_maker() as session:
+                for user_uuid in students:
+                    started = time.perf_counter()
+                    stored = prediction.predictStored(
+                        (await session.execute(queries.userFeatures(user_uuid=user_uuid))).all()
+                    )
+                    store_timings.append(time.perf_counter() - started)
+
+                    started = time.perf_counter()
+                    raw = prediction.predict((await session.execute(queries.userMarks(
+                        UserClassMark.discipline, UserClassMark.mark, UserClassMark.created_at, user_uuid=user_uuid
+                    ))).all())
+                    raw_timings.append(time.perf_counter() - started)
+
+                    served = (await client.get("/user/predict_success", params={"user_uuid": str(user_uuid)})).json()
+                    same = (
+                        served == stored
+                        and stored["status"] == raw["status"]
+                        and stored["total_marks"] == raw["total_marks"]
+                        and abs(stored.get("probability", 0) - raw.get("probability", 0)) <= 1e-3
+                    )
+                    mismatches += not same
+            check(mismatches == 0, f"/predict_success from the store matches the raw marks for {len(students)} students")
+
+        async with async_session_maker() as session:
+            row = (await session.execute(select(StudentFeature).limit(1))).scalar_one()
+            await session.execute(
+                update(StudentFeature)
+                .where(StudentFeature.user_uuid == row.user_uuid, StudentFeature.discipline == row.discipline)
+                .values(marks_sum=StudentFeature.marks_sum + 1)
+            )
+            await session.commit()
+            problems = await rollup.checkFeatures(session)
+            check(len(problems) == 1, f"a broken row is reported ({len(problems)} mismatching rows)")
+
+            await rollup.rebuild(session)
+            await session.commit()
+        await consistent("after python -m app.db.rollup")
+
+    print(f"\none student's prediction, query + scoring: "
+          f"feature store {describe(store_timings)}, raw marks {describe(raw_timings)}")
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+    print(f"\n{len(failures)} checks failed" if failures else "\nall checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,151 @@
+"""
+Checks that tg_bot.photos.answerChart uploads every distinct chart once and reuses its Telegram file_id afterwards.
+
+Telegram is replaced by an aiogram session that answers the bot locally and counts how many photos arrived
+as bytes (uploads) and how many as a file_id. It can also "forget" a file_id to check that a rejected id
+is dropped and the photo uploaded again. Redis is pointed at a closed port, so only the in-process tier
+of the cache is exercised, which also makes the eviction of the LRU observable.
+
+Run from the repository root:
+    python scripts/check_file_id_cache.py
+"""
+import os
+import sys
+import asyncio
+import hashlib
+import datetime
+from collections import Counter
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+os.environ["REDIS_URL"] = "redis://127.0.0.1:1"
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendPhoto, SendMediaGroup, SendMessage
+from aiogram.types import Chat, Message, PhotoSize, InputFile
+
+from app.cache import TieredCache
+from tg_bot import photos
+
+
+class FakeTelegramSession(BaseSession):
+    """
+    answers sendMessage, sendPhoto and sendMediaGroup locally. sends counts photos by how they arrived,
+    methods counts the requests, input_files keeps every file object that was uploaded
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.sends = Counter()
+        self.methods = Counter()
+        self.input_files: list[InputFile] = []
+        self.known_file_ids: set[str] = set()
+        self.message_id = 0
+
+    async def _fileId(self, bot, method, photo) -> str:
+        if isinstance(photo, InputFile):
+            self.sends["upload"] += 1
+            self.input_files.append(photo)
+            png = b"".join([chunk async for chunk in photo.read(bot)])
+            file_id = "file-" + hashlib.sha256(png).hexdigest()[:16]
+            self.known_file_ids.add(file_id)
+            return file_id
+
+        if photo not in self.known_file_ids:
+            self.sends["rejected file_id"] += 1
+            raise TelegramBadRequest(method=method, message="Bad Request: wrong file identifier/HTTP URL specified")
+        self.sends["file_id"] += 1
+        return photo
+
+    def _message(self, chat_id: int, **kwargs) -> Message:
+        self.message_id += 1
+        return Message(
+            message_id=self.message_id,
+            date=datetime.datetime.now(),
+            chat=Chat(id=chat_id, type="private"),
+            **kwargs
+        )
+
+    def _photo(self, file_id: str) -> list[PhotoSize]:
+        return [PhotoSize(file_id=file_id, file_unique_id=file_id[5:], width=640, height=480)]
+
+    async def make_request(self, bot, method, timeout=None):
+        self.methods[type(method).__name__] += 1
+
+        if isinstance(method, SendMediaGroup):
+            # a rejected file_id fails the whole album before anything is sent, like in Telegram
+            file_ids = [await self._fileId(bot, method, item.media) for item in method.media]
+            return [
+                self._message(method.chat_id, photo=self._photo(file_id), caption=item.caption)
+                for item, file_id in zip(method.media, file_ids)
+            ]
+
+        if isinstance(method, SendPhoto):
+            file_id = await self._fileId(bot, method, method.photo)
+            return self._message(method.chat_id, photo=self._photo(file_id), caption=method.caption)
+
+        assert isinstance(method, SendMessage), method
+        return self._message(method.chat_id, text=method.text)
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+        yield
+
+    async def close(self):
+        pass
+
+
+def chart(i: int) -> bytes:
+    return b"\x89PNG chart " + str(i).encode() * 1000
+
+
+async def send(bot: Bot, png: bytes, times: int = 1):
+    msg = Message(message_id=0, date=datetime.datetime.now(), chat=Chat(id=1, type="private")).as_(bot)
+    for _ in range(times):
+        await photos.answerChart(msg, png, "chart.png", caption="chart")
+
+
+def check(name: str, session: FakeTelegramSession, expected: dict) -> bool:
+    ok = all(session.sends[kind] == count for kind, count in expected.items())
+    print(f"{'ok  ' if ok else 'FAIL'} {name}: {dict(session.sends)}")
+    session.sends.clear()
+    return ok
+
+
+async def main() -> int:
+    session = FakeTelegramSession()
+    bot = Bot(token="123456:check", session=session)
+    results = []
+
+    await send(bot, chart(1), times=10)
+    results.append(check("same chart 10 times", session, {"upload": 1, "file_id": 9}))
+
+    await send(bot, chart(2))
+    await send(bot, chart(1))
+    results.append(check("new chart, then the first one again", session, {"upload": 1, "file_id": 1}))
+
+    session.known_file_ids.clear()
+    await send(bot, chart(1), times=3)
+    results.append(check(
+        "telegram forgot the file_id", session, {"rejected file_id": 1, "upload": 1, "file_id": 2}
+    ))
+
+    # room for two file_ids: the least recently sent one is evicted
+    photos.file_id_cache = TieredCache(namespace="tg_file_id", max_bytes=2 * len("file-") + 2 * 16, ttl=60)
+    for i in (1, 2, 3):
+        await send(bot, chart(i))
+    session.sends.clear()
+    await send(bot, chart(3))
+    await send(bot, chart(2))
+    await send(bot, chart(1))
+    results.append(check("LRU keeps the two most recent charts", session, {"upload": 1, "file_id": 2}))
+
+    await bot.session.close()
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
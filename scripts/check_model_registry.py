@@ -0,0 +1,164 @@
+"""
+Checks the model registry and the admin endpoints on the api started in process over a copy of example.db.
+
+A trained model and its copy with a stricter threshold are published to a temporary registry. The active one
+is switched through POST /admin/models/{version}/activate while waves of /predict_success requests keep coming
+(none may fail, each is answered by one of the two), then through the ACTIVE file the way another api process would
+(the watcher has to pick it up). Shadow scoring with the other model must count exactly the disagreements a
+direct comparison finds, and sample about the requested fraction of the requests.
+
+Run from the repository root:
+    python scripts/check_model_registry.py
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import tempfile
+import dataclasses
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SCRIPT_DIR)
+sys.path.append(REPO_DIR)
+sys.path.append(os.path.join(REPO_DIR, "app"))
+
+WORKDIR = tempfile.mkdtemp()
+shutil.copy(os.path.join(REPO_DIR, "example.db"), os.path.join(WORKDIR, "check.db"))
+os.environ["DB_URL"] = f"sqlite+aiosqlite:///{os.path.join(WORKDIR, 'check.db')}"
+os.environ["PREDICTION_REGISTRY"] = os.path.join(WORKDIR, "models")
+os.environ["PREDICTION_RELOAD_SECONDS"] = "0.2"
+os.environ["ADMIN_TOKEN"] = "check"
+os.environ.pop("PREDICTION_MODEL", None)
+
+import httpx
+import numpy as np
+from sqlalchemy import select
+
+from app import prediction
+from app.prediction import train
+from app.db import queries
+from app.db.engine import engine, async_session_maker
+from app.db.declaration.user import User
+from app.db.schemas.user import Roles
+from app.fastapi_app import app
+
+ADMIN = {"X-Admin-Token": "check"}
+failures = []
+
+
+def check(condition: bool, message: str):
+    print(f"{'ok  ' if condition else 'FAIL'}  {message}")
+    if not condition:
+        failures.append(message)
+
+
+async def predictAll(client: httpx.AsyncClient, students: list, rounds: int = 1) -> list[dict]:
+    responses = await asyncio.gather(*(
+        client.get("/user/predict_success", params={"user_uuid": str(user_uuid)})
+        for _ in range(rounds) for user_uuid in students
+    ))
+    return [response.json() if response.status_code == 200 else {"error": response.status_code} for response in responses]
+
+
+async def main() -> int:
+    engine.echo = False
+    async with async_session_maker() as session:
+        students_marks = await train.loadMarks(session)
+    first = train.train(students_marks)
+    features = np.vstack([prediction.featureMatrix(prediction.sumsFromArrays(*columns)) for columns in students_marks.values()])
+    # the median student's probability as the threshold: about half of the students change status
+    second = dataclasses.replace(
+        first, threshold=float(np.median(first.probabilities(features))), version=f"{first.version}-strict"
+    )
+    for model in (first, second):
+        prediction.registry.publish(model)
+    prediction.registry.setActive(first.version)
+    versions = {first.version, second.version}
+
+    async with app.router.lifespan_context(app):
+        async with async_session_maker() as session:
+            students = list((await session.execute(select(User.uuid).where(User.role == Roles.student))).scalars())
+            stored = {
+                user_uuid: (await session.execute(queries.userFeatures(user_uuid=user_uuid))).all()
+                for user_uuid in students
+            }
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+            check((await client.get("/admin/models")).status_code == 403, "no token, 403")
+            listing = (await client.get("/admin/models", headers=ADMIN)).json()
+            check(
+                listing["active"] == first.version and {v["version"] for v in listing["versions"]} == versions,
+                f"registry lists both versions, {first.version} active"
+            )
+            check(
+                [v["version"] for v in listing["versions"] if v["loaded"]] == [first.version],
+                "only the active artifact is loaded"
+            )
+
+            answers = []
+            switched = asyncio.Event()
+
+            async def waves():
+                while not switched.is_set():
+                    answers.extend(await predictAll(client, students))
+                answers.extend(await predictAll(client, students))
+
+            in_flight = asyncio.create_task(waves())
+            await asyncio.sleep(0.2)
+            response = await client.post(f"/admin/models/{second.version}/activate", headers=ADMIN)
+            switched.set()
+            await in_flight
+            check(response.status_code == 200 and response.json()["active"] == second.version, "switch through the api")
+            check(
+                all("error" not in answer and answer["model"] in versions for answer in answers),
+                f"{len(answers)} requests in flight during the switch all answered "
+                f"({sum(answer.get('model') == first.version for answer in answers)} by the old model)"
+            )
+            check(
+                all(answer["model"] == second.version for answer in await predictAll(client, students)),
+                "requests after the switch use the new model"
+            )
+            check(prediction.registry.activeVersion() == second.version, "ACTIVE file follows the switch")
+
+            prediction.registry.setActive(first.version)
+            deadline = time.monotonic() + 5
+            while prediction.currentModel().version != first.version and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            check(prediction.currentModel().version == first.version, "watcher follows a switch made by another process")
+
+            check((await client.post("/admin/models/missing/activate", headers=ADMIN)).status_code == 404, "unknown version, 404")
+            check((await client.post("/admin/models/bad name/activate", headers=ADMIN)).status_code == 400, "bad version, 400")
+            check((await client.post(f"/admin/models/{second.version}/shadow", params={"fraction": 2}, headers=ADMIN)).status_code == 400, "bad fraction, 400")
+
+            features = np.vstack([
+                prediction.featureMatrix(prediction.sumsFromStore(stored[user_uuid])) for user_uuid in students
+                if prediction.sumsFromStore(stored[user_uuid])[0] > 0
+            ])
+            expected = int(((first.probabilities(features) >= first.threshold)
+                            != (second.probabilities(features) >= second.threshold)).sum())
+
+            await client.post(f"/admin/models/{second.version}/shadow", params={"fraction": 1}, headers=ADMIN)
+            await predictAll(client, students, rounds=3)
+            stats = (await client.get("/admin/models/shadow", headers=ADMIN)).json()
+            check(
+                stats["scored_students"] == 3 * len(features) and stats["disagreements"] == 3 * expected,
+                f"shadow with every request: {stats['disagreements']} disagreements of {stats['scored_students']}, "
+                f"{3 * expected} expected (rate {stats['disagreement_rate']})"
+            )
+
+            await client.post(f"/admin/models/{second.version}/shadow", params={"fraction": 0.3}, headers=ADMIN)
+            await predictAll(client, students, rounds=30)
+            stats = (await client.delete("/admin/models/shadow", headers=ADMIN)).json()
+            share = stats["sampled_requests"] / (30 * len(students))
+            check(0.2 < share < 0.4, f"shadow with fraction 0.3 sampled {share:.0%} of the requests")
+            check(prediction.shadow.candidate is None, "shadow stopped")
+
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+    print(f"\n{len(failures)} checks failed" if failures else "\nall checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
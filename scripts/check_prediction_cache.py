@@ -0,0 +1,170 @@
+"""
+Checks the prediction cache on the api started in process over a copy of example.db, with a model trained on it.
+
+Every student's /predict_success is asked twice: the second answer has to come from the cache and equal the
+first. A new mark has to invalidate only its student's entry (the next answer counts it), a model switch all
+of them, and /user/dashboard has to share the entries. Then bot-like traffic (/analysis of random students,
+every twentieth request preceded by a new mark) runs through it and GET /admin/cache reports the hit rate.
+The /predict_success latency of a miss (right after a new mark) and a hit is printed at the end. Redis is used
+if REDIS_URL reaches one, the local tier alone otherwise.
+
+Run from the repository root:
+    python scripts/check_prediction_cache.py [--requests 2000]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import datetime
+import tempfile
+import statistics
+import dataclasses
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SCRIPT_DIR)
+sys.path.append(REPO_DIR)
+sys.path.append(os.path.join(REPO_DIR, "app"))
+
+WORKDIR = tempfile.mkdtemp()
+shutil.copy(os.path.join(REPO_DIR, "example.db"), os.path.join(WORKDIR, "check.db"))
+os.environ["DB_URL"] = f"sqlite+aiosqlite:///{os.path.join(WORKDIR, 'check.db')}"
+os.environ["PREDICTION_REGISTRY"] = os.path.join(WORKDIR, "models")
+os.environ["ADMIN_TOKEN"] = "check"
+os.environ.pop("PREDICTION_MODEL", None)
+
+import httpx
+from sqlalchemy import select
+
+from app import prediction
+from app.prediction import train
+from app.prediction.cache import prediction_cache
+from app.db.engine import engine, async_session_maker
+from app.db.declaration import user_class_table
+from app.fastapi_app import app
+
+ADMIN = {"X-Admin-Token": "check"}
+failures = []
+
+
+def check(condition: bool, message: str):
+    print(f"{'ok  ' if condition else 'FAIL'}  {message}")
+    if not condition:
+        failures.append(message)
+
+
+def describe(timings: list[float]) -> str:
+    return f"p50 {statistics.median(timings) * 1000:.2f}ms" if timings else "none"
+
+
+def newMark(user_uuid, class_uuid) -> dict:
+    return {
+        "user_uuid": str(user_uuid),
+        "class_uuid": str(class_uuid),
+        "discipline": "Математика",
+        "mark": 2,
+        "created_at": datetime.datetime(2025, 5, 20).isoformat(),
+    }
+
+
+async def ask(client: httpx.AsyncClient, user_uuid) -> dict:
+    return (await client.get("/user/predict_success", params={"user_uuid": str(user_uuid)})).json()
+
+
+def counted() -> tuple[int, int]:
+    stats = prediction_cache.stats()
+    return stats["local_hits"] + stats["redis_hits"], stats["misses"]
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000, help="bot-like requests in the traffic run")
+    args = parser.parse_args()
+    rng = random.Random(0)
+    engine.echo = False
+
+    # no model ships with the code: one trained on the copy is published to the temporary registry
+    async with async_session_maker() as session:
+        trained = train.train(await train.loadMarks(session))
+    prediction.registry.publish(trained)
+    prediction.registry.setActive(trained.version)
+
+    async with app.router.lifespan_context(app):
+        async with async_session_maker() as session:
+            memberships = (await session.execute(select(user_class_table))).all()
+        classes = dict(memberships)
+        students = sorted(classes)
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+            first = [await ask(client, user_uuid) for user_uuid in students]
+            hits, misses = counted()
+            check(hits == 0 and misses == len(students), f"first round: {misses} misses, {hits} hits")
+
+            second = [await ask(client, user_uuid) for user_uuid in students]
+            hits, misses = counted()
+            check(hits == len(students) and second == first, f"second round: {hits} hits, answers unchanged")
+
+            student = next(user_uuid for user_uuid, answer in zip(students, first) if answer["total_marks"])
+            before = first[students.index(student)]
+            response = await client.post("/mark", json=newMark(student, classes[student]))
+            assert response.status_code == 201, response.text
+            after = await ask(client, student)
+            check(
+                counted()[1] == misses + 1 and after["total_marks"] == before["total_marks"] + 1
+                and after["bad_marks"] == before["bad_marks"] + 1,
+                f"a new mark invalidates its student: {before['total_marks']} -> {after['total_marks']} marks"
+            )
+            others = [await ask(client, user_uuid) for user_uuid in students if user_uuid != student]
+            check(counted()[1] == misses + 1 and others == [a for u, a in zip(students, first) if u != student],
+                  "the other students still hit")
+
+            dashboard = (await client.get("/user/dashboard", params={"user_uuid": str(student), "charts": ""})).json()
+            check(dashboard["prediction"] == after and counted()[1] == misses + 1, "/user/dashboard shares the entries")
+
+            model = prediction.currentModel()
+            strict = dataclasses.replace(model, threshold=0.99, version=f"{model.version}-strict")
+            prediction.registry.publish(strict)
+            prediction.activate(strict.version)
+            hits, misses = counted()
+            switched = [await ask(client, user_uuid) for user_uuid in students]
+            check(
+                counted()[1] == misses + len(students)
+                and all(answer["model"] == strict.version for answer in switched if answer["total_marks"]),
+                "a model switch invalidates every entry"
+            )
+            prediction.activate(model.version)
+
+            hits_before, misses_before = counted()
+            for i in range(args.requests):
+                user_uuid = rng.choice(students)
+                if i % 20 == 19:
+                    await client.post("/mark", json=newMark(user_uuid, classes[user_uuid]))
+                await client.get("/user/dashboard", params={"user_uuid": str(user_uuid), "charts": ""})
+                await ask(client, user_uuid)
+
+            stats = (await client.get("/admin/cache", headers=ADMIN)).json()["prediction"]
+            hits, misses = counted()
+            traffic_hit_rate = (hits - hits_before) / (hits - hits_before + misses - misses_before)
+            check(stats["hit_rate"] is not None and stats["lookups"] == hits + misses,
+                  f"GET /admin/cache: {stats['lookups']} lookups, hit rate {stats['hit_rate']:.0%} overall, "
+                  f"{traffic_hit_rate:.0%} under the bot-like traffic")
+
+            miss_timings, hit_timings = [], []
+            for user_uuid in students * 5:
+                await client.post("/mark", json=newMark(user_uuid, classes[user_uuid]))
+                for timings in (miss_timings, hit_timings):
+                    started = time.perf_counter()
+                    await ask(client, user_uuid)
+                    timings.append(time.perf_counter() - started)
+
+    print(f"\n/predict_success right after a new mark {describe(miss_timings)}, from the cache {describe(hit_timings)}")
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+    print(f"\n{len(failures)} checks failed" if failures else "\nall checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,93 @@
+"""
+Query plan regression check: runs EXPLAIN on every statement from app.db.queries.hotStatements()
+and exits with 1 if any of them reads a large table with a full scan.
+
+Uses DB_URL if it is set (sqlite or postgresql), otherwise a fresh temporary sqlite database.
+On postgresql sequential scans are disabled for the session, so a "Seq Scan" in the plan
+means that no usable index exists at all rather than that the planner preferred a scan on a tiny table.
+
+Run from the repository root:
+    python scripts/check_query_plans.py
+"""
+import os
+import sys
+import json
+import asyncio
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+if not os.getenv("DB_URL"):
+    os.environ["DB_URL"] = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'plans.db')}"
+
+from sqlalchemy import text
+
+from app.db import engine
+from app.db.queries import hotStatements
+
+# tables that grow with the number of students or marks
+LARGE_TABLES = {
+    "users", "user_class_marks", "user_class", "data_versions", "class_discipline_stats", "student_features"
+}
+
+
+def sqliteScans(plan: list[str]) -> list[str]:
+    # "SCAN t" is a full table scan, "SCAN t USING (COVERING) INDEX" a full index scan - both are regressions
+    return [
+        line for line in plan
+        if line.startswith("SCAN ") and line.split()[1] in LARGE_TABLES
+    ]
+
+
+def postgresScans(plan: dict) -> list[str]:
+    scans = []
+
+    def walk(node: dict):
+        if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") in LARGE_TABLES:
+            scans.append(f"Seq Scan on {node['Relation Name']}")
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan["Plan"])
+    return scans
+
+
+async def explain(conn, stmt) -> tuple[list[str], list[str]]:
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+
+    if conn.dialect.name == "postgresql":
+        plan = (await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))).scalar()
+        plan = plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+        return [json.dumps(plan["Plan"], ensure_ascii=False)], postgresScans(plan)
+
+    rows = (await conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))).all()
+    plan = [row[-1] for row in rows]
+    return plan, sqliteScans(plan)
+
+
+async def main() -> int:
+    engine.engine.echo = False
+    await engine.init_models()
+
+    failed = 0
+    async with engine.engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.execute(text("SET enable_seqscan = off"))
+
+        for name, stmt in hotStatements().items():
+            plan, scans = await explain(conn, stmt)
+            if scans:
+                failed += 1
+                print(f"FAIL  {name}: {', '.join(scans)}")
+                for line in plan:
+                    print(f"        {line}")
+            else:
+                print(f"ok    {name}")
+
+    print(f"\n{failed} of {len(hotStatements())} statements regressed to a full scan")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,156 @@
+"""
+Checks tg_bot.scheduler.UpdateScheduler on a real aiogram dispatcher: the handler concurrency limit, the order
+of the updates of one chat, the "busy, try again" replies once the queue is full and the update metrics.
+
+Telegram is the fake session of check_file_id_cache.py; the handlers are stand-ins, /slow sleeps like
+/statistics waiting for its chart and /quick answers at once.
+
+Run from the repository root:
+    python scripts/check_update_scheduler.py
+"""
+import os
+import sys
+import time
+import asyncio
+import datetime
+import itertools
+from collections import defaultdict
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+sys.path.append(SCRIPT_DIR)
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.filters import Command
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import SendMessage
+from aiogram.types import Message, Update
+
+from check_file_id_cache import FakeTelegramSession
+from tg_bot.metrics import update_metrics
+from tg_bot.scheduler import UpdateScheduler, BUSY_TEXT
+
+CONCURRENCY = 4
+QUEUE_LIMIT = 8
+CHAT_QUEUE_LIMIT = 3
+SLOW_SECONDS = 0.2
+
+
+class RecordingSession(FakeTelegramSession):
+    def __init__(self):
+        super().__init__()
+        self.replies: dict[int, list[tuple[str, float]]] = defaultdict(list)  # chat_id -> (text, when)
+
+    async def make_request(self, bot, method, timeout=None):
+        if isinstance(method, SendMessage):
+            self.replies[method.chat_id].append((method.text, time.perf_counter()))
+        return await super().make_request(bot, method, timeout)
+
+
+class Handlers:
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+        self.handled: dict[int, list[str]] = defaultdict(list)  # chat_id -> texts in the order handled
+        self.router = Router()
+        self.router.message(Command("slow"))(self.slow)
+        self.router.message(Command("quick"))(self.quick)
+
+    async def _handle(self, msg: Message, seconds: float):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(seconds)
+            self.handled[msg.chat.id].append(msg.text)
+            await msg.answer(f"done {msg.text}")
+        finally:
+            self.running -= 1
+
+    async def slow(self, msg: Message):
+        await self._handle(msg, SLOW_SECONDS)
+
+    async def quick(self, msg: Message):
+        await self._handle(msg, 0)
+
+
+update_ids = itertools.count(1)
+
+
+def update(bot: Bot, chat_id: int, text: str) -> Update:
+    update_id = next(update_ids)
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(datetime.datetime.now().timestamp()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Student"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+        },
+    }, context={"bot": bot})
+
+
+def setup():
+    session = RecordingSession()
+    bot = Bot(token="123456:check", session=session)
+    handlers = Handlers()
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.update.outer_middleware(UpdateScheduler(CONCURRENCY, QUEUE_LIMIT, CHAT_QUEUE_LIMIT))
+    dp.include_router(handlers.router)
+    update_metrics.reset()
+    return bot, dp, session, handlers
+
+
+def check(name: str, ok: bool, details: str) -> bool:
+    print(f"{'ok  ' if ok else 'FAIL'} {name}: {details}")
+    return ok
+
+
+async def main() -> int:
+    results = []
+
+    # a burst of slow commands from different chats: CONCURRENCY run, QUEUE_LIMIT wait, the rest are refused
+    bot, dp, session, handlers = setup()
+    burst = 20
+    started = time.perf_counter()
+    await asyncio.gather(*(dp.feed_update(bot, update(bot, chat_id, "/slow")) for chat_id in range(1, burst + 1)))
+    busy = [replies[0][1] - started for replies in session.replies.values() if replies[0][0] == BUSY_TEXT]
+    done = [replies[0][1] - started for replies in session.replies.values() if replies[0][0] != BUSY_TEXT]
+    results.append(check(
+        "concurrency limit", handlers.max_running == CONCURRENCY,
+        f"at most {handlers.max_running} handlers at a time, limit {CONCURRENCY}"
+    ))
+    results.append(check(
+        "busy fast path", len(busy) == burst - CONCURRENCY - QUEUE_LIMIT and len(done) == CONCURRENCY + QUEUE_LIMIT,
+        f"{len(done)} handled (last after {max(done) * 1000:.0f}ms), "
+        f"{len(busy)} told busy (after {max(busy) * 1000:.1f}ms at most)"
+    ))
+
+    # one chat: handled one at a time and in order, over CHAT_QUEUE_LIMIT refused
+    bot, dp, session, handlers = setup()
+    texts = ["/slow 1", "/quick 2", "/quick 3", "/quick 4"]
+    await asyncio.gather(*(dp.feed_update(bot, update(bot, 1, text)) for text in texts))
+    replies = [text for text, _ in session.replies[1]]
+    results.append(check(
+        "per chat order", handlers.handled[1] == texts[:CHAT_QUEUE_LIMIT] and handlers.max_running == 1,
+        f"handled {handlers.handled[1]}, {handlers.max_running} at a time"
+    ))
+    results.append(check(
+        "per chat limit", replies.count(BUSY_TEXT) == len(texts) - CHAT_QUEUE_LIMIT,
+        f"replies {replies}"
+    ))
+
+    # the queue is free again afterwards
+    await dp.feed_update(bot, update(bot, 2, "/quick"))
+    results.append(check(
+        "queue drained", update_metrics.waiting == 0 and update_metrics.running == 0 and handlers.handled[2],
+        f"{update_metrics.waiting} waiting, {update_metrics.running} running"
+    ))
+
+    print(update_metrics.render())
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
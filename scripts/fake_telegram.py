@@ -0,0 +1,166 @@
+"""
+A local fake Telegram for the webhook mode: posts updates to /webhook/telegram at a fixed rate and plays the
+Bot API the bot replies to, so the whole update -> handler -> reply loop runs without Telegram.
+
+Start the api in webhook mode pointed at this script, e.g.
+
+    BOT_UPDATES=webhook WEBHOOK_SECRET=secret TELEGRAM_API_URL=http://127.0.0.1:8081 python app/main.py
+
+then
+
+    python scripts/fake_telegram.py --url http://127.0.0.1:8443/webhook/telegram --secret secret --rate 50 --duration 10
+
+Every update comes from its own chat, so a reply is attributed to the update exactly. Reported are the
+acknowledgement latency of the webhook (should stay flat whatever the handlers do), the time until the first
+reply of each update and the updates that got no reply within --drain seconds after the last post.
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+import itertools
+from collections import Counter
+
+import httpx
+from aiohttp import web
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class FakeTelegram:
+    def __init__(self, chat_offset: int):
+        self.chat_offset = chat_offset
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.posted_at: dict[int, float] = {}  # chat_id -> when its update was posted
+        self.first_reply: dict[int, float] = {}  # chat_id -> seconds from the post to the first reply
+        self.acks: list[float] = []
+        self.statuses = Counter()
+        self.methods = Counter()
+
+    def _message(self, chat_id: int, **kwargs) -> dict:
+        return {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            **kwargs,
+        }
+
+    async def botApi(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.methods[method] += 1
+
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        chat_id = int(params["chat_id"]) if "chat_id" in params else None
+        if chat_id in self.posted_at and chat_id not in self.first_reply:
+            self.first_reply[chat_id] = time.perf_counter() - self.posted_at[chat_id]
+
+        photo = [{"file_id": f"file-{next(self.message_ids)}", "file_unique_id": "u", "width": 640, "height": 480}]
+        if method == "getMe":
+            result = BOT_USER
+        elif method == "sendMessage":
+            result = self._message(chat_id, text=params.get("text", ""))
+        elif method == "sendPhoto":
+            result = self._message(chat_id, photo=photo)
+        elif method == "sendMediaGroup":
+            media = params["media"]
+            media = json.loads(media) if isinstance(media, str) else media
+            result = [self._message(chat_id, photo=photo) for _ in media]
+        else:
+            result = True
+
+        return web.json_response({"ok": True, "result": result})
+
+    def update(self, text: str) -> dict:
+        update_id = next(self.update_ids)
+        chat_id = self.chat_offset + update_id
+        user = {"id": chat_id, "is_bot": False, "first_name": f"Student {update_id}"}
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private", "first_name": user["first_name"]},
+                "from": user,
+                "text": text,
+                "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}] if text.startswith("/") else [],
+            },
+        }
+
+    async def post(self, client: httpx.AsyncClient, url: str, secret: str | None, text: str):
+        update = self.update(text)
+        chat_id = update["message"]["chat"]["id"]
+        headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+
+        started = time.perf_counter()
+        self.posted_at[chat_id] = started
+        try:
+            response = await client.post(url, json=update, headers=headers)
+            self.statuses[response.status_code] += 1
+        except httpx.HTTPError as e:
+            self.statuses[type(e).__name__] += 1
+        self.acks.append(time.perf_counter() - started)
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8443/webhook/telegram", help="webhook of the api")
+    parser.add_argument("--secret", default=None, help="WEBHOOK_SECRET of the api")
+    parser.add_argument("--rate", type=float, default=20, help="updates per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to post for")
+    parser.add_argument("--text", default="/my_grades", help="text of every message")
+    parser.add_argument("--api-port", type=int, default=8081, help="port of the fake Bot API (TELEGRAM_API_URL)")
+    parser.add_argument("--drain", type=float, default=30, help="seconds to wait for replies after the last post")
+    parser.add_argument("--chat-offset", type=int, default=10_000_000, help="chat ids start after this")
+    args = parser.parse_args()
+
+    telegram = FakeTelegram(args.chat_offset)
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_route("*", "/bot{token}/{method}", telegram.botApi)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.api_port).start()
+
+    limits = httpx.Limits(max_connections=1000, max_keepalive_connections=100)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        total = int(args.rate * args.duration)
+        started = time.perf_counter()
+        posts = []
+        for i in range(total):
+            # a fixed schedule, so slow acknowledgements do not lower the offered rate
+            await asyncio.sleep(max(0.0, started + i / args.rate - time.perf_counter()))
+            posts.append(asyncio.create_task(telegram.post(client, args.url, args.secret, args.text)))
+        await asyncio.gather(*posts)
+        posting = time.perf_counter() - started
+
+    deadline = time.perf_counter() + args.drain
+    while len(telegram.first_reply) < total and time.perf_counter() < deadline:
+        await asyncio.sleep(0.1)
+    await runner.cleanup()
+
+    replies = list(telegram.first_reply.values())
+    print(f"posted {total} updates in {posting:.1f}s ({total / posting:.1f}/s), responses {dict(telegram.statuses)}")
+    print(f"ack latency:  p50 {percentile(telegram.acks, 0.5) * 1000:.1f}ms, "
+          f"p99 {percentile(telegram.acks, 0.99) * 1000:.1f}ms, max {max(telegram.acks) * 1000:.1f}ms")
+    print(f"first reply:  p50 {percentile(replies, 0.5) * 1000:.1f}ms, "
+          f"p99 {percentile(replies, 0.99) * 1000:.1f}ms, {len(replies)} of {total} updates answered")
+    print(f"bot api calls: {dict(telegram.methods)}")
+
+    return 0 if len(replies) == total and set(telegram.statuses) == {200} else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
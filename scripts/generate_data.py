@@ -53,6 +53,7 @@ def random_datetime_within_year():
     return (now - delta).isoformat()
 
 def add_mark(user_uuid, class_uuid, grade_profile):
+    marks = []
     for _ in range(random.randint(200, 300)):
         created_at = random_datetime_within_year()
         discipline = random.choice(DISCIPLINES)
@@ -66,7 +67,7 @@ def add_mark(user_uuid, class_uuid, grade_profile):
         else:
             mark = random.choice(GRADE_PROFILES[grade_profile])
 
-        requests.post(f"{BASE_URL}/mark", json={
+        marks.append({
             "user_uuid": user_uuid,
             "class_uuid": class_uuid,
             "discipline": discipline,
@@ -74,6 +75,11 @@ def add_mark(user_uuid, class_uuid, grade_profile):
             "created_at": created_at
         })
 
+    # one request per student instead of one per mark
+    res = requests.post(f"{BASE_URL}/mark/bulk", json=marks)
+    if res.json()["rejected"]:
+        print(f"Some marks of {user_uuid} were rejected: {res.json()['errors']}")
+
 
 def main():
     school_uuid = create_school(SCHOOLS[0])
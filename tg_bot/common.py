@@ -7,7 +7,7 @@ from aiogram.fsm.storage.base import StorageKey
 from aiogram.types import Message, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardMarkup
 
-from app.db.schemas.user import Roles
+from tg_bot.identity import resolveUser
 
 async def getFSMContext(user_id: int) -> FSMContext:
     from tg_bot.config import dp, bot
@@ -21,47 +21,6 @@ async def getFSMContext(user_id: int) -> FSMContext:
         ),
     )
 
-async def updateNewUser(msg: Message):
-    from tg_bot.config import httpx_client
-
-    params = {
-        "chat_id": msg.chat.id,
-        "role": Roles.student.value
-    }
-
-    resp = await httpx_client.post(
-        "user",
-        params=params
-    )
-    state = await getFSMContext(msg.chat.id)
-    await state.update_data({"user_uuid": resp.json()["uuid"]})
-
-
-async def updateExistingUser(msg: Message):
-    from tg_bot.config import httpx_client
-
-    # await httpx_client.patch(
-    #     "user",
-    #     params={"chat_id": msg.chat.id},
-    # )
-    params = {
-        "chat_id": msg.chat.id,
-    }
-    resp = await httpx_client.get(
-        "user",
-        params=params
-    )
-
-    state = await getFSMContext(msg.chat.id)
-    await state.update_data({"user_uuid": resp.json()["uuid"]})
-
-
-async def isUserExist(msg: Message) -> bool:
-    from tg_bot.config import httpx_client
-
-    resp = await httpx_client.get("user", params={"chat_id": msg.chat.id})
-    return resp.status_code == 200
-
 
 def getTypeMessage(_input: Message | CallbackQuery) -> Message:
     if isinstance(_input, CallbackQuery):
@@ -75,14 +34,8 @@ def updateUserDecorator(func: Callable):
     async def wrapper(_input: Message | CallbackQuery, state: FSMContext):
         msg = getTypeMessage(_input)
 
-        logging.info("UPDATE USER DECORATOR")
-        if await isUserExist(msg):
-            logging.info("ISUSEREXIST")
-            await updateExistingUser(msg)
-            await func(_input, state)
-        else:
-            logging.info("NOT ISUSEREXIST")
-            await updateNewUser(msg)
-            await func(_input, state)
+        # обычно это попадание в кэш без единого запроса к api
+        await resolveUser(msg.chat.id, state)
+        await func(_input, state)
 
     return wrapper
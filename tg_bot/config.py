@@ -1,5 +1,7 @@
 import os
+import sys
 import logging
+import contextlib
 import asyncio
 import time
 
@@ -7,20 +9,26 @@ import aiogram
 import httpx
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.storage.redis import RedisStorage
 from redis.asyncio import Redis
 
 from tg_bot.utilities import CustomAsyncClient
 
 
-redis = Redis(host="redis")
+redis = Redis.from_url(os.getenv("REDIS_URL") or "redis://redis")
 
 
 tg_bot_secret = os.getenv("BOT_TOKEN")
 
+# TELEGRAM_API_URL points the bot at another Bot API server: a local one or a fake for load tests
+telegram_api_url = os.getenv("TELEGRAM_API_URL")
+
 bot = Bot(
     token=tg_bot_secret,
     default=DefaultBotProperties(parse_mode=aiogram.enums.ParseMode.HTML),
+    session=AiohttpSession(api=TelegramAPIServer.from_base(telegram_api_url)) if telegram_api_url else None,
 )
 
 bot.redis = redis
@@ -29,10 +37,35 @@ storage = RedisStorage(redis)
 
 dp = Dispatcher(storage=storage)
 
-DATA_TRANSFER_PROTOCOL = "https" if os.getenv("TLS_KEYFILE") and os.getenv("TLS_CERTFILE") else "http"
-base_url = f"{DATA_TRANSFER_PROTOCOL}://app:{os.getenv('API_PORT')}/"
-# verify=False because this shit is used locally only
-httpx_client = CustomAsyncClient(
-    base_url=base_url,
-    verify=False
-)
\ No newline at end of file
+# API_TRANSPORT=asgi runs the api inside the bot process: requests are handed to the ASGI app directly,
+# without TCP, TLS and the docker network in between. app/requirements.txt has to be installed for the bot then
+API_TRANSPORT = os.getenv("API_TRANSPORT") or "http"
+
+if API_TRANSPORT == "asgi":
+    # the api imports its db package as a top-level module, see app/main.py
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+    from app.fastapi_app import app as api_app
+
+    base_url = "http://app/"
+    httpx_client = CustomAsyncClient(
+        base_url=base_url,
+        transport=httpx.ASGITransport(app=api_app)
+    )
+else:
+    api_app = None
+
+    DATA_TRANSFER_PROTOCOL = "https" if os.getenv("TLS_KEYFILE") and os.getenv("TLS_CERTFILE") else "http"
+    base_url = f"{DATA_TRANSFER_PROTOCOL}://{os.getenv('API_HOST') or 'app'}:{os.getenv('API_PORT')}/"
+    # verify=False because this shit is used locally only
+    httpx_client = CustomAsyncClient(
+        base_url=base_url,
+        verify=False
+    )
+
+
+def apiLifespan():
+    """startup and shutdown of the in-process api (db models, rollups, chart workers), a no-op over http"""
+    if api_app is None:
+        return contextlib.nullcontext()
+
+    return api_app.router.lifespan_context(api_app)
\ No newline at end of file
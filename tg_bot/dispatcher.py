@@ -0,0 +1,117 @@
+"""
+The dispatcher with every bot router, shared by both ways updates can arrive:
+
+- BOT_UPDATES=polling (default): tg_bot/main.py long-polls Telegram;
+- BOT_UPDATES=webhook: Telegram posts updates to the api's /webhook/telegram (app/routers/webhook.py),
+  which hands them to feedUpdate() and answers at once, the handlers run in background tasks.
+
+In webhook mode the api registers WEBHOOK_URL + /webhook/telegram with Telegram on startup (skipped when
+WEBHOOK_URL is empty, e.g. for a local fake Telegram) and Telegram sends WEBHOOK_SECRET with every update.
+With UPDATE_QUEUE=redis the webhook only queues the updates and tg_bot/worker.py processes handle them,
+see tg_bot/update_stream.py.
+"""
+import os
+import asyncio
+import logging
+
+from aiogram import Dispatcher
+from aiogram.types import Update
+
+BOT_UPDATES = os.getenv("BOT_UPDATES") or "polling"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_PATH = "/webhook/telegram"
+UPDATE_QUEUE = os.getenv("UPDATE_QUEUE") or "memory"
+
+# seconds the api waits on shutdown for updates that are still being handled
+WEBHOOK_DRAIN_TIMEOUT = 10
+
+_configured = False
+# references to the running handlers, asyncio only keeps weak ones
+_processing: set[asyncio.Task] = set()
+
+
+def webhookEnabled() -> bool:
+    return BOT_UPDATES == "webhook"
+
+
+def setupDispatcher() -> Dispatcher:
+    global _configured
+    from tg_bot.config import dp
+    from tg_bot.filters import IsPrivate, IsPrivateCallback
+    from tg_bot.routers.user.init_routers import router as user_router
+    from tg_bot.scheduler import UpdateScheduler
+
+    if not _configured:
+        dp.message.filter(IsPrivate())
+        dp.callback_query.filter(IsPrivateCallback())
+        # after aiogram's own outer middlewares, so the chat of the update is known
+        dp.update.outer_middleware(UpdateScheduler())
+
+        dp.include_routers(
+            user_router,
+        )
+        _configured = True
+
+    return dp
+
+
+def _logFailure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logging.error("Update handling failed", exc_info=task.exception())
+
+
+def feedUpdate(data: dict) -> asyncio.Task:
+    """validates a raw update from the webhook and handles it in the background"""
+    from tg_bot.config import bot
+
+    dp = setupDispatcher()
+    update = Update.model_validate(data, context={"bot": bot})
+
+    task = asyncio.create_task(dp.feed_update(bot, update))
+    _processing.add(task)
+    task.add_done_callback(_processing.discard)
+    task.add_done_callback(_logFailure)
+    return task
+
+
+async def acceptUpdate(data: dict):
+    """handles a webhook update in this process, or queues it for the workers with UPDATE_QUEUE=redis"""
+    if UPDATE_QUEUE != "redis":
+        feedUpdate(data)
+        return
+
+    from tg_bot.config import redis
+    from tg_bot.update_stream import publishUpdate
+
+    # malformed updates are refused here as well, not by a worker later
+    Update.model_validate(data)
+    await publishUpdate(redis, data)
+
+
+async def startWebhook():
+    from tg_bot.config import bot
+
+    dp = setupDispatcher()
+    if not WEBHOOK_URL:
+        logging.warning("BOT_UPDATES=webhook without WEBHOOK_URL: the webhook is not registered with Telegram")
+        return
+
+    await bot.set_webhook(
+        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET or None,
+        allowed_updates=dp.resolve_used_update_types()
+    )
+    logging.info(f"Telegram webhook set to {WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH}")
+
+
+async def stopWebhook():
+    from tg_bot.config import bot
+    from tg_bot.metrics import dumpMetrics
+
+    if _processing:
+        logging.info(f"Waiting for {len(_processing)} updates still being handled")
+        await asyncio.wait(set(_processing), timeout=WEBHOOK_DRAIN_TIMEOUT)
+
+    await bot.session.close()
+    dumpMetrics()
@@ -0,0 +1,68 @@
+"""
+chat_id -> user_uuid resolved once and cached on the bot side.
+
+Two tiers with the same IDENTITY_TTL: a process-local LRU in front of the FSM data (Redis), which survives
+restarts and is shared by all bot processes. A known user costs no API calls at all, a miss costs a single
+POST /user/ensure which gets or creates the user.
+
+forgetUser() drops both tiers, e.g. when the api no longer knows the cached uuid. Other processes keep
+their local copy until it expires, so IDENTITY_TTL bounds how long a stale uuid can live.
+"""
+import os
+import time
+from collections import OrderedDict
+
+from aiogram.fsm.context import FSMContext
+
+from app.db.schemas.user import Roles
+
+IDENTITY_TTL = int(os.getenv("IDENTITY_TTL") or 60 * 60)
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE") or 10_000)
+
+# chat_id -> (user_uuid, checked_at). Wall clock, because checked_at is also stored in the FSM data
+_local: OrderedDict[int, tuple[str, float]] = OrderedDict()
+
+
+def _remember(chat_id: int, user_uuid: str, checked_at: float):
+    _local[chat_id] = (user_uuid, checked_at)
+    _local.move_to_end(chat_id)
+    while len(_local) > IDENTITY_CACHE_SIZE:
+        _local.popitem(last=False)
+
+
+def _fresh(checked_at: float | None, now: float) -> bool:
+    return checked_at is not None and now - checked_at < IDENTITY_TTL
+
+
+async def resolveUser(chat_id: int, state: FSMContext) -> str:
+    """uuid of the user behind chat_id, creating the user on the first contact"""
+    from tg_bot.config import httpx_client
+
+    now = time.time()
+
+    cached = _local.get(chat_id)
+    if cached is not None and _fresh(cached[1], now):
+        _local.move_to_end(chat_id)
+        return cached[0]
+
+    data = await state.get_data()
+    if data.get("user_uuid") and _fresh(data.get("user_checked_at"), now):
+        _remember(chat_id, data["user_uuid"], data["user_checked_at"])
+        return data["user_uuid"]
+
+    resp = await httpx_client.post(
+        "user/ensure",
+        params={"chat_id": chat_id, "role": Roles.student.value}
+    )
+    resp.raise_for_status()
+    user_uuid = resp.json()["uuid"]
+
+    await state.update_data({"user_uuid": user_uuid, "user_checked_at": now})
+    _remember(chat_id, user_uuid, now)
+
+    return user_uuid
+
+
+async def forgetUser(chat_id: int, state: FSMContext):
+    _local.pop(chat_id, None)
+    await state.update_data({"user_uuid": None, "user_checked_at": None})
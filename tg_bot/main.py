@@ -1,5 +1,6 @@
 import os
 import sys
+import signal
 import asyncio
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -24,21 +25,33 @@ import logging
 
 
 async def main():
-    from tg_bot.config import dp, bot
-    from tg_bot.filters import IsPrivate, IsPrivateCallback
-    from tg_bot.routers.user.init_routers import router as user_router
-    # await bot.delete_webhook(drop_pending_updates=True)
-
-    dp.message.filter(IsPrivate())
-    dp.callback_query.filter(IsPrivateCallback())
-
-
-    dp.include_routers(
-        user_router,
-        # user_routers.router,
-    )
-
-    await dp.start_polling(bot)
+    from tg_bot.config import bot, apiLifespan
+    from tg_bot.metrics import dumpMetrics, dumpMetricsPeriodically
+    from tg_bot.dispatcher import setupDispatcher, webhookEnabled
+
+    if webhookEnabled():
+        # обновления принимает api на /webhook/telegram, здесь опрашивать нечего
+        logging.info("BOT_UPDATES=webhook: updates are handled by the api, polling is off")
+        await asyncio.Event().wait()
+
+    dp = setupDispatcher()
+    # иначе после работы в режиме webhook Telegram отвечал бы на getUpdates конфликтом
+    await bot.delete_webhook()
+
+    # Метрики запросов к api: в лог раз в METRICS_DUMP_INTERVAL секунд и по kill -USR1
+    metrics_interval = float(os.getenv("METRICS_DUMP_INTERVAL") or 300)
+    metrics_task = asyncio.create_task(dumpMetricsPeriodically(metrics_interval)) if metrics_interval > 0 else None
+    if hasattr(signal, "SIGUSR1"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, dumpMetrics)
+
+    try:
+        # при API_TRANSPORT=asgi api живёт в этом же процессе
+        async with apiLifespan():
+            await dp.start_polling(bot)
+    finally:
+        if metrics_task is not None:
+            metrics_task.cancel()
+        dumpMetrics()
 
     logging.info("Bot polling started")
 
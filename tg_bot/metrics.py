@@ -0,0 +1,194 @@
+"""
+Latency histograms and error counters of the bot -> api calls, per endpoint, and of the updates themselves.
+
+Every call made through CustomAsyncClient is recorded under "METHOD /path", with uuids in the path
+replaced by {uuid} so the number of series stays bounded. Updates are recorded by tg_bot/scheduler.py under
+their command ("message /statistics") or type ("callback_query"): time spent queued, time in the handler,
+rejections, and the queue depth. render() formats everything as text: main.py and worker.py log it every
+METRICS_DUMP_INTERVAL seconds and on SIGUSR1.
+"""
+from __future__ import annotations
+
+import re
+import bisect
+import asyncio
+import logging
+from collections import Counter, defaultdict
+
+# upper bounds of the latency buckets, seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_UUID_RE = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+
+
+def endpointName(method: str, path: str) -> str:
+    return f"{method} /{_UUID_RE.sub('{uuid}', path.strip('/'))}"
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """upper bound of the bucket holding the q-th observation, the usual histogram estimate"""
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class ApiMetrics:
+    def __init__(self):
+        self.latency: defaultdict[str, Histogram] = defaultdict(Histogram)
+        self.responses: defaultdict[str, Counter] = defaultdict(Counter)  # endpoint -> "2xx"/"4xx"/...
+        self.errors: defaultdict[str, Counter] = defaultdict(Counter)  # endpoint -> "timeout"/"transport"/...
+
+    def record(self, method: str, path: str, seconds: float, status_code: int | None = None, error: str | None = None):
+        endpoint = endpointName(method, path)
+        self.latency[endpoint].observe(seconds)
+
+        if status_code is not None:
+            self.responses[endpoint][f"{status_code // 100}xx"] += 1
+            if status_code >= 500:
+                self.errors[endpoint]["5xx"] += 1
+        if error is not None:
+            self.errors[endpoint][error] += 1
+
+    def snapshot(self) -> dict:
+        return {
+            endpoint: {
+                "count": histogram.count,
+                "mean": histogram.sum / histogram.count if histogram.count else 0.0,
+                "p50": histogram.quantile(0.5),
+                "p95": histogram.quantile(0.95),
+                "p99": histogram.quantile(0.99),
+                "buckets": dict(zip([*map(str, histogram.buckets), "+Inf"], histogram.counts)),
+                "responses": dict(self.responses[endpoint]),
+                "errors": dict(self.errors[endpoint]),
+            }
+            for endpoint, histogram in sorted(self.latency.items())
+        }
+
+    def render(self) -> str:
+        lines = []
+        for endpoint, stats in self.snapshot().items():
+            errors = ", ".join(f"{kind} {count}" for kind, count in stats["errors"].items()) or "no errors"
+            lines.append(
+                f"{endpoint}: {stats['count']} calls, mean {stats['mean'] * 1000:.0f}ms, "
+                f"p50 <= {stats['p50'] * 1000:.0f}ms, p95 <= {stats['p95'] * 1000:.0f}ms, "
+                f"p99 <= {stats['p99'] * 1000:.0f}ms, {errors}"
+            )
+        return "\n".join(lines) or "no api calls yet"
+
+    def reset(self):
+        self.latency.clear()
+        self.responses.clear()
+        self.errors.clear()
+
+
+# commands are whatever users type, past this many series the rest are counted together
+MAX_UPDATE_SERIES = 50
+
+
+def updateName(update) -> str:
+    """"message /command" for commands, the update type otherwise"""
+    event_type = update.event_type
+    if event_type == "message" and update.message.text and update.message.text.startswith("/"):
+        return f"message {update.message.text.split()[0].split('@')[0]}"
+    return event_type
+
+
+class UpdateMetrics:
+    def __init__(self):
+        self.queued: defaultdict[str, Histogram] = defaultdict(Histogram)
+        self.handling: defaultdict[str, Histogram] = defaultdict(Histogram)
+        self.rejected = Counter()
+        self.waiting = 0
+        self.running = 0
+        self.max_waiting = 0
+
+    def _series(self, name: str) -> str:
+        if name in self.handling or len(self.handling) < MAX_UPDATE_SERIES:
+            return name
+        return "message /other" if name.startswith("message /") else name
+
+    def depth(self, waiting: int, running: int):
+        self.waiting = waiting
+        self.running = running
+        self.max_waiting = max(self.max_waiting, waiting)
+
+    def record(self, name: str, queued: float, handling: float):
+        name = self._series(name)
+        self.queued[name].observe(queued)
+        self.handling[name].observe(handling)
+
+    def reject(self, name: str):
+        self.rejected[self._series(name)] += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "waiting": self.waiting,
+            "running": self.running,
+            "max_waiting": self.max_waiting,
+            "updates": {
+                name: {
+                    "count": histogram.count,
+                    "mean": histogram.sum / histogram.count if histogram.count else 0.0,
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                    "queued_p95": self.queued[name].quantile(0.95),
+                    "rejected": self.rejected[name],
+                }
+                for name, histogram in sorted(self.handling.items())
+            },
+            "rejected": dict(self.rejected),
+        }
+
+    def render(self) -> str:
+        snapshot = self.snapshot()
+        lines = [
+            f"queue: {snapshot['waiting']} waiting (max {snapshot['max_waiting']}), {snapshot['running']} running, "
+            f"{sum(self.rejected.values())} rejected as busy"
+        ]
+        for name, stats in snapshot["updates"].items():
+            lines.append(
+                f"{name}: {stats['count']} handled, mean {stats['mean'] * 1000:.0f}ms, "
+                f"p50 <= {stats['p50'] * 1000:.0f}ms, p95 <= {stats['p95'] * 1000:.0f}ms, "
+                f"queued p95 <= {stats['queued_p95'] * 1000:.0f}ms, {stats['rejected']} rejected"
+            )
+        return "\n".join(lines)
+
+    def reset(self):
+        self.queued.clear()
+        self.handling.clear()
+        self.rejected.clear()
+        self.max_waiting = self.waiting
+
+
+api_metrics = ApiMetrics()
+update_metrics = UpdateMetrics()
+
+
+def dumpMetrics():
+    logging.info("api metrics:\n" + api_metrics.render())
+    logging.info("update metrics:\n" + update_metrics.render())
+
+
+async def dumpMetricsPeriodically(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        dumpMetrics()
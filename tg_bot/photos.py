@@ -0,0 +1,96 @@
+"""
+Chart photos are sent by Telegram file_id when the very same PNG was uploaded before.
+
+Telegram keeps every uploaded photo. Sending its file_id instead of the bytes skips the upload entirely.
+For unchanged data the api returns byte-identical charts, so the sha256 of the PNG is the key.
+
+file_ids live in a TieredCache: an in-process LRU bounded by FILE_ID_CACHE_MB in front of Redis.
+Every reuse rewrites the entry, so the FILE_ID_TTL window slides and charts nobody asks for fall out
+first. A file_id Telegram no longer accepts is dropped and the photo is uploaded again.
+
+Several charts of one command go out as a single media group via answerChartAlbum().
+"""
+import os
+import hashlib
+import logging
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, BufferedInputFile, InputMediaPhoto
+
+from app.cache import TieredCache
+
+file_id_cache = TieredCache(
+    namespace="tg_file_id",
+    max_bytes=int(os.getenv("FILE_ID_CACHE_MB") or 4) * 1024 * 1024,
+    ttl=int(os.getenv("FILE_ID_TTL") or 7 * 24 * 60 * 60)
+)
+
+
+def photoKey(bot_id: int, png: bytes) -> str:
+    # file_id is only valid for the bot that uploaded the photo
+    return f"{bot_id}:{hashlib.sha256(png).hexdigest()}"
+
+
+async def answerChart(msg: Message, png: bytes, filename: str, caption: str | None = None, **kwargs) -> Message:
+    """msg.answer_photo() which uploads png only if this bot has never sent it"""
+    key = photoKey(msg.bot.id, png)
+
+    file_id = await file_id_cache.get(key)
+    if file_id is not None:
+        try:
+            sent = await msg.answer_photo(photo=file_id.decode(), caption=caption, **kwargs)
+            await file_id_cache.set(key, file_id)
+            return sent
+        except TelegramBadRequest as e:
+            logging.warning(f"Cached file_id of {filename} was rejected, uploading it again: {e}")
+            await file_id_cache.delete(key)
+
+    sent = await msg.answer_photo(photo=BufferedInputFile(png, filename=filename), caption=caption, **kwargs)
+    if sent.photo:
+        await file_id_cache.set(key, sent.photo[-1].file_id.encode())
+
+    return sent
+
+
+def _album(charts: list[tuple[bytes, str, str | None]], file_ids: list[bytes | None]) -> list[InputMediaPhoto]:
+    return [
+        InputMediaPhoto(
+            media=file_id.decode() if file_id is not None else BufferedInputFile(png, filename=filename),
+            caption=caption
+        )
+        for (png, filename, caption), file_id in zip(charts, file_ids)
+    ]
+
+
+async def answerChartAlbum(msg: Message, charts: list[tuple[bytes, str, str | None]]) -> list[Message]:
+    """
+    (png, filename, caption) charts sent as one media group, a single Telegram request with every caption
+    under its own photo. Only the charts this bot has never sent are uploaded
+    """
+    if len(charts) == 1:
+        png, filename, caption = charts[0]
+        return [await answerChart(msg, png, filename, caption=caption)]
+
+    keys = [photoKey(msg.bot.id, png) for png, _, _ in charts]
+    file_ids = [await file_id_cache.get(key) for key in keys]
+
+    try:
+        sent = await msg.answer_media_group(media=_album(charts, file_ids))
+    except TelegramBadRequest as e:
+        if not any(file_ids):
+            raise
+
+        # which of the ids was rejected is not reported, so the whole album is uploaded again
+        logging.warning(f"Cached file_ids of an album were rejected, uploading it again: {e}")
+        for key, file_id in zip(keys, file_ids):
+            if file_id is not None:
+                await file_id_cache.delete(key)
+
+        file_ids = [None] * len(charts)
+        sent = await msg.answer_media_group(media=_album(charts, file_ids))
+
+    for key, message in zip(keys, sent):
+        if message.photo:
+            await file_id_cache.set(key, message.photo[-1].file_id.encode())
+
+    return sent
@@ -1,10 +1,9 @@
 import logging
-import tempfile
 
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, FSInputFile
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
 from aiogram.types import InputFile
 from io import BytesIO
 from aiogram.types import BufferedInputFile
@@ -13,7 +12,10 @@ from aiogram.types import BufferedInputFile
 from tg_bot.filters import IsPrivate, IsPrivateCallback
 from tg_bot import keyboards
 from tg_bot.config import httpx_client
+from tg_bot.utilities import RequestGroup, isOk, dashboardChart, CHART_TIMEOUT
 from tg_bot.common import updateUserDecorator
+from tg_bot.identity import resolveUser, forgetUser
+from tg_bot.photos import answerChart, answerChartAlbum
 
 
 router = Router()
@@ -21,9 +23,22 @@ router.message.filter(IsPrivate())
 router.callback_query.filter(IsPrivateCallback())
 
 
+async def getClassDescriptions(_classes: list[dict]) -> list[str]:
+    # Школы всех классов — одним запросом
+    _schools_resp = await httpx_client.get(
+        "school/batch",
+        params={"uuid": list(dict.fromkeys(_class["school_uuid"] for _class in _classes))}
+    )
+    school_names = {_school["uuid"]: _school["facility_name"] for _school in _schools_resp.json()}
+
+    return [
+        f"{school_names.get(_class['school_uuid'], 'Неизвестная школа')}\n" + f"Класс: {_class['class_name']}\n"
+        for _class in _classes
+    ]
+
+
 async def getClassDescription(_class_resp: dict) -> str:
-    _school_resp = (await httpx_client.get("school", params={"uuid": _class_resp["school_uuid"]})).json()
-    return f"{_school_resp['facility_name']}\n" + f"Класс: {_class_resp['class_name']}\n"
+    return (await getClassDescriptions([_class_resp]))[0]
 
 
 @router.message(Command("start"))
@@ -93,11 +108,14 @@ async def start(msg: Message, state: FSMContext):
 @updateUserDecorator
 async def joinClass(call: CallbackQuery, state: FSMContext):
     class_uuid = call.data.replace("join|", "")
-    data = (await state.get_data())
-    logging.info(data)
-    resp = await httpx_client.post("class/student_join", params={"user_uuid": data["user_uuid"],
+    user_uuid = await resolveUser(call.message.chat.id, state)
+    resp = await httpx_client.post("class/student_join", params={"user_uuid": user_uuid,
                                                                  "class_uuid": class_uuid})
-    if resp.status_code == 409:
+    if resp.status_code == 404 and resp.text == "User not found":
+        # закэшированный uuid устарел — при следующем обновлении пользователь будет получен заново
+        await forgetUser(call.message.chat.id, state)
+        await call.message.answer("Произошла ошибка, попробуй ещё раз.")
+    elif resp.status_code == 409:
         await call.message.answer(f"Ты уже состоишь в этом классе")
     elif resp.status_code == 200:
         class_description = await getClassDescription(resp.json())
@@ -110,81 +128,73 @@ async def joinClass(call: CallbackQuery, state: FSMContext):
 @updateUserDecorator
 async def showMyGrades(msg: Message, state: FSMContext):
     try:
-        # Получаем оценки
-        marks_resp = await httpx_client.get("mark", params={"chat_id": msg.chat.id})
-        marks = marks_resp.json()
-
-        if not marks:
-            await msg.answer("У тебя пока нет оценок.")
-            return
+        params = {"chat_id": msg.chat.id}
+        # Сводка и оба графика запрашиваются одновременно, текст уходит, не дожидаясь графиков;
+        # каждый график — отдельным запросом, чтобы медленный или сломанный не потянул за собой другой
+        async with RequestGroup(httpx_client) as group:
+            dashboard_call = group.get("user/dashboard", params=params | {"charts": ""})
+            grades_chart_call = group.get(
+                "user/dashboard", params=params | {"charts": "subject_averages"}, timeout=CHART_TIMEOUT
+            )
+            absences_chart_call = group.get(
+                "user/dashboard", params=params | {"charts": "absences"}, timeout=CHART_TIMEOUT
+            )
 
-        absences = {
-            "Пропуск по уважительной причине",
-            "Пропуск без уважительной причины",
-            "Пропуск по болезни"
-        }
-
-        subject_data = {}
-        for mark in marks:
-            subject = mark["discipline"]
-            value = mark["mark"]
-            subject_data.setdefault(subject, []).append(value)
-
-        # Отдельные списки
-        academic_lines = []
-        absence_lines = []
-
-        for subject, values in subject_data.items():
-            if subject in absences:
-                absence_lines.append((subject, len(values)))
+            dashboard_resp = await dashboard_call
+            if not isOk(dashboard_resp):
+                await msg.answer("Произошла ошибка при получении данных.")
+                return
+
+            summary = dashboard_resp.json()["summary"]
+
+            if not summary["subjects"] and not summary["absences"]:
+                await msg.answer("У тебя пока нет оценок.")
+                return
+
+            # Отдельные списки
+            academic_lines = [(item["discipline"], item["average_mark"]) for item in summary["subjects"]]
+            absence_lines = [(item["discipline"], item["absences_count"]) for item in summary["absences"]]
+
+            # Сортировка для стабильности вывода
+            academic_lines.sort()
+            absence_order = [
+                "Пропуск без уважительной причины",
+                "Пропуск по болезни",
+                "Пропуск по уважительной причине"
+            ]
+            absence_lines.sort(key=lambda x: absence_order.index(x[0]) if x[0] in absence_order else 999)
+
+            # Формирование текста
+            message = "📚 <b>Твоя успеваемость:</b>\n\n"
+            for subject, avg in academic_lines:
+                message += f"• <b>{subject}</b>: средняя оценка {avg:.2f}\n"
+
+            if absence_lines:
+                message += "\n"
+                for subject, count in absence_lines:
+                    message += f"• <b>{subject}</b>: {count} пропуск(ов)\n"
+
+            await msg.answer(message, parse_mode="HTML")
+
+            # Графики уходят одним альбомом, прямо из памяти
+            album = []
+
+            # 📈 График обычных оценок
+            grades_chart = dashboardChart(await grades_chart_call, "subject_averages")
+            if grades_chart is not None:
+                album.append((grades_chart, "grades.png", "📊 Средние оценки по предметам"))
             else:
-                avg = sum(values) / len(values)
-                academic_lines.append((subject, avg))
-
-        # Сортировка для стабильности вывода
-        academic_lines.sort()
-        absence_order = [
-            "Пропуск без уважительной причины",
-            "Пропуск по болезни",
-            "Пропуск по уважительной причине"
-        ]
-        absence_lines.sort(key=lambda x: absence_order.index(x[0]) if x[0] in absence_order else 999)
-
-        # Формирование текста
-        message = "📚 <b>Твоя успеваемость:</b>\n\n"
-        for subject, avg in academic_lines:
-            message += f"• <b>{subject}</b>: средняя оценка {avg:.2f}\n"
-
-        if absence_lines:
-            message += "\n"
-            for subject, count in absence_lines:
-                message += f"• <b>{subject}</b>: {count} пропуск(ов)\n"
+                await msg.answer("Не удалось построить график оценок.")
 
-        await msg.answer(message, parse_mode="HTML")
+            # 📉 График пропусков
+            absences_chart = dashboardChart(await absences_chart_call, "absences")
+            if absences_chart is not None:
+                album.append((absences_chart, "absences.png", "📉 Пропуски по месяцам"))
+            else:
+                await msg.answer("Не удалось построить график пропусков.")
 
-        # 📈 График обычных оценок
-        chart_resp = await httpx_client.get("user/plot_subject_averages", params={"chat_id": msg.chat.id})
-        if chart_resp.status_code == 200:
-            buf = BytesIO(chart_resp.content)
-            buf.name = "grades.png"
-            await msg.answer_photo(
-                photo=BufferedInputFile(buf.read(), filename="grades.png"),
-                caption="📊 Средние оценки по предметам"
-            )
-        else:
-            await msg.answer("Не удалось построить график оценок.")
-
-        # 📉 График пропусков
-        absences_resp = await httpx_client.get("user/plot_absences", params={"chat_id": msg.chat.id})
-        if absences_resp.status_code == 200:
-            buf = BytesIO(absences_resp.content)
-            buf.name = "absences.png"
-            await msg.answer_photo(
-                photo=BufferedInputFile(buf.read(), filename="absences.png"),
-                caption="📉 Пропуски по месяцам"
-            )
-        else:
-            await msg.answer("Не удалось построить график пропусков.")
+            if album:
+                await answerChartAlbum(msg, album)
 
     except Exception as e:
         await msg.answer("Произошла ошибка при получении данных.")
@@ -196,58 +206,56 @@ async def showMyGrades(msg: Message, state: FSMContext):
 @router.message(Command("statistics"))
 @updateUserDecorator
 async def showStatistics(msg: Message, state: FSMContext):
-    # Текстовая статистика
-    stats_resp = await httpx_client.get("/teacher/statistics")
-    if stats_resp.status_code != 200:
-        await msg.answer("Произошла ошибка при получении статистики.")
-        return
-
-    stats = stats_resp.json()
-
-    if not stats:
-        await msg.answer("Пока что нет оценок.")
-        return
-
-    message = "📊 <b>Общая статистика по классам:</b>\n\n"
-    for item in stats:
-        school_resp = await httpx_client.get("/school", params={"uuid": item["school_uuid"]})
-        if school_resp.status_code == 200:
-            school_name = school_resp.json()["facility_name"]
-        else:
-            school_name = "Неизвестная школа"
+    async with RequestGroup(httpx_client) as group:
+        # Диаграмма строится, пока собирается текстовая статистика
+        distribution_call = group.get("/teacher/plot_avg_distribution", timeout=CHART_TIMEOUT)
+
+        # Текстовая статистика
+        stats_resp = await group.get("/teacher/statistics")
+        if not isOk(stats_resp):
+            await msg.answer("Произошла ошибка при получении статистики.")
+            return
+
+        stats = stats_resp.json()
+
+        if not stats:
+            await msg.answer("Пока что нет оценок.")
+            return
+
+        message = "📊 <b>Общая статистика по классам:</b>\n\n"
+        for item in stats:
+            message += f"<b>{item['school_name'] or 'Неизвестная школа'}</b>\n"
+            message += f"Класс: {item['class_name']} ({item['start_year']} г.)\n"
 
-        message += f"<b>{school_name}</b>\n"
-        message += f"Класс: {item['class_name']} ({item['start_year']} г.)\n"
+            if not item["disciplines"] and not item.get("absences"):
+                message += "   — нет оценок\n\n"
+                continue
 
-        if not item["disciplines"] and not item.get("absences"):
-            message += "   — нет оценок\n\n"
-            continue
+            # Дисциплины с оценками
+            for disc in item["disciplines"]:
+                message += f"   • {disc['discipline']}: ср. балл {disc['average_mark']} (всего {disc['marks_count']})\n"
 
-        # Дисциплины с оценками
-        for disc in item["disciplines"]:
-            message += f"   • {disc['discipline']}: ср. балл {disc['average_mark']} (всего {disc['marks_count']})\n"
+            # Пропуски — отдельно
+            if item.get("absences"):
+                message += "\n"
+                for ab in item["absences"]:
+                    message += f"   • {ab['discipline']}: {ab['absences_count']} пропуск(ов)\n"
 
-        # Пропуски — отдельно
-        if item.get("absences"):
             message += "\n"
-            for ab in item["absences"]:
-                message += f"   • {ab['discipline']}: {ab['absences_count']} пропуск(ов)\n"
-
-        message += "\n"
-
-    await msg.answer(message, parse_mode="HTML")
-
-    # Пироговые диаграммы
-    distribution_resp = await httpx_client.get("/teacher/plot_avg_distribution")
-    if distribution_resp.status_code == 200:
-        buf = BytesIO(distribution_resp.content)
-        buf.name = "distribution.png"
-        await msg.answer_photo(
-            photo=BufferedInputFile(buf.read(), filename="distribution.png"),
-            caption="📈 Распределение учеников по среднему баллу"
-        )
-    else:
-        await msg.answer("Не удалось получить график распределения по классам.")
+
+        await msg.answer(message, parse_mode="HTML")
+
+        # Пироговые диаграммы
+        distribution_resp = await distribution_call
+        if isOk(distribution_resp):
+            await answerChart(
+                msg,
+                distribution_resp.content,
+                "distribution.png",
+                caption="📈 Распределение учеников по среднему баллу"
+            )
+        else:
+            await msg.answer("Не удалось получить график распределения по классам.")
 
 
 
@@ -255,53 +263,62 @@ async def showStatistics(msg: Message, state: FSMContext):
 @updateUserDecorator
 async def show_prediction(msg: Message, state: FSMContext):
     try:
-        # 📊 Прогноз успеваемости
-        resp = await httpx_client.get("/user/predict_success", params={"chat_id": msg.chat.id})
-        if resp.status_code != 200:
-            await msg.answer("Не удалось получить прогноз. Попробуй позже.")
-            return
-
-        data = resp.json()
-
-        if data.get("status") == "unknown":
-            await msg.answer("У тебя пока нет оценок, поэтому прогноз невозможен.")
-        else:
-            emoji = {
-                "успешный": "🟢",
-                "неуспешный": "🔴"
-            }.get(data["status"], "❓")
-
-            text = (
-                f"<b>📈 Прогноз на полугодие</b>\n\n"
-                f"Прогноз: <b>{emoji} {data['status']}</b>\n"
-                f"Уверенность: <b>{int(data['confidence'] * 100)}%</b>\n"
-                f"Оценок всего: <b>{data['total_marks']}</b>\n"
-                f"Троек и ниже: <b>{data['bad_marks']}</b>\n\n"
-                f"{data['message']}"
+        params = {"chat_id": msg.chat.id}
+        # Прогноз и оба графика запрашиваются одновременно, каждый график — отдельным запросом
+        async with RequestGroup(httpx_client) as group:
+            dashboard_call = group.get("/user/dashboard", params=params | {"charts": ""})
+            progression_call = group.get(
+                "/user/dashboard", params=params | {"charts": "progression"}, timeout=CHART_TIMEOUT
+            )
+            accumulated_call = group.get(
+                "/user/dashboard", params=params | {"charts": "accumulated"}, timeout=CHART_TIMEOUT
             )
-            await msg.answer(text, parse_mode="HTML")
 
-        # 📈 Прогресс по неделям — график
-        plot_resp = await httpx_client.get("/user/plot_progression", params={"chat_id": msg.chat.id})
-        if plot_resp.status_code == 200:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp:
-                tmp.write(plot_resp.content)
-                tmp_path = tmp.name
+            # 📊 Прогноз успеваемости
+            resp = await dashboard_call
+            if not isOk(resp):
+                await msg.answer("Не удалось получить прогноз. Попробуй позже.")
+                return
 
-            await msg.answer_photo(photo=FSInputFile(tmp_path), caption="📊 График твоего прогресса по предметам")
-        else:
-            await msg.answer("Не удалось получить график прогресса.")
+            data = resp.json()["prediction"]
 
-        # 📈 Накопленный прогресс — график
-        accumulated_resp = await httpx_client.get("/user/plot_accumulated", params={"chat_id": msg.chat.id})
-        if accumulated_resp.status_code == 200:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp:
-                tmp.write(accumulated_resp.content)
-                tmp_path = tmp.name
+            if data.get("status") == "unknown":
+                await msg.answer("У тебя пока нет оценок, поэтому прогноз невозможен.")
+            else:
+                emoji = {
+                    "успешный": "🟢",
+                    "неуспешный": "🔴"
+                }.get(data["status"], "❓")
+
+                text = (
+                    f"<b>📈 Прогноз на полугодие</b>\n\n"
+                    f"Прогноз: <b>{emoji} {data['status']}</b>\n"
+                    f"Уверенность: <b>{int(data['confidence'] * 100)}%</b>\n"
+                    f"Оценок всего: <b>{data['total_marks']}</b>\n"
+                    f"Троек и ниже: <b>{data['bad_marks']}</b>\n\n"
+                    f"{data['message']}"
+                )
+                await msg.answer(text, parse_mode="HTML")
+
+            # Графики уходят одним альбомом, прямо из памяти
+            album = []
+
+            # 📈 Прогресс по неделям — график
+            progression_chart = dashboardChart(await progression_call, "progression")
+            if progression_chart is not None:
+                album.append((progression_chart, "progression.png", "📊 График твоего прогресса по предметам"))
+            else:
+                await msg.answer("Не удалось получить график прогресса.")
 
-            await msg.answer_photo(photo=FSInputFile(tmp_path), caption="📈 Накопленный средний балл по предметам")
-        else:
-            await msg.answer("Не удалось получить график накопленного прогресса.")
+            # 📈 Накопленный прогресс — график
+            accumulated_chart = dashboardChart(await accumulated_call, "accumulated")
+            if accumulated_chart is not None:
+                album.append((accumulated_chart, "accumulated.png", "📈 Накопленный средний балл по предметам"))
+            else:
+                await msg.answer("Не удалось получить график накопленного прогресса.")
+
+            if album:
+                await answerChartAlbum(msg, album)
 
     except Exception as e:
         await msg.answer("Произошла ошибка при получении данных.")
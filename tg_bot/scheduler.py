@@ -0,0 +1,108 @@
+"""
+Bounded handling of updates inside one bot process, an outer middleware of the dispatcher.
+
+- at most HANDLER_CONCURRENCY updates are handled at a time, the others wait for a slot;
+- the updates of one chat are handled one after another, in the order they came;
+- when UPDATE_QUEUE_LIMIT updates already wait, or CHAT_QUEUE_LIMIT updates of the same chat are queued or
+  running, a new update is not queued: the user gets a short "busy, try again" reply at once instead of a late one.
+
+So a burst of slow commands (/statistics renders and downloads a large chart) takes a bounded number of slots
+and a bounded queue, and cannot pile up without limit in front of everybody else's quick replies.
+The queue depth, time queued and time in the handler per command are kept in tg_bot.metrics.update_metrics.
+"""
+from __future__ import annotations
+
+import os
+import time
+import asyncio
+import logging
+import contextlib
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import Update
+
+from tg_bot.metrics import update_metrics, updateName
+
+HANDLER_CONCURRENCY = int(os.getenv("HANDLER_CONCURRENCY") or 16)
+UPDATE_QUEUE_LIMIT = int(os.getenv("UPDATE_QUEUE_LIMIT") or 100)
+CHAT_QUEUE_LIMIT = int(os.getenv("CHAT_QUEUE_LIMIT") or 3)
+
+BUSY_TEXT = "Бот сейчас перегружен, попробуйте ещё раз через минуту"
+
+
+class UpdateScheduler(BaseMiddleware):
+    def __init__(
+        self,
+        concurrency: int = HANDLER_CONCURRENCY,
+        queue_limit: int = UPDATE_QUEUE_LIMIT,
+        chat_queue_limit: int = CHAT_QUEUE_LIMIT
+    ):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.queue_limit = queue_limit
+        self.chat_queue_limit = chat_queue_limit
+        self.waiting = 0
+        self.running = 0
+        # chat_id -> [lock, updates of the chat queued or running], dropped when the chat has none left
+        self._chats: dict[int, list] = {}
+
+    def _publishDepth(self):
+        update_metrics.depth(self.waiting, self.running)
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any]
+    ) -> Any:
+        name = updateName(event)
+        chat = data.get("event_chat")
+        chat_id = chat.id if chat is not None else None
+
+        chat_entry = self._chats.get(chat_id)
+        if self.waiting >= self.queue_limit or (chat_entry and chat_entry[1] >= self.chat_queue_limit):
+            update_metrics.reject(name)
+            await self._answerBusy(event)
+            return None
+
+        if chat_id is not None:
+            chat_entry = self._chats.setdefault(chat_id, [asyncio.Lock(), 0])
+            chat_entry[1] += 1
+
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        started = None
+        self._publishDepth()
+        try:
+            # the chat first, so that a chat waiting for its previous update does not hold a slot
+            async with chat_entry[0] if chat_entry else contextlib.nullcontext():
+                async with self.semaphore:
+                    started = time.perf_counter()
+                    self.waiting -= 1
+                    self.running += 1
+                    self._publishDepth()
+                    try:
+                        return await handler(event, data)
+                    finally:
+                        self.running -= 1
+                        update_metrics.record(name, started - queued_at, time.perf_counter() - started)
+        finally:
+            if started is None:
+                self.waiting -= 1
+            self._publishDepth()
+
+            if chat_entry:
+                chat_entry[1] -= 1
+                if not chat_entry[1]:
+                    self._chats.pop(chat_id, None)
+
+    @staticmethod
+    async def _answerBusy(event: Update):
+        try:
+            if event.callback_query:
+                await event.callback_query.answer(BUSY_TEXT)
+            elif event.message:
+                await event.message.answer(BUSY_TEXT)
+        except TelegramAPIError as e:
+            logging.warning(f"Could not tell update {event.update_id} the bot is busy: {e}")
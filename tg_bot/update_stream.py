@@ -0,0 +1,389 @@
+"""
+Updates shared by N bot workers through Redis Streams.
+
+With UPDATE_QUEUE=redis the webhook appends every update to one of BOT_PARTITIONS streams chosen by chat id
+and answers Telegram at once. Workers (python tg_bot/worker.py, as many as needed) split the partitions
+between them with leases in Redis and read only the partitions they own. So the updates of one chat are
+handled by one worker, in order, while different chats run in parallel, at most WORKER_CONCURRENCY
+handlers at a time per worker.
+
+A lease lives WORKER_LEASE_MS unless its owner renews it. Every worker takes about partitions / live workers
+of them and hands extra ones over after finishing the batch in hand, so starting or stopping a worker
+rebalances. When a worker dies its leases expire and the others take its partitions over. The entries it had
+read but not acknowledged are claimed (XAUTOCLAIM) and handled before anything new, so nothing is lost.
+Delivery is at-least-once: an update is handled twice if a worker dies between handling and acknowledging it.
+
+A worker that only stalled (GC, a slow handler, a network blip) may wake up after its lease ran out. It
+checks the lease right before every entry (FENCE_ENTRY) and leaves the partition as soon as it is gone; the
+same check resets the entry's idle time, and a new owner claims only entries idle for a whole lease and reads
+nothing new before the old ones are done, so an update is not handled by two workers at once.
+
+Within a partition every chat is a task of its own, chained to the chat's previous one: a slow chat holds up
+only itself, while reading goes on until MAX_IN_FLIGHT entries of the partition are in hand.
+"""
+from __future__ import annotations
+
+import os
+import json
+import time
+import zlib
+import socket
+import asyncio
+import logging
+import functools
+from uuid import uuid4
+from collections import Counter
+from typing import Awaitable, Callable
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, ResponseError
+
+BOT_PARTITIONS = int(os.getenv("BOT_PARTITIONS") or 16)
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY") or 32)
+WORKER_LEASE_MS = int(os.getenv("WORKER_LEASE_MS") or 10_000)
+
+KEY_PREFIX = "bot:"
+GROUP = "workers"
+STREAM_MAXLEN = 100_000
+BATCH_SIZE = 64
+# entries of one partition read but not acknowledged yet, reading pauses beyond it
+MAX_IN_FLIGHT = 4 * BATCH_SIZE
+READ_BLOCK_MS = 1000
+# seconds to wait before retrying after redis was unreachable
+RETRY_DELAY = 1
+
+# compare-and-set on the lease value, so a worker never extends or frees a lease somebody else took over
+RENEW_LEASE = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_LEASE = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+# before every entry: handle it only while the lease is ours, and reset its idle time (XCLAIM to ourselves)
+# so that a new owner, which claims only entries idle for a whole lease, does not take it meanwhile
+FENCE_ENTRY = """
+if redis.call("get", KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call("xclaim", KEYS[2], ARGV[2], ARGV[1], 0, ARGV[3], "JUSTID")
+return 1
+"""
+
+# update kinds in the order Telegram documents them, the first present one tells the chat
+_UPDATE_KINDS = (
+    "message", "edited_message", "channel_post", "edited_channel_post", "business_message",
+    "callback_query", "my_chat_member", "chat_member", "chat_join_request", "message_reaction",
+)
+
+
+def chatIdOf(update: dict) -> int:
+    for kind in _UPDATE_KINDS:
+        event = update.get(kind)
+        if not event:
+            continue
+
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        if event.get("from"):
+            return event["from"]["id"]
+
+    # updates without a chat (inline queries, polls) all go to one partition
+    return 0
+
+
+def streamKey(partition: int, prefix: str = KEY_PREFIX) -> str:
+    return f"{prefix}updates:{partition}"
+
+
+async def publishUpdate(redis: Redis, update: dict, prefix: str = KEY_PREFIX, partitions: int = BOT_PARTITIONS) -> bytes:
+    return await redis.xadd(
+        streamKey(chatIdOf(update) % partitions, prefix),
+        {"update": json.dumps(update, ensure_ascii=False)},
+        maxlen=STREAM_MAXLEN,
+        approximate=True
+    )
+
+
+def _field(fields: dict, name: str):
+    return fields[name.encode()] if name.encode() in fields else fields[name]
+
+
+class UpdateWorker:
+    def __init__(
+        self,
+        redis: Redis,
+        handle: Callable[[dict], Awaitable],
+        *,
+        worker_id: str | None = None,
+        partitions: int = BOT_PARTITIONS,
+        concurrency: int = WORKER_CONCURRENCY,
+        lease_ms: int = WORKER_LEASE_MS,
+        prefix: str = KEY_PREFIX
+    ):
+        self.redis = redis
+        self.handle = handle
+        self.id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid4().hex[:6]}"
+        self.partitions = partitions
+        self.lease_ms = lease_ms
+        self.prefix = prefix
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.stats = Counter()
+
+        self._consumers: dict[int, asyncio.Task] = {}
+        self._draining: set[int] = set()
+        self._stopping = asyncio.Event()
+        self._renew = redis.register_script(RENEW_LEASE)
+        self._release = redis.register_script(RELEASE_LEASE)
+        self._fence = redis.register_script(FENCE_ENTRY)
+
+        self._chats: dict[int, asyncio.Task] = {}  # chat id -> the last task handling its updates
+        self._tasks: dict[int, set[asyncio.Task]] = {}  # partition -> its chat tasks
+        self._in_flight = Counter()  # partition -> entries read and not done yet
+        self._failed: set[int] = set()  # partitions a chat task lost redis on, recovered by the consumer
+        self._freed = asyncio.Event()
+
+    def _leaseKey(self, partition: int) -> str:
+        return f"{self.prefix}lease:{partition}"
+
+    @property
+    def _workersKey(self) -> str:
+        return f"{self.prefix}workers"
+
+    @property
+    def owned(self) -> list[int]:
+        return sorted(partition for partition in self._consumers if partition not in self._draining)
+
+    def stop(self):
+        """finishes the batches in hand, acknowledges them and frees the leases"""
+        self._stopping.set()
+
+    async def run(self):
+        for partition in range(self.partitions):
+            try:
+                await self.redis.xgroup_create(streamKey(partition, self.prefix), GROUP, id="0", mkstream=True)
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+        try:
+            while not self._stopping.is_set():
+                try:
+                    await self._rebalance()
+                except RedisError as e:
+                    # the leases run out if this lasts, the consumers are stopped on the next renewal then
+                    logging.warning(f"Worker {self.id} could not rebalance: {e!r}")
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.lease_ms / 3000)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            # the process is going away without a stop(): leave the leases to expire, like a crash would
+            for task in [*self._consumers.values(), *(task for tasks in self._tasks.values() for task in tasks)]:
+                task.cancel()
+            raise
+
+        await self._shutdown()
+
+    async def _rebalance(self):
+        now_ms = int(time.time() * 1000)
+        await self.redis.zadd(self._workersKey, {self.id: now_ms})
+        await self.redis.zremrangebyscore(self._workersKey, "-inf", now_ms - self.lease_ms)
+        share = -(-self.partitions // max(1, await self.redis.zcard(self._workersKey)))
+
+        for partition in list(self._consumers):
+            if not await self._renew(keys=[self._leaseKey(partition)], args=[self.id, self.lease_ms]):
+                logging.warning(f"Worker {self.id} lost the lease of partition {partition}")
+                self.stats["leases lost"] += 1
+                self._draining.discard(partition)
+                self._consumers.pop(partition).cancel()
+
+        # above the share: hand the partition over once the batch in hand is acknowledged
+        for partition in self.owned[share:]:
+            self._draining.add(partition)
+
+        if len(self.owned) < share:
+            # every worker starts looking from its own offset, so they rarely race for the same lease
+            offset = zlib.crc32(self.id.encode()) % self.partitions
+            for i in range(self.partitions):
+                partition = (offset + i) % self.partitions
+                if partition in self._consumers:
+                    continue
+
+                if await self.redis.set(self._leaseKey(partition), self.id, nx=True, px=self.lease_ms):
+                    self._consumers[partition] = asyncio.create_task(self._consume(partition))
+                    if len(self.owned) >= share:
+                        break
+
+            logging.info(f"Worker {self.id} owns partitions {self.owned}")
+
+    def _reading(self, partition: int) -> bool:
+        return partition not in self._draining and partition not in self._failed and not self._stopping.is_set()
+
+    async def _consume(self, partition: int):
+        stream = streamKey(partition, self.prefix)
+        # a consumer of the partition that lost its lease may still be winding down, its tasks stay its own
+        tasks = self._tasks[partition] = set()
+        self._in_flight[partition] = 0
+
+        try:
+            while partition not in self._draining and not self._stopping.is_set():
+                try:
+                    await self._recover(partition)
+                    while self._reading(partition):
+                        await self._room(partition)
+                        response = await self.redis.xreadgroup(
+                            GROUP, self.id, {stream: ">"}, count=BATCH_SIZE, block=READ_BLOCK_MS
+                        )
+                        if response:
+                            self._dispatch(partition, response[0][1])
+                except RedisError as e:
+                    # whatever was not acknowledged stays pending and is picked up by _recover() on the retry
+                    logging.warning(f"Worker {self.id} lost redis on partition {partition}: {e!r}")
+                    self.stats["redis errors"] += 1
+                    await asyncio.sleep(RETRY_DELAY)
+
+                # what is in hand is finished first, _recover() would claim it again otherwise
+                await self._settle(partition)
+                self._failed.discard(partition)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            if self._tasks.get(partition) is tasks:
+                del self._tasks[partition]
+            raise
+
+        # left on purpose (rebalance, stop or a lease found gone), everything handled is acknowledged
+        self._consumers.pop(partition, None)
+        self._draining.discard(partition)
+        if self._tasks.get(partition) is tasks:
+            del self._tasks[partition]
+            del self._in_flight[partition]
+        try:
+            await self._release(keys=[self._leaseKey(partition)], args=[self.id])
+        except RedisError as e:
+            logging.warning(f"Worker {self.id} could not release partition {partition}, it expires: {e!r}")
+
+    async def _recover(self, partition: int):
+        """
+        handles what the previous owner of the partition read but did not acknowledge, before anything new.
+        An owner that stalled may still be handling one of those entries (its fence reset the idle time), and a
+        later entry of the same chat must not be handled meanwhile: nothing is claimed before every pending
+        entry has been idle for a whole lease
+        """
+        stream = streamKey(partition, self.prefix)
+        while self._reading(partition):
+            await self._settle(partition)
+            pending = (await self.redis.xpending(stream, GROUP))["pending"]
+            if not pending:
+                return
+
+            entries = await self.redis.xpending_range(stream, GROUP, min="-", max="+", count=pending)
+            youngest = min((entry["time_since_delivered"] for entry in entries), default=self.lease_ms)
+            if youngest < self.lease_ms:
+                await asyncio.sleep((self.lease_ms - youngest) / 1000)
+                continue
+
+            start_id = "0-0"
+            while True:
+                next_id, entries, *_ = await self.redis.xautoclaim(
+                    stream, GROUP, self.id, min_idle_time=self.lease_ms, start_id=start_id, count=BATCH_SIZE
+                )
+
+                # entries trimmed from the stream meanwhile come back without fields (redis 6.2)
+                trimmed = [entry_id for entry_id, fields in entries if not fields]
+                if trimmed:
+                    await self.redis.xack(stream, GROUP, *trimmed)
+
+                entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+                if entries:
+                    self.stats["reclaimed"] += len(entries)
+                    self._dispatch(partition, entries)
+
+                if next_id in (b"0-0", "0-0"):
+                    break
+                start_id = next_id
+
+    async def _room(self, partition: int):
+        while self._in_flight[partition] >= MAX_IN_FLIGHT:
+            self._freed.clear()
+            await self._freed.wait()
+
+    async def _settle(self, partition: int):
+        tasks = self._tasks.get(partition)
+        if tasks:
+            await asyncio.wait(set(tasks))
+
+    def _dispatch(self, partition: int, entries: list):
+        by_chat: dict[int, list] = {}
+        for entry_id, fields in entries:
+            update = json.loads(_field(fields, "update"))
+            by_chat.setdefault(chatIdOf(update), []).append((entry_id, update))
+
+        # chats in parallel, the updates of one chat one after another, after those of it already in hand
+        for chat_id, updates in by_chat.items():
+            task = asyncio.create_task(self._handleChat(partition, updates, self._chats.get(chat_id)))
+            self._chats[chat_id] = task
+            self._tasks[partition].add(task)
+            self._in_flight[partition] += len(updates)
+            task.add_done_callback(functools.partial(self._chatDone, partition, chat_id, len(updates)))
+
+    def _chatDone(self, partition: int, chat_id: int, count: int, task: asyncio.Task):
+        if self._chats.get(chat_id) is task:
+            del self._chats[chat_id]
+        tasks = self._tasks.get(partition)
+        if tasks is not None and task in tasks:
+            tasks.discard(task)
+            self._in_flight[partition] -= count
+        self._freed.set()
+
+    async def _handleChat(self, partition: int, updates: list, previous: asyncio.Task | None) -> bool:
+        """handles the updates of one chat in order; False if it had to stop, the rest stays pending then"""
+        if previous is not None:
+            await asyncio.wait([previous])
+            if previous.cancelled() or not previous.result():
+                return False
+
+        stream = streamKey(partition, self.prefix)
+        try:
+            for entry_id, update in updates:
+                async with self.semaphore:
+                    if not await self._fence(keys=[self._leaseKey(partition), stream], args=[self.id, GROUP, entry_id]):
+                        if partition not in self._draining:
+                            logging.warning(f"Worker {self.id} lost the lease of partition {partition}, leaving it")
+                        self.stats["fenced"] += 1
+                        self._draining.add(partition)
+                        return False
+
+                    try:
+                        await self.handle(update)
+                        self.stats["handled"] += 1
+                    except Exception:
+                        # a failing handler is a bug, retrying the update would only block the chat
+                        logging.exception(f"Update {update.get('update_id')} failed")
+                        self.stats["failed"] += 1
+
+                await self.redis.xack(stream, GROUP, entry_id)
+        except RedisError as e:
+            logging.warning(f"Worker {self.id} lost redis on partition {partition}: {e!r}")
+            self.stats["redis errors"] += 1
+            self._failed.add(partition)
+            return False
+
+        return True
+
+    async def _shutdown(self):
+        self._draining.update(self._consumers)
+        if self._consumers:
+            done, pending = await asyncio.wait(set(self._consumers.values()), timeout=self.lease_ms / 1000)
+            for task in pending:
+                task.cancel()
+
+        await self.redis.zrem(self._workersKey, self.id)
+        logging.info(f"Worker {self.id} stopped: {dict(self.stats)}")
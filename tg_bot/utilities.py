@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import os
 import time
+import base64
 import logging
 import typing
 from typing import Callable
@@ -14,29 +15,162 @@ from aiogram.fsm.storage.base import StorageKey
 import httpx
 from httpx import AsyncClient, URL, USE_CLIENT_DEFAULT, Response
 
+from tg_bot.metrics import api_metrics
+
+
+# seconds per api call: plain json answers and PNG renders
+API_TIMEOUT = float(os.getenv("API_TIMEOUT") or 10)
+CHART_TIMEOUT = float(os.getenv("CHART_TIMEOUT") or 30)
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT") or 5)
+
+# connection pool to the api: handlers fan out several calls each, so keep enough connections warm
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS") or 100)
+API_MAX_KEEPALIVE = int(os.getenv("API_MAX_KEEPALIVE") or 20)
+API_KEEPALIVE_EXPIRY = float(os.getenv("API_KEEPALIVE_EXPIRY") or 60)
+
+# bodies longer than that, and anything that is not text, are logged as "<N bytes content-type>"
+LOG_BODY_LIMIT = 1000
+TEXT_CONTENT_TYPES = ("application/json", "application/problem+json", "text/")
+
+
+def http2Enabled() -> bool:
+    """API_HTTP2=1 asks for HTTP/2, which needs the optional h2 package and only applies over https"""
+    if os.getenv("API_HTTP2", "").lower() not in ("1", "true", "yes"):
+        return False
+
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logging.warning("API_HTTP2 is set but h2 is not installed (pip install httpx[http2]), using HTTP/1.1")
+        return False
+
+    return True
+
+
+def describeBody(response: Response) -> str:
+    content_type = response.headers.get("content-type", "")
+    size = len(response.content)
+
+    if size > LOG_BODY_LIMIT or not content_type.startswith(TEXT_CONTENT_TYPES):
+        return f"<{size} bytes {content_type or 'unknown type'}>"
+    return response.text
+
+
 class CustomAsyncClient(AsyncClient):
     def __init__(self, *args, **kwargs):
+        kwargs.setdefault("limits", httpx.Limits(
+            max_connections=API_MAX_CONNECTIONS,
+            max_keepalive_connections=API_MAX_KEEPALIVE,
+            keepalive_expiry=API_KEEPALIVE_EXPIRY
+        ))
+        kwargs.setdefault("timeout", httpx.Timeout(API_TIMEOUT, connect=API_CONNECT_TIMEOUT))
+        if "transport" not in kwargs:
+            kwargs.setdefault("http2", http2Enabled())
+
         super().__init__(*args, **kwargs)
 
     async def request(
         self,
+        method: str,
+        url: URL | str,
         *args,
         **kwargs
     ) -> Response:
         if not ("headers" in kwargs) or kwargs["headers"] is None:
             kwargs["headers"] = {}
 
-        response = await super().request(*args, **kwargs)
+        path = URL(url).path
+        started = time.perf_counter()
+        try:
+            response = await super().request(method, url, *args, **kwargs)
+        except httpx.TimeoutException:
+            api_metrics.record(method, path, time.perf_counter() - started, error="timeout")
+            raise
+        except httpx.HTTPError:
+            api_metrics.record(method, path, time.perf_counter() - started, error="transport")
+            raise
+        except asyncio.CancelledError:
+            # the caller gave up, e.g. the per-call timeout of a RequestGroup
+            api_metrics.record(method, path, time.perf_counter() - started, error="cancelled")
+            raise
+
+        api_metrics.record(method, path, time.perf_counter() - started, status_code=response.status_code)
 
-        if 200 <= response.status_code < 300:
-            logging.debug(f"status_code: {response.status_code} response.text: {response.text}")
-        elif 300 <= response.status_code < 400:
-            logging.debug(f"status_code: {response.status_code} response.text: {response.text}")
+        if 200 <= response.status_code < 400:
+            level = logging.DEBUG
         elif 400 <= response.status_code < 500:
-            logging.info(f"status_code: {response.status_code} response.text: {response.text}")
+            level = logging.INFO
         elif 500 <= response.status_code < 600:
-            logging.error(f"status_code: {response.status_code} response.text: {response.text}")
+            level = logging.ERROR
         else:
-            logging.warning(f"status_code: {response.status_code} response.text: {response.text}")
+            level = logging.WARNING
+
+        # the body is only looked at when the line is actually going to be written
+        if logging.getLogger().isEnabledFor(level):
+            logging.log(level, f"{method} {path} status_code: {response.status_code} response: {describeBody(response)}")
+
+        return response
+
+
+def isOk(response: Response | None) -> bool:
+    return response is not None and response.status_code == 200
+
+
+def dashboardChart(response: Response | None, chart: str) -> bytes | None:
+    """png of a chart asked from /user/dashboard, None if the call failed or the chart has no data"""
+    if not isOk(response):
+        return None
+
+    image = response.json()["charts"].get(chart)
+    return base64.b64decode(image["data"]) if image else None
+
+
+class RequestGroup:
+    """
+    Independent api calls of one handler, all started at once.
+
+    Every call has its own timeout, and a call that failed or timed out resolves to None instead of
+    breaking the others, so the handler answers with whatever it got. Awaiting the returned tasks in the
+    order the answers are sent lets the text go out while the charts are still rendering.
+    Calls still pending when the block is left (an early return or an exception) are cancelled.
+    """
+
+    def __init__(self, client: AsyncClient, timeout: float = API_TIMEOUT):
+        self.client = client
+        self.timeout = timeout
+        self._tasks: list[asyncio.Task] = []
+
+    def get(self, url: str, *, timeout: float | None = None, **kwargs) -> asyncio.Task[Response | None]:
+        return self.request("GET", url, timeout=timeout, **kwargs)
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        timeout: float | None = None,
+        **kwargs
+    ) -> asyncio.Task[Response | None]:
+        task = asyncio.create_task(self._call(method, url, timeout or self.timeout, **kwargs))
+        self._tasks.append(task)
+        return task
+
+    async def _call(self, method: str, url: str, timeout: float, **kwargs) -> Response | None:
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(self.client.request(method, url, timeout=timeout, **kwargs), timeout)
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            logging.warning(f"{method} {url} timed out after {time.perf_counter() - started:.1f}s")
+        except httpx.HTTPError as e:
+            logging.warning(f"{method} {url} failed: {e!r}")
+
+        return None
+
+    async def __aenter__(self) -> RequestGroup:
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        for task in self._tasks:
+            task.cancel()
 
-        return response
\ No newline at end of file
+        await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,52 @@
+import os
+import sys
+import signal
+import asyncio
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+sys.path.append(os.path.dirname(os.path.join(SCRIPT_DIR, "../", "logging_setup.py")))
+
+import logging_setup
+logging_setup.init("logs/tg_bot_worker.log")
+import logging
+
+
+async def main():
+    from aiogram.types import Update
+
+    from tg_bot.config import bot, redis, apiLifespan
+    from tg_bot.metrics import dumpMetrics, dumpMetricsPeriodically
+    from tg_bot.dispatcher import setupDispatcher
+    from tg_bot.update_stream import UpdateWorker
+
+    dp = setupDispatcher()
+
+    async def handle(data: dict):
+        await dp.feed_update(bot, Update.model_validate(data, context={"bot": bot}))
+
+    worker = UpdateWorker(redis, handle)
+
+    # SIGTERM (docker stop) дожидается начатых обновлений и отдаёт разделы остальным воркерам
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+    if hasattr(signal, "SIGUSR1"):
+        loop.add_signal_handler(signal.SIGUSR1, dumpMetrics)
+
+    metrics_interval = float(os.getenv("METRICS_DUMP_INTERVAL") or 300)
+    metrics_task = asyncio.create_task(dumpMetricsPeriodically(metrics_interval)) if metrics_interval > 0 else None
+
+    logging.info(f"Bot worker {worker.id} started")
+    try:
+        async with apiLifespan():
+            await worker.run()
+    finally:
+        if metrics_task is not None:
+            metrics_task.cancel()
+        await bot.session.close()
+        dumpMetrics()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())